@@ -8,6 +8,19 @@ import os
 import math
 import sys
 import platform
+import time
+
+from channeltinker.ctraster import (
+    circle_spans,
+    square_spans,
+)
+
+ENABLE_NUMPY = False
+try:
+    import numpy  # noqa: F401
+    ENABLE_NUMPY = True
+except ImportError:
+    pass
 
 name_fmt0 = "{}-{}-vs-{}.png"
 name_fmt1 = "diffimage {}.png"
@@ -66,6 +79,112 @@ class ChannelTinkerProgressInterface:
                                   " implementation must implement"
                                   " show_message.")
 
+    def is_canceled(self):
+        """
+        Check whether the user asked to stop (optional: the default
+        implementation always returns False).
+        """
+        return False
+
+
+class OperationCanceled(Exception):
+    """An operation stopped since ThrottledProgress.check found that
+    the user canceled it.
+    """
+    pass
+
+
+_clock = getattr(time, 'monotonic', time.time)
+# ^ Python 2 (such as GIMP 2 plug-ins) only has time.time.
+
+
+class ThrottledProgress(ChannelTinkerProgressInterface):
+    """Pass progress on to another ChannelTinkerProgressInterface only
+    when it has changed enough to be worth showing.
+
+    Functions in channeltinker report progress through this (See
+    throttled), so they can call progress_update or check as often as
+    convenient (such as once per row) without the cost of redrawing a
+    progress bar each time.
+
+    Args:
+        ctpi (ChannelTinkerProgressInterface): The progress display.
+        min_interval (float, optional): Pass on progress (or check for
+            cancellation) at most once per this many seconds.
+        min_step (float, optional): Only pass on progress once it has
+            increased by at least this much (0.01 is 1 percent).
+    """
+    def __init__(self, ctpi, min_interval=0.1, min_step=0.01):
+        self.ctpi = ctpi
+        self.min_interval = min_interval
+        self.min_step = min_step
+        self._factor = None
+        self._time = None
+        self._checked_time = None
+        self._canceled = False
+
+    def progress_update(self, factor):
+        now = _clock()
+        if self._factor is not None:
+            if self._factor <= factor < 1.0:
+                if factor - self._factor < self.min_step:
+                    return
+                if now - self._time < self.min_interval:
+                    return
+            elif factor == self._factor:
+                return
+            # ^ Always pass on going back (such as to restart) or
+            #   reaching the end.
+        self._factor = factor
+        self._time = now
+        self.ctpi.progress_update(factor)
+
+    def set_status(self, msg):
+        self.ctpi.set_status(msg)
+
+    def show_message(self, msg):
+        self.ctpi.show_message(msg)
+
+    def is_canceled(self):
+        if self._canceled:
+            return True
+        now = _clock()
+        if ((self._checked_time is not None)
+                and (now - self._checked_time < self.min_interval)):
+            return False
+        self._checked_time = now
+        self._canceled = bool(self.ctpi.is_canceled())
+        return self._canceled
+
+    def check(self, factor):
+        """Update progress then stop if the user canceled.
+
+        Args:
+            factor (float): Progress from 0.0 to 1.0.
+
+        Raises:
+            OperationCanceled: If is_canceled is True.
+        """
+        self.progress_update(factor)
+        if self.is_canceled():
+            raise OperationCanceled("The operation was canceled.")
+
+
+def throttled(ctpi):
+    """Get a ThrottledProgress for ctpi.
+
+    Args:
+        ctpi (ChannelTinkerProgressInterface): Any implementation, or
+            None.
+
+    Returns:
+        ThrottledProgress: ctpi itself if it already is one, otherwise
+            a ThrottledProgress wrapping it (or None if ctpi is None).
+    """
+    if (ctpi is None) or isinstance(ctpi, ThrottledProgress):
+        return ctpi
+    return ThrottledProgress(ctpi)
+
 
 # (The @property decorator is always available in Python 3, since every
 # class descends from Object but must be explicit for compatibility
@@ -75,6 +194,18 @@ class ChannelTinkerInterface(object):
     If you do not provide a PIL image to various functions in this
     library, you can implement ChannelTinkerInterface and provide an
     object based on your own implementation instead.
+
+    If the backend can access many pixels at once, also implement these
+    optional methods (functions in this library call them when present,
+    otherwise they call getpixel and putpixel for each pixel):
+    - getregion(box): Get the pixels in box (left, top, right, bottom)
+      (where right and bottom are exclusive like a PIL crop box) as a
+      bytearray of 8-bit channels in the order of getbands, row by row.
+    - putregion(box, data): Replace the pixels in box with data in the
+      format returned by getregion.
+    - getbuffer(): Get a writable memoryview of the whole image in the
+      format returned by getregion without copying it, or None if the
+      backend has no such memory.
     """
 
     @property
@@ -108,6 +239,325 @@ class ChannelTinkerInterface(object):
                                   " getbands.")
 
 
+def has_regions(cti):
+    """Check whether an image implements getregion and putregion.
+
+    Args:
+        cti (Union(Image,ChannelTinkerInterface)): Any image.
+    """
+    return (callable(getattr(cti, 'getregion', None))
+            and callable(getattr(cti, 'putregion', None)))
+
+
+def get_region(cti, box):
+    """Get the pixels in a rectangle of any image as bytes.
+
+    Args:
+        cti (Union(Image,ChannelTinkerInterface)): Any image with 8-bit
+            channels.
+        box (tuple[int]): (left, top, right, bottom) where right and
+            bottom are exclusive.
+
+    Returns:
+        bytearray: See getregion in ChannelTinkerInterface.
+    """
+    if callable(getattr(cti, 'getregion', None)):
+        return cti.getregion(box)
+    left, top, right, bottom = box
+    data = bytearray()
+    for y in range(top, bottom):
+        for x in range(left, right):
+            pixel = cti.getpixel((x, y))
+            if isinstance(pixel, int):
+                data.append(pixel)
+            else:
+                data.extend(pixel)
+    return data
+
+
+def put_region(cti, box, data):
+    """Replace the pixels in a rectangle of any image.
+
+    Args:
+        cti (Union(Image,ChannelTinkerInterface)): Any image with 8-bit
+            channels.
+        box (tuple[int]): See get_region.
+        data (bytes): See getregion in ChannelTinkerInterface.
+    """
+    if callable(getattr(cti, 'putregion', None)):
+        cti.putregion(box, data)
+        return
+    left, top, right, bottom = box
+    p_len = len(cti.getbands())
+    data = bytearray(data)
+    i = 0
+    for y in range(top, bottom):
+        for x in range(left, right):
+            cti.putpixel((x, y), tuple(data[i:i+p_len]))
+            i += p_len
+
+
+class BufferCTI(ChannelTinkerInterface):
+    """An image with 8-bit channels in memory.
+
+    Per-pixel access is done without calling the source, so wrapping
+    an image with a slow getpixel (such as a GIMP drawable) in this
+    speeds up per-pixel algorithms (See from_cti and flush).
+
+    Args:
+        size (tuple[int]): (width, height)
+        bands (tuple[str]): See getbands in ChannelTinkerInterface.
+        data (bytearray, optional): Pixels in the format of getregion
+            (zeros by default).
+        source (ChannelTinkerInterface, optional): The image that flush
+            writes back to.
+    """
+    in_memory = True
+    # ^ Per-pixel access is already fast (See _buffered).
+
+    def __init__(self, size, bands, data=None, source=None):
+        self._size = tuple(size)
+        self._bands = tuple(bands)
+        self._p_len = len(self._bands)
+        row_len = self._size[0] * self._p_len
+        if data is None:
+            data = bytearray(row_len * self._size[1])
+        elif len(data) != row_len * self._size[1]:
+            raise ValueError("Expected {} bytes for {} {} but got {}"
+                             "".format(row_len * self._size[1], size,
+                                       bands, len(data)))
+        self._data = bytearray(data)
+        self.source = source
+        self.dirty = False
+
+    @classmethod
+    def from_cti(cls, cti):
+        """Copy a whole image into memory.
+
+        Args:
+            cti (Union(Image,ChannelTinkerInterface)): Any image with
+                8-bit channels. It becomes the source (See flush).
+        """
+        w, h = cti.size
+        return cls((w, h), cti.getbands(),
+                   data=get_region(cti, (0, 0, w, h)), source=cti)
+
+    @property
+    def size(self):
+        return self._size
+
+    def getbands(self):
+        return self._bands
+
+    def getpixel(self, pos):
+        x, y = pos
+        if (x < 0) or (y < 0) or (x >= self._size[0]) or (y >= self._size[1]):
+            raise IndexError("{} is outside of {}".format(pos, self._size))
+        i = (y * self._size[0] + x) * self._p_len
+        return tuple(self._data[i:i+self._p_len])
+
+    def putpixel(self, pos, color):
+        x, y = pos
+        if (x < 0) or (y < 0) or (x >= self._size[0]) or (y >= self._size[1]):
+            raise IndexError("{} is outside of {}".format(pos, self._size))
+        if isinstance(color, int):
+            color = (color,)
+        i = (y * self._size[0] + x) * self._p_len
+        self._data[i:i+self._p_len] = bytearray(color[:self._p_len])
+        self.dirty = True
+
+    def getregion(self, box):
+        left, top, right, bottom = box
+        row_len = self._size[0] * self._p_len
+        data = bytearray()
+        for y in range(top, bottom):
+            start = y * row_len + left * self._p_len
+            data += self._data[start:start+(right-left)*self._p_len]
+        return data
+
+    def putregion(self, box, data):
+        left, top, right, bottom = box
+        row_len = self._size[0] * self._p_len
+        box_row_len = (right - left) * self._p_len
+        for y in range(top, bottom):
+            start = y * row_len + left * self._p_len
+            src = (y - top) * box_row_len
+            self._data[start:start+box_row_len] = data[src:src+box_row_len]
+        self.dirty = True
+
+    def getbuffer(self):
+        self.dirty = True
+        # ^ The caller may write to it.
+        return memoryview(self._data)
+
+    def flush(self):
+        """Write the pixels back to the source if any changed.
+
+        Returns:
+            tuple[int]: The box that was written (See get_region), or
+                None if nothing was written.
+        """
+        if (self.source is None) or (not self.dirty):
+            return None
+        w, h = self._size
+        put_region(self.source, (0, 0, w, h), self._data)
+        self.dirty = False
+        return (0, 0, w, h)
+
+
+class TileBufferCTI(ChannelTinkerInterface):
+    """Buffer the tiles of an image that has slow pixel access.
+
+    Each tile is read from the source (at once if the source has a
+    getregion method) the first time a pixel in it is used, and flush
+    only writes back the tiles that changed. Wrap a GIMP drawable (See
+    GimpCTI in channeltinkergimp.py) in this, run any channeltinker
+    functions on it, then call flush.
+
+    Args:
+        source (ChannelTinkerInterface): Any image with 8-bit channels.
+        tile_size (int, optional): The width and height of tiles (64 is
+            the tile size of GIMP).
+    """
+    in_memory = True
+
+    def __init__(self, source, tile_size=64):
+        self.source = source
+        self.tile_size = tile_size
+        self._size = tuple(source.size)
+        self._bands = tuple(source.getbands())
+        self._p_len = len(self._bands)
+        self._tiles = {}
+        # ^ {(tx, ty): bytearray} of tiles read so far
+        self.dirty = set()
+        # ^ (tx, ty) of tiles that changed since the last flush
+
+    @property
+    def size(self):
+        return self._size
+
+    def getbands(self):
+        return self._bands
+
+    def _tile_box(self, tx, ty):
+        left = tx * self.tile_size
+        top = ty * self.tile_size
+        return (left, top, min(left + self.tile_size, self._size[0]),
+                min(top + self.tile_size, self._size[1]))
+
+    def _tile(self, tx, ty):
+        tile = self._tiles.get((tx, ty))
+        if tile is None:
+            tile = bytearray(get_region(self.source, self._tile_box(tx, ty)))
+            self._tiles[(tx, ty)] = tile
+        return tile
+
+    def _locate(self, pos):
+        # Get the tile key and index of a pixel.
+        x, y = pos
+        if (x < 0) or (y < 0) or (x >= self._size[0]) or (y >= self._size[1]):
+            raise IndexError("{} is outside of {}".format(pos, self._size))
+        tx = x // self.tile_size
+        ty = y // self.tile_size
+        left, top, right, bottom = self._tile_box(tx, ty)
+        return (tx, ty), ((y - top) * (right - left) + x - left) * self._p_len
+
+    def getpixel(self, pos):
+        key, i = self._locate(pos)
+        return tuple(self._tile(*key)[i:i+self._p_len])
+
+    def putpixel(self, pos, color):
+        key, i = self._locate(pos)
+        if isinstance(color, int):
+            color = (color,)
+        tile = self._tile(*key)
+        color = bytearray(color[:self._p_len])
+        if tile[i:i+self._p_len] != color:
+            tile[i:i+self._p_len] = color
+            self.dirty.add(key)
+
+    def _spans(self, box):
+        # Generate (key, tile offset, box offset, byte count) for each
+        # row of each tile in box.
+        left, top, right, bottom = box
+        ts = self.tile_size
+        box_row_len = (right - left) * self._p_len
+        for ty in range(top // ts, (bottom - 1) // ts + 1):
+            for tx in range(left // ts, (right - 1) // ts + 1):
+                t_left, t_top, t_right, t_bottom = self._tile_box(tx, ty)
+                x0 = max(left, t_left)
+                x1 = min(right, t_right)
+                count = (x1 - x0) * self._p_len
+                for y in range(max(top, t_top), min(bottom, t_bottom)):
+                    t_i = ((y - t_top) * (t_right - t_left)
+                           + x0 - t_left) * self._p_len
+                    b_i = (y - top) * box_row_len + (x0 - left) * self._p_len
+                    yield (tx, ty), t_i, b_i, count
+
+    def getregion(self, box):
+        left, top, right, bottom = box
+        data = bytearray((right - left) * (bottom - top) * self._p_len)
+        if len(data) == 0:
+            return data
+        for key, t_i, b_i, count in self._spans(box):
+            data[b_i:b_i+count] = self._tile(*key)[t_i:t_i+count]
+        return data
+
+    def putregion(self, box, data):
+        left, top, right, bottom = box
+        if (right <= left) or (bottom <= top):
+            return
+        data = memoryview(bytearray(data))
+        for key, t_i, b_i, count in self._spans(box):
+            tile = self._tile(*key)
+            if tile[t_i:t_i+count] != data[b_i:b_i+count]:
+                tile[t_i:t_i+count] = data[b_i:b_i+count]
+                self.dirty.add(key)
+
+    def getbuffer(self):
+        return None
+        # ^ Tiles are separate, so there is no whole image in memory.
+
+    def flush(self):
+        """Write tiles that changed back to the source.
+
+        Consecutive dirty tiles in a row of tiles are written together.
+
+        Returns:
+            tuple[int]: The box around every tile that was written (See
+                get_region), such as to redraw that part of the image,
+                or None if nothing was written.
+        """
+        if not self.dirty:
+            return None
+        rows = {}
+        for tx, ty in self.dirty:
+            rows.setdefault(ty, []).append(tx)
+        for ty, txs in rows.items():
+            txs.sort()
+            start = 0
+            for i in range(1, len(txs) + 1):
+                if (i < len(txs)) and (txs[i] == txs[i-1] + 1):
+                    continue
+                first = self._tile_box(txs[start], ty)
+                last = self._tile_box(txs[i-1], ty)
+                box = (first[0], first[1], last[2], last[3])
+                put_region(self.source, box, self.getregion(box))
+                start = i
+        boxes = [self._tile_box(tx, ty) for tx, ty in self.dirty]
+        self.dirty = set()
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def _buffered(cti):
+    # Get a BufferCTI copy of cti if it has region methods (otherwise
+    # cti). Call flush on the result if it is not cti.
+    if getattr(cti, 'in_memory', False) or not has_regions(cti):
+        return cti
+    return BufferCTI.from_cti(cti)
+
+
 _echo_fn = None
 
 
@@ -202,7 +652,7 @@ def convert_depth(color, channel_count, c_max=1.0):
             new_color = []
             for v in color:
                 new_color.append(convert_depth(v, 1, c_max=c_max)[0])
-            color = tuple(color)
+            color = tuple(new_color)
         elif not isinstance(color, tuple):
             color = tuple(color)
     elif isinstance(color, int):
@@ -485,11 +935,65 @@ def diff_color(base_color, head_color, enable_convert=False,
     return diff / float(len(base_indices) * c_max)
 
 
+def get_diff_colors(nochange_color, c_max=255):
+    """Choose the colors diff_images uses for pixels outside of an image.
+
+    Args:
+        nochange_color (tuple): See diff_images.
+        c_max (Union(float, int), optional): See diff_images.
+
+    Returns:
+        tuple(tuple): (add_color, del_color) where add_color is for the
+            canvas outside of base and del_color is for the part of base
+            outside of head (Each differs from nochange_color).
+    """
+    add_color = (0, c_max, 0, c_max)  # green (expanded part if any)
+    del_color = (c_max, 0, 0, c_max)  # red (cropped part if any)
+    pix_len = len(nochange_color)
+    if isinstance(nochange_color, str):
+        raise ValueError("You provided a string for nochange_color but"
+                         " a tuple or tuple-like number collection is"
+                         " required.")
+    if not isinstance(nochange_color, tuple):
+        nochange_color = tuple(nochange_color)
+    for c in nochange_color:
+        if not isinstance(c, type(c_max)):
+            raise ValueError("The type of c_max and nochange_color"
+                             " members does not match. You must set"
+                             " both to float or to int, etc.")
+    if pix_len != 4:
+        if pix_len == 1:
+            add_color = tuple([c_max])
+            del_color = tuple([c_max])
+        elif pix_len <= 4:
+            add_color = convert_depth(add_color, pix_len, c_max=c_max)
+            del_color = convert_depth(del_color, pix_len, c_max=c_max)
+
+    if add_color == nochange_color:
+        # choose an unused color (cast value to type of c_max):
+        tmp_color = (0, type(c_max)(c_max / 2), 0, c_max)  # dark green
+        if tmp_color == nochange_color:
+            tmp_color = (c_max, c_max, 0, 0, c_max)  # yellow
+            add_color = convert_depth(tmp_color, pix_len, c_max=c_max)
+        else:
+            add_color = convert_depth(tmp_color, pix_len, c_max=c_max)
+    if del_color == nochange_color:
+        # choose an unused color (cast value to type of c_max)
+        tmp_color = (type(c_max)(c_max / 2), 0, 0, c_max)  # dark red
+        if tmp_color == nochange_color:
+            tmp_color = (c_max, 0, c_max, 0, c_max)  # magenta
+            del_color = convert_depth(tmp_color, pix_len, c_max=c_max)
+        else:
+            del_color = convert_depth(tmp_color, pix_len, c_max=c_max)
+    return add_color, del_color
+
+
 def diff_images(base, head, diff_size, diff=None,
                 nochange_color=(0, 0, 0, 255),
                 enable_variance=True, c_max=255, max_count=4,
                 base_indices=(0, 1, 2, 3), head_indices=(0, 1, 2, 3),
-                clear_in_stats=False):
+                clear_in_stats=False, engine=None, max_mean_diff=None,
+                pyramid_threshold=None, pyramid_min_size=16, ctpi=None):
     """Compare two images, and return a dict with information.
 
     If diff is not None, it must also be an image, and it will be
@@ -530,62 +1034,114 @@ def diff_images(base, head, diff_size, diff=None,
             if that is None, then match the base channel count.
         clear_in_stats (bool, optional): Whether to use transparent
             pixels when calculating statistics such as diff_mean.
+        engine (str, optional): "numpy" to compare whole image arrays at
+            once, or "python" to compare one pixel at a time (slow, but
+            works without numpy). Defaults to "numpy" if numpy is
+            installed and c_max is an int, otherwise "python". Both
+            produce the same results.
+        max_mean_diff (float, optional): If diff is None, stop comparing
+            as soon as mean_diff can no longer be max_mean_diff or less
+            (such as when ranking images and this one can't beat the
+            worst one kept so far). Then the results have 'pruned'
+            True and 'mean_diff_min' (the lowest mean_diff possible)
+            instead of 'mean_diff', and 'same' only reflects the pixels
+            compared so far.
+        pyramid_threshold (float, optional): Compare downscaled copies
+            first (coarse to fine, each level half the size of the next
+            using the reduce method of PIL images), and stop as soon as
+            the mean_diff of a level is more than this. Then 'mean_diff'
+            is from that level (an estimate) and 'same' is False.
+            Results always have 'pyramid_level' (0 is full resolution,
+            1 is half size, etc.), the level that decided the result.
+            If diff is not None, full resolution is always compared
+            too (so the diff image is complete and mean_diff is exact),
+            but 'pyramid_level' still says which level exceeded the
+            threshold. Images without a reduce method are only compared
+            at full resolution.
+        pyramid_min_size (int, optional): Don't make levels where the
+            width or height of either image would be smaller than this.
+        ctpi (ChannelTinkerProgressInterface, optional): Report progress
+            to this (through ThrottledProgress).
+
+    Raises:
+        OperationCanceled: If ctpi.is_canceled() becomes True.
     """
-    base = base.convert(mode='RGBA')
-    head = head.convert(mode='RGBA')
+    if hasattr(base, 'convert'):
+        base = base.convert(mode='RGBA')
+    if hasattr(head, 'convert'):
+        head = head.convert(mode='RGBA')
     # Convert indexed images so getpixel doesn't return an index
-    # (diff_color expects a tuple).
+    # (diff_color expects a tuple). A ChannelTinkerInterface must
+    # already provide tuples.
+    if pyramid_threshold is not None:
+        return _diff_pyramid(
+            base, head, diff_size, pyramid_threshold, pyramid_min_size,
+            diff=diff, nochange_color=nochange_color,
+            enable_variance=enable_variance, c_max=c_max,
+            max_count=max_count, base_indices=base_indices,
+            head_indices=head_indices, clear_in_stats=clear_in_stats,
+            engine=engine, max_mean_diff=max_mean_diff, ctpi=ctpi,
+        )
     results = {}
     results['same'] = None
     results['base'] = {}
     results['base']['size'] = base.size
     results['base']['ratio'] = float(base.size[0]) / float(base.size[1])
     results['head'] = {}
-    results['head']['size'] = base.size
+    results['head']['size'] = head.size
     results['head']['ratio'] = float(head.size[0]) / float(head.size[1])
     total_diff = 0
     total_count = 0
 
     w, h = diff_size
-    add_color = (0, c_max, 0, c_max)  # green (expanded part if any)
-    del_color = (c_max, 0, 0, c_max)  # red (cropped part if any)
+    add_color, del_color = get_diff_colors(nochange_color, c_max=c_max)
+    ctpi = throttled(ctpi)
+    progress_cb = None
+    if ctpi is not None:
+        progress_cb = ctpi.check
+    nochange_color = tuple(nochange_color)
     pix_len = len(nochange_color)
-    if isinstance(nochange_color, str):
-        raise ValueError("You provided a string for nochange_color but"
-                         " a tuple or tuple-like number collection is"
-                         " required.")
-    if not isinstance(nochange_color, tuple):
-        nochange_color = tuple(nochange_color)
-    for c in nochange_color:
-        if not isinstance(c, type(c_max)):
-            raise ValueError("The type of c_max and nochange_color"
-                             " members does not match. You must set"
-                             " both to float or to int, etc.")
-    if pix_len != 4:
-        if pix_len == 1:
-            add_color = tuple([c_max])
-            del_color = tuple([c_max])
-        elif pix_len <= 4:
-            add_color = convert_depth(add_color, pix_len, c_max=c_max)
-            del_color = convert_depth(del_color, pix_len, c_max=c_max)
 
-    if add_color == nochange_color:
-        # choose an unused color (cast value to type of c_max):
-        tmp_color = (0, type(c_max)(c_max / 2), 0, c_max)  # dark green
-        if tmp_color == nochange_color:
-            tmp_color = (c_max, c_max, 0, 0, c_max)  # yellow
-            add_color = convert_depth(tmp_color, pix_len, c_max=c_max)
-        else:
-            add_color = convert_depth(tmp_color, pix_len, c_max=c_max)
-    if del_color == nochange_color:
-        # choose an unused color (cast value to type of c_max)
-        tmp_color = (type(c_max)(c_max / 2), 0, 0, c_max)  # dark red
-        if tmp_color == nochange_color:
-            tmp_color = (c_max, 0, c_max, 0, c_max)  # magenta
-            del_color = convert_depth(tmp_color, pix_len, c_max=c_max)
+    if engine is None:
+        engine = "python"
+        if ENABLE_NUMPY and isinstance(c_max, int):
+            engine = "numpy"
+    if engine == "numpy":
+        if not isinstance(c_max, int):
+            raise ValueError("The numpy engine requires an int c_max.")
+        from channeltinker.ctnumpy import (
+            diff_arrays,
+            put_changed,
+            read_pixels,
+        )
+        stats = diff_arrays(read_pixels(base), read_pixels(head),
+                            diff_size, nochange_color, add_color, del_color,
+                            c_max=c_max, max_count=max_count,
+                            clear_in_stats=clear_in_stats,
+                            need_colors=(diff is not None),
+                            max_mean_diff=max_mean_diff,
+                            progress_cb=progress_cb)
+        results['same'] = stats['same']
+        if diff is not None:
+            put_changed(diff, stats['colors'], stats['changed'])
+        if stats.get('pruned'):
+            results['pruned'] = True
+            results['mean_diff_min'] = stats['mean_diff_min']
+        elif stats['total_count'] <= 0:
+            results['error'] = "WARNING: There were no pixels."
         else:
-            del_color = convert_depth(tmp_color, pix_len, c_max=c_max)
-
+            results['mean_diff'] = (float(stats['total_diff'])
+                                    / float(stats['total_count']))
+        return results
+    elif engine != "python":
+        raise ValueError("engine must be \"numpy\", \"python\" or None"
+                         " but got {}".format(repr(engine)))
+
+    base = _buffered(base)
+    head = _buffered(head)
+    target = diff
+    if diff is not None:
+        diff = _buffered(diff)
     for y in range(h):
         for x in range(w):
             pos = (x, y)
@@ -644,6 +1200,19 @@ def diff_images(base, head, diff_size, diff=None,
             else:
                 if results['same'] is None:
                     results['same'] = True
+        if ctpi is not None:
+            ctpi.check(float(y + 1) / float(h))
+        if (max_mean_diff is not None) and (diff is None) and (y + 1 < h):
+            remaining = (h - y - 1) * w
+            if total_count + remaining > 0:
+                mean_diff_min = (float(total_diff)
+                                 / float(total_count + remaining))
+                if mean_diff_min > max_mean_diff:
+                    results['pruned'] = True
+                    results['mean_diff_min'] = mean_diff_min
+                    return results
+    if diff is not target:
+        diff.flush()
     if total_count <= 0:
         results['error'] = "WARNING: There were no pixels."
     else:
@@ -651,6 +1220,58 @@ def diff_images(base, head, diff_size, diff=None,
     return results
 
 
+def _diff_pyramid(base, head, diff_size, threshold, min_size, diff=None,
+                  **kwargs):
+    """Compare images coarse to fine (See pyramid_threshold in
+    diff_images).
+
+    Args:
+        kwargs: Options for diff_images (other than the pyramid).
+    """
+    levels = []
+    # ^ (base, head, diff_size) from half size to coarsest
+    if hasattr(base, 'reduce') and hasattr(head, 'reduce'):
+        this_base = base
+        this_head = head
+        this_size = diff_size
+        while min(this_base.size + this_head.size) // 2 >= min_size:
+            this_base = this_base.reduce(2)
+            this_head = this_head.reduce(2)
+            this_size = ((this_size[0] + 1) // 2, (this_size[1] + 1) // 2)
+            levels.append((this_base, this_head, this_size))
+    coarse_kwargs = kwargs.copy()
+    coarse_kwargs['max_mean_diff'] = None
+    # ^ A bound on a coarse level isn't a bound on full resolution.
+    coarse_kwargs['ctpi'] = None
+    # ^ Only report full resolution, since coarse levels are quick.
+    decided_level = 0
+    coarse = None
+    for level in range(len(levels), 0, -1):
+        this_base, this_head, this_size = levels[level - 1]
+        coarse = diff_images(this_base, this_head, this_size,
+                             **coarse_kwargs)
+        mean_diff = coarse.get('mean_diff')
+        if (mean_diff is not None) and (mean_diff > threshold):
+            decided_level = level
+            break
+        # ^ Else it is similar enough (or has an error such as if the
+        #   downscaled pixels are all transparent), so check finer.
+        coarse = None
+    if (coarse is not None) and (diff is None):
+        results = coarse
+        for key, image in (('base', base), ('head', head)):
+            results[key] = {
+                'size': image.size,
+                'ratio': float(image.size[0]) / float(image.size[1]),
+            }
+        results['same'] = False
+        results['pyramid_level'] = decided_level
+        return results
+    results = diff_images(base, head, diff_size, diff=diff, **kwargs)
+    results['pyramid_level'] = decided_level
+    return results
+
+
 msg_prefix = "[channel_tinker] "
 
 
@@ -727,18 +1348,67 @@ def find_opaque_pos(cti, center, good_minimum=255, max_rad=None,
     return None
 
 
+def fill_spans(cti, spans, color):
+    """Draw spans (See channeltinker.ctraster) in one color.
+
+    Fully covered spans are written at once (using paste if cti is a
+    PIL-like image, otherwise put_region). Pixels that are partly
+    covered are mixed with their current color by the coverage.
+
+    Args:
+        cti (Union(Image,ChannelTinkerInterface)): An image with 8-bit
+            channels.
+        spans (Iterable[tuple]): (y, x0, x1, coverage) spans.
+        color (tuple[int]): A color with a value for each channel.
+    """
+    color = tuple(color)
+    p_len = len(color)
+    color_bytes = bytearray(color)
+    use_paste = (not has_regions(cti)) and callable(getattr(cti, 'paste',
+                                                            None))
+    paste_color = color
+    if p_len == 1:
+        paste_color = color[0]
+    for y, x0, x1, coverage in spans:
+        box = (x0, y, x1, y + 1)
+        if coverage >= 1.0:
+            if use_paste:
+                cti.paste(paste_color, box)
+            else:
+                put_region(cti, box, color_bytes * (x1 - x0))
+            continue
+        data = get_region(cti, box)
+        for i in range(len(data)):
+            old = data[i]
+            data[i] = int(round(old + (color[i % p_len] - old) * coverage))
+        put_region(cti, box, data)
+
+
 def draw_square_from_center(cti, center, rad, color=None, filled=False,
-                            circular=False):
+                            circular=False, antialias=False):
     """Draw a square centered within the image.
+
+    Only the pixels in each row that the shape touches are written
+    (See fill_spans), so it takes about as long as the shape is tall
+    plus one write per row.
+
     Args:
         cti (Union(Image,ChannelTinkerInterface)): Original image.
+        center (tuple[float]): The (x, y) pixel at the center.
+        rad (float): The distance from the center to each side (or the
+            radius of the circle if circular is True).
+        color (Union[tuple,int,float], optional): See convert_depth.
+            Defaults to black (opaque if there is alpha).
+        filled (bool, optional): Fill the shape (otherwise draw a
+            1-pixel outline).
+        circular (bool, optional): Draw a circle instead.
+        antialias (bool, optional): Blend pixels at the edges by how
+            much of each the shape covers.
     """
     # Get any available pixel, to get p_len:
     p_len = len(cti.getbands())
     # pixel = cti.getpixel(0, 0)
-    color = convert_depth(color, p_len)
     new_channels = p_len  # must match dest, else ExecutionError
-    w, h = cti.size
     if color is None:
         if new_channels == 1:
             color = (0)
@@ -750,46 +1420,18 @@ def draw_square_from_center(cti, center, rad, color=None, filled=False,
             color = (0, 0, 0, 255)
         else:
             color = [255 for i in range(new_channels)]
-    radii = None
-    epsilon = sys.float_info.epsilon
-    if filled:
-        radii = []
-        max_rad = 0
-        side_distances = [
-            abs(0 - center[0]),
-            abs(w - center[0]),
-            abs(0 - center[1]),
-            abs(h - center[1]),
-        ]
-        for dist in side_distances:
-            if dist > max_rad:
-                max_rad = dist
-        for rad in range(0, max_rad + 1):
-            radii.append(rad)
+    color = convert_depth(color, p_len)
+    if circular:
+        spans = circle_spans(center, rad, cti.size, filled=filled,
+                             antialias=antialias)
     else:
-        radii = [rad]
-    diag = math.sqrt(2.0)
-    # print("using diagonal pixel measurement: {}".format(diag))
-    for rad in radii:
-        rad_f = float(rad) + epsilon + diag * 2
-        for pos in square_gen(center, rad):
-            dist = idist(center, pos)
-            # print("  navigating square {} ({} <= {})".format(pos, dist,
-            #                                                  rad))
-            if (not circular) or (dist <= rad_f):
-                x, y = pos
-                if x < 0:
-                    continue
-                if y < 0:
-                    continue
-                if x >= w:
-                    continue
-                if y >= h:
-                    continue
-                cti.putpixel((x, y), color)
+        spans = square_spans(center, rad, cti.size, filled=filled,
+                             antialias=antialias)
+    fill_spans(cti, spans, color)
 
 
-def draw_circle_from_center(cti, center, rad, color=None, filled=False):
+def draw_circle_from_center(cti, center, rad, color=None, filled=False,
+                            antialias=False):
     """Draw a centered circle
     (Simplifies calling draw_square_from_center with circular=True)
 
@@ -797,12 +1439,13 @@ def draw_circle_from_center(cti, center, rad, color=None, filled=False):
         cti (Union(Image,ChannelTinkerInterface)): Original image.
     """
     return draw_square_from_center(cti, center, rad, color=color,
-                                   filled=filled, circular=True)
+                                   filled=filled, circular=True,
+                                   antialias=antialias)
 
 
 def extend(cti, minimum=1, maximum=254,
            make_opaque=False, good_minimum=255, enable_threshold=False,
-           threshold=128, ctpi=None):
+           threshold=128, ctpi=None, engine=None):
     """Fix missing or incorrect bleed color on an image with alpha.
     Extrapolate the color of semi-transparent pixels by changing each to
     a nearby opaque one's color (outpainting ~2px doesn't require a
@@ -820,6 +1463,17 @@ def extend(cti, minimum=1, maximum=254,
         ctpi (ChannelTinkerProgressInterface, optional): To update a
             progress bar or similar progress feature, provide an
             implementation of ChannelTinkerProgressInterface.
+        engine (str, optional): "numpy" to find the nearest opaque
+            pixel to every pixel at once using a distance transform
+            (See extend_array in channeltinker.ctnumpy for how results
+            can differ), or "python" to search around each pixel.
+            Defaults to "numpy" if numpy is installed.
+
+    Raises:
+        OperationCanceled: If ctpi.is_canceled() becomes True. Pixels
+            are only written at the end, so cti is unchanged, unless it
+            is a PIL image (or other image without getregion and
+            putregion) and the engine is "python".
     """
     if maximum < 0:
         maximum = 0
@@ -829,9 +1483,53 @@ def extend(cti, minimum=1, maximum=254,
         maximum = 254
     w, h = cti.size
 
+    ctpi = throttled(ctpi)
+    if engine is None:
+        engine = "python"
+        if ENABLE_NUMPY:
+            engine = "numpy"
+    if engine == "numpy":
+        from channeltinker.ctnumpy import (
+            extend_array,
+            put_changed,
+            read_pixels,
+        )
+        progress_cb = None
+        if ctpi is not None:
+            progress_cb = ctpi.check
+        results = extend_array(
+            read_pixels(cti), minimum=minimum, maximum=maximum,
+            make_opaque=make_opaque, good_minimum=good_minimum,
+            enable_threshold=enable_threshold, threshold=threshold,
+            progress_cb=progress_cb,
+        )
+        if results['own_count'] > 0:
+            msg = ("Uh oh, got own pos when checking for better color"
+                   " than {} pixel(s) at or above the minimum good"
+                   " alpha.".format(results['own_count']))
+            echo1(msg)
+            if ctpi is not None:
+                ctpi.show_message(msg)
+                ctpi.set_status(msg)
+        if results['no_good']:
+            msg = ("Uh oh, the image has no pixels at or"
+                   " above the minimum good alpha.")
+            print(msg)
+            if ctpi is not None:
+                ctpi.show_message(msg)
+        put_changed(cti, results['pixels'], results['changed'])
+        if ctpi is not None:
+            ctpi.progress_update(1.0)
+        return
+    elif engine != "python":
+        raise ValueError("engine must be \"numpy\", \"python\" or None"
+                         " but got {}".format(repr(engine)))
+
+    target = cti
+    cti = _buffered(cti)
+    # ^ find_opaque_pos reads many pixels around each edited one, so
+    #   copy them all at once if the backend can (See flush below).
     # print("Size: {}".format((w, h)))
-    total_f = float(w * h)
-    count_f = 0.0
     # ok = True
     n_pix = None
     msg = None
@@ -840,8 +1538,6 @@ def extend(cti, minimum=1, maximum=254,
         #     break
         for x in range(w):
             used_th = False
-            # if count_f is None:
-            count_f = float(y) * float(w) + float(x)
             # print("checking {}".format(cti.getpixel((x, y))))
             p_len = len(cti.getbands())
             pixel = cti.getpixel((x, y))
@@ -915,6 +1611,8 @@ def extend(cti, minimum=1, maximum=254,
                         if ctpi is not None:
                             ctpi.show_message(msg)
                     if not enable_threshold:
+                        if cti is not target:
+                            cti.flush()
                         return
             if enable_threshold and not used_th:
                 if pixel[3] > threshold:
@@ -922,7 +1620,7 @@ def extend(cti, minimum=1, maximum=254,
                 else:
                     n_pix = (pixel[0], pixel[1], pixel[2], 0)
                 cti.putpixel((x, y), n_pix)
-            if count_f is not None:
-                # count_f += 1.0
-                if ctpi is not None:
-                    ctpi.progress_update(count_f / total_f)
+        if ctpi is not None:
+            ctpi.check(float(y + 1) / float(h))
+    if cti is not target:
+        cti.flush()
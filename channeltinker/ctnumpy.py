@@ -0,0 +1,410 @@
+"""
+NumPy implementations of channeltinker operations.
+
+Each function here does the same job as a pure-Python function in
+channeltinker, but operates on whole arrays at once. The channeltinker
+functions dispatch here automatically when numpy is installed (See
+ENABLE_NUMPY in channeltinker), so call those instead unless you
+already have arrays.
+"""
+from __future__ import print_function
+
+import numpy as np
+
+
+def to_array(image):
+    """Get the pixels of a PIL-like image as an array.
+
+    Args:
+        image (Union[Image,numpy.ndarray]): Anything numpy can view as an
+            array, such as a PIL Image (via __array_interface__).
+
+    Returns:
+        numpy.ndarray: Always 3 dimensions: (height, width, channels).
+    """
+    arr = np.asarray(image)
+    if arr.ndim == 2:
+        arr = arr.reshape(arr.shape[0], arr.shape[1], 1)
+    return arr
+
+
+def lowest_mean(total_diff, total_count, remaining):
+    """Get the lowest mean_diff possible after comparing more pixels.
+
+    Each remaining pixel adds at least 0 to total_diff and at most 1 to
+    total_count, so the mean can't get lower than if every remaining
+    pixel were counted as the same.
+
+    Args:
+        total_diff (float): The sum of differences so far.
+        total_count (int): The number of pixels counted so far.
+        remaining (int): The number of pixels not compared yet.
+    """
+    if total_count + remaining <= 0:
+        return 0.0
+    return float(total_diff) / float(total_count + remaining)
+
+
+def diff_arrays(base, head, diff_size, nochange_color, add_color,
+                del_color, c_max=255, max_count=4, clear_in_stats=False,
+                need_colors=True, max_mean_diff=None, progress_cb=None):
+    """Compare two pixel arrays the same way as channeltinker.diff_images.
+
+    The colors must already be chosen by the caller (See
+    diff_images for how add_color and del_color are chosen so they
+    differ from nochange_color).
+
+    Args:
+        base (numpy.ndarray): (height, width, channels) array.
+        head (numpy.ndarray): (height, width, channels) array.
+        diff_size (tuple[int]): The size of the canvas to compare.
+        nochange_color (tuple): The color of pixels that didn't change.
+        add_color (tuple): The color of pixels outside of base.
+        del_color (tuple): The color of pixels outside of head.
+        c_max (int, optional): Pixels in the image can go up to this
+            value.
+        max_count (int, optional): Only compare this number of channels.
+        clear_in_stats (bool, optional): See diff_images.
+        need_colors (bool, optional): Generate the visualization (set
+            this to False if there is no diff image to save time).
+        max_mean_diff (float, optional): Stop comparing once the mean
+            difference can no longer be max_mean_diff or less (See
+            diff_images).
+        progress_cb (Callable, optional): Call this with a factor from
+            0.0 to 1.0 after each band of rows.
+
+    Returns:
+        dict: 'same', 'total_diff' and 'total_count' are the statistics
+            (See diff_images). If need_colors is True, 'colors' is a
+            (h, w, len(nochange_color)) array of visualization colors
+            and 'changed' is a (h, w) bool array that is True for each
+            pixel that is not nochange_color. If comparing stopped
+            early due to max_mean_diff, 'pruned' is True and
+            'mean_diff_min' is the lowest possible mean difference.
+    """
+    w, h = diff_size
+    pix_len = len(nochange_color)
+    bh, bw = base.shape[:2]
+    hh, hw = head.shape[:2]
+    # Part of the canvas inside of base (the rest is "added"):
+    in_bw = min(bw, w)
+    in_bh = min(bh, h)
+    # Part inside of both (the rest of base's part is "deleted"):
+    cw = min(in_bw, hw)
+    ch = min(in_bh, hh)
+    add_count = w * h - in_bw * in_bh
+    del_count = in_bw * in_bh - cw * ch
+
+    stats = {
+        'same': None,
+        'total_diff': float(add_count + del_count),
+        'total_count': add_count + del_count,
+    }
+    nochange = tuple(nochange_color)
+    any_change = False
+    if (add_count > 0) and (tuple(add_color) != nochange):
+        any_change = True
+    if (del_count > 0) and (tuple(del_color) != nochange):
+        any_change = True
+
+    colors = None
+    changed = None
+    if need_colors:
+        color_dtype = np.int64
+        all_colors = ((c_max,) + nochange + tuple(add_color)
+                      + tuple(del_color))
+        if (min(all_colors) >= 0) and (max(all_colors) <= 255):
+            color_dtype = np.uint8
+        colors = np.empty((h, w, pix_len), dtype=color_dtype)
+        colors[:, :] = nochange
+        changed = np.zeros((h, w), dtype=bool)
+        if add_count > 0:
+            colors[:, in_bw:] = add_color
+            colors[in_bh:, :] = add_color
+            if tuple(add_color) != nochange:
+                changed[:, in_bw:] = True
+                changed[in_bh:, :] = True
+        if del_count > 0:
+            colors[:in_bh, cw:in_bw] = del_color
+            colors[ch:in_bh, :cw] = del_color
+            if tuple(del_color) != nochange:
+                changed[:in_bh, cw:in_bw] = True
+                changed[ch:in_bh, :cw] = True
+
+    if (cw > 0) and (ch > 0):
+        band_h = max(1, 262144 // cw)
+        # ^ Compare about 256k pixels at a time so the int32 copies stay
+        #   small (and max_mean_diff can be checked after each band).
+        n = min(base.shape[2], head.shape[2], max_count)
+        denom = float(n * c_max)
+        this_len = min(pix_len, 3)
+        for y0 in range(0, ch, band_h):
+            y1 = min(y0 + band_h, ch)
+            b = base[y0:y1, :cw].astype(np.int32)
+            hd = head[y0:y1, :cw].astype(np.int32)
+            # Sum of absolute channel differences (diff_color numerator):
+            sums = np.abs(b[:, :, :n] - hd[:, :, :n]).sum(axis=2)
+            if pix_len > 3:
+                base_opaque = b[:, :, 3] > 0
+                head_opaque = hd[:, :, 3] > 0
+                both = base_opaque & head_opaque
+                if clear_in_stats:
+                    ones = int(both.size - np.count_nonzero(both))
+                else:
+                    ones = int(np.count_nonzero(base_opaque ^ head_opaque))
+                stats['total_diff'] += (
+                    float(sums[both].sum(dtype=np.int64)) / denom
+                ) + float(ones)
+                stats['total_count'] += int(np.count_nonzero(both)) + ones
+            else:
+                stats['total_diff'] += (float(sums.sum(dtype=np.int64))
+                                        / denom)
+                stats['total_count'] += sums.size
+
+            # Only differing pixels are drawn, in gray by magnitude:
+            nonzero = sums != 0
+            gray = (c_max * (sums / denom)).astype(np.int64)
+            gray_changed = np.zeros(sums.shape, dtype=bool)
+            for i in range(this_len):
+                gray_changed |= gray != nochange[i]
+            for i in range(this_len, pix_len):
+                if c_max != nochange[i]:
+                    gray_changed[:, :] = True
+            gray_changed &= nonzero
+            if gray_changed.any():
+                any_change = True
+            if need_colors:
+                region = colors[y0:y1, :cw]
+                for i in range(this_len):
+                    region[:, :, i] = np.where(nonzero, gray,
+                                               region[:, :, i])
+                for i in range(this_len, pix_len):
+                    region[:, :, i] = np.where(nonzero, c_max,
+                                               region[:, :, i])
+                changed[y0:y1, :cw] = gray_changed
+            if progress_cb is not None:
+                progress_cb(float(y1) / float(ch))
+            if ((max_mean_diff is not None) and (not need_colors)
+                    and (y1 < ch)):
+                mean_diff_min = lowest_mean(stats['total_diff'],
+                                            stats['total_count'],
+                                            (ch - y1) * cw)
+                if mean_diff_min > max_mean_diff:
+                    stats['pruned'] = True
+                    stats['mean_diff_min'] = mean_diff_min
+                    break
+
+    if w * h > 0:
+        stats['same'] = not any_change
+    if need_colors:
+        stats['colors'] = colors
+        stats['changed'] = changed
+    return stats
+
+
+def put_changed(diff, colors, changed):
+    """Draw the changed pixels of a visualization onto a diff image.
+
+    If diff is a PIL-like image of the same size and channel count, it
+    is replaced all at once (via frombytes). Otherwise, if diff has a
+    getbuffer or putregion method (See ChannelTinkerInterface), the
+    rectangle around the changed pixels is written at once, otherwise
+    putpixel is called for each changed pixel.
+
+    Args:
+        diff (Union(Image,ChannelTinkerInterface)): The image to change.
+        colors (numpy.ndarray): (h, w, channels) colors from diff_arrays.
+        changed (numpy.ndarray): (h, w) mask from diff_arrays.
+    """
+    h, w = changed.shape
+    pix_len = colors.shape[2]
+    if (hasattr(diff, 'frombytes') and (tuple(diff.size) == (w, h))
+            and (len(diff.getbands()) == pix_len)
+            and (getattr(diff, 'mode', None) in ('L', 'RGB', 'RGBA'))):
+        arr = to_array(diff).copy()
+        arr[changed] = colors[changed]
+        diff.frombytes(arr.astype(np.uint8).tobytes())
+        return
+    ys, xs = np.nonzero(changed)
+    if len(ys) == 0:
+        return
+    buffer = None
+    if callable(getattr(diff, 'getbuffer', None)):
+        buffer = diff.getbuffer()
+    if (buffer is not None) and (tuple(diff.size) == (w, h)):
+        arr = np.frombuffer(buffer, dtype=np.uint8).reshape(h, w, pix_len)
+        arr[changed] = colors[changed]
+        return
+    if callable(getattr(diff, 'putregion', None)):
+        box = (int(xs.min()), int(ys.min()),
+               int(xs.max()) + 1, int(ys.max()) + 1)
+        region = np.frombuffer(diff.getregion(box), dtype=np.uint8)
+        region = region.reshape(box[3] - box[1], box[2] - box[0],
+                                pix_len).copy()
+        sub = changed[box[1]:box[3], box[0]:box[2]]
+        region[sub] = colors[box[1]:box[3], box[0]:box[2]][sub]
+        diff.putregion(box, region.tobytes())
+        return
+    for y, x in zip(ys.tolist(), xs.tolist()):
+        diff.putpixel((x, y), tuple(colors[y, x].tolist()))
+
+
+def read_pixels(cti):
+    """Get the pixels of any image as an array.
+
+    Args:
+        cti (Union(Image,ChannelTinkerInterface)): An image. If it
+            doesn't have an __array_interface__ (such as a PIL Image
+            does), its getbuffer or getregion method is used if present
+            (in which case channels must be 8-bit), otherwise getpixel
+            is called once for each pixel.
+
+    Returns:
+        numpy.ndarray: (height, width, channels) array (a view of the
+            pixels if cti has a getbuffer method that returns one).
+    """
+    if hasattr(cti, '__array_interface__'):
+        return to_array(cti)
+    w, h = cti.size
+    buffer = None
+    if callable(getattr(cti, 'getbuffer', None)):
+        buffer = cti.getbuffer()
+    if (buffer is None) and callable(getattr(cti, 'getregion', None)):
+        buffer = cti.getregion((0, 0, w, h))
+    if buffer is not None:
+        return np.frombuffer(buffer, dtype=np.uint8).reshape(
+            h, w, len(cti.getbands()))
+    return to_array(np.array([[cti.getpixel((x, y)) for x in range(w)]
+                              for y in range(h)]))
+
+
+def _take_from_row(dist, fy, fx, y, src_y):
+    # Use the 3 neighbors in row src_y (chamfer mask weights are 1).
+    src_d = dist[src_y] + 1
+    for dst, src in ((slice(None), slice(None)),
+                     (slice(1, None), slice(None, -1)),
+                     (slice(None, -1), slice(1, None))):
+        cand = src_d[src]
+        better = cand < dist[y, dst]
+        if better.any():
+            dist[y, dst][better] = cand[better]
+            fy[y, dst][better] = fy[src_y, src][better]
+            fx[y, dst][better] = fx[src_y, src][better]
+
+
+def _sweep_row(dist, fy, fx, y, xs, reverse=False):
+    # Propagate along the row in one step: The left-to-right result is
+    # x + min(dist[x'] - x') for x' <= x, and each minimum is packed
+    # with its x' so np.minimum.accumulate also finds the feature.
+    w = len(xs)
+    if reverse:
+        keys = (dist[y] + xs) * w + xs
+        mins = np.minimum.accumulate(keys[::-1])[::-1]
+        dist[y] = mins // w - xs
+    else:
+        keys = (dist[y] - xs + w) * w + xs
+        mins = np.minimum.accumulate(keys)
+        dist[y] = mins // w - w + xs
+    idx = mins % w
+    fy[y] = fy[y][idx]
+    fx[y] = fx[y][idx]
+
+
+def nearest_features(mask, progress_cb=None):
+    """Find the nearest True pixel to every pixel.
+
+    This is a two-pass chamfer distance transform with feature
+    tracking. The distance is the chessboard distance (the square
+    radius used by channeltinker.find_opaque_pos), for which the
+    chamfer result is exact. Only each row is a Python loop.
+
+    Args:
+        mask (numpy.ndarray): (h, w) bool array of features.
+        progress_cb (Callable, optional): Call this with a factor from
+            0.0 to 1.0 periodically.
+
+    Returns:
+        tuple(numpy.ndarray): (dist, fy, fx) (h, w) int arrays, where
+            (fy[y, x], fx[y, x]) is the position of the nearest feature
+            to (x, y). If there are no features, every dist is greater
+            than w + h and every fy and fx is -1.
+    """
+    h, w = mask.shape
+    far = w + h + 1
+    xs = np.arange(w, dtype=np.int64)
+    dist = np.where(mask, 0, far).astype(np.int64)
+    fy = np.where(mask, np.arange(h, dtype=np.int64)[:, np.newaxis], -1)
+    fx = np.where(mask, xs[np.newaxis, :], -1)
+    total = float(max(1, h * 2))
+    for y in range(h):
+        if y > 0:
+            _take_from_row(dist, fy, fx, y, y - 1)
+        _sweep_row(dist, fy, fx, y, xs)
+        if (progress_cb is not None) and (y % 64 == 0):
+            progress_cb(y / total)
+    for y in range(h - 1, -1, -1):
+        if y < h - 1:
+            _take_from_row(dist, fy, fx, y, y + 1)
+        _sweep_row(dist, fy, fx, y, xs, reverse=True)
+        if (progress_cb is not None) and (y % 64 == 0):
+            progress_cb((h * 2 - y) / total)
+    return dist, fy, fx
+
+
+def extend_array(arr, minimum=1, maximum=254, make_opaque=False,
+                 good_minimum=255, enable_threshold=False, threshold=128,
+                 progress_cb=None):
+    """Extend opaque colors the same way as channeltinker.extend.
+
+    Every color is taken from the original pixels, so unlike the python
+    engine, a pixel that was already edited is never the source for
+    another one (that only matters if make_opaque or enable_threshold
+    can make an edited pixel reach good_minimum). Where several opaque
+    pixels are equally near, the one chosen may also differ.
+
+    Args:
+        arr (numpy.ndarray): (h, w, 4+) array with alpha at index 3.
+        progress_cb (Callable, optional): See nearest_features.
+
+    For other arguments see channeltinker.extend.
+
+    Returns:
+        dict: 'pixels' is the resulting array, 'changed' is a (h, w)
+            bool array that is True for each pixel that changed,
+            'no_good' is True if pixels needed a color but none reached
+            good_minimum, and 'own_count' is the number of pixels in
+            range that already reach good_minimum (and so are their own
+            nearest opaque pixel).
+    """
+    if (arr.ndim != 3) or (arr.shape[2] < 4):
+        raise ValueError("extend requires an alpha channel but the shape"
+                         " is {}".format(arr.shape))
+    alpha = arr[:, :, 3]
+    good = alpha >= good_minimum
+    in_range = (alpha >= minimum) & (alpha <= maximum)
+    edit = in_range & ~good
+    results = {
+        'no_good': False,
+        'own_count': int(np.count_nonzero(in_range & good)),
+    }
+    pixels = arr.copy()
+    if edit.any():
+        if good.any():
+            dist, fy, fx = nearest_features(good, progress_cb=progress_cb)
+            ys, xs = np.nonzero(edit)
+            src = arr[fy[ys, xs], fx[ys, xs]]
+            pixels[ys, xs, :3] = src[:, :3]
+            if make_opaque:
+                # Keep alpha from good pixel instead of using 255.
+                pixels[ys, xs, 3:] = src[:, 3:]
+        else:
+            results['no_good'] = True
+            if not enable_threshold:
+                results['pixels'] = pixels
+                results['changed'] = np.zeros(alpha.shape, dtype=bool)
+                return results
+    if enable_threshold:
+        pixels[:, :, 3] = np.where(alpha > threshold, 255, 0)
+    results['pixels'] = pixels
+    results['changed'] = np.any(pixels != arr, axis=2)
+    return results
@@ -0,0 +1,126 @@
+"""
+Write PNG files a few rows at a time.
+
+This only needs the standard library, so an image can be saved while it
+is being generated without ever holding the whole image in memory (PIL
+can only save complete images).
+"""
+from __future__ import print_function
+
+import struct
+import zlib
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+color_types = {
+    'L': (0, 1),
+    'RGB': (2, 3),
+    'LA': (4, 2),
+    'RGBA': (6, 4),
+}
+# ^ mode: (PNG color type, channel count) for 8-bit channels
+
+
+class PNGStreamWriter(object):
+    """Write an 8-bit PNG file one or more rows at a time.
+
+    Rows are compressed as they are written, so only the compressor's
+    buffer is kept in memory.
+
+    Args:
+        path (str): The file to create.
+        size (tuple[int]): The (width, height) of the image.
+        mode (str, optional): A PIL-style mode in color_types.
+        compress_level (int, optional): The zlib compression level.
+        chunk_size (int, optional): Write an IDAT chunk whenever this
+            many compressed bytes are ready.
+    """
+    def __init__(self, path, size, mode='RGBA', compress_level=6,
+                 chunk_size=1048576):
+        if mode not in color_types:
+            raise ValueError("mode must be one of {} but got {}"
+                             "".format(list(color_types), repr(mode)))
+        self.size = tuple(size)
+        self.mode = mode
+        color_type, self.channels = color_types[mode]
+        self.row_len = self.size[0] * self.channels
+        self.rows_written = 0
+        self.chunk_size = chunk_size
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_len = 0
+        self._stream = open(path, 'wb')
+        self._stream.write(PNG_SIGNATURE)
+        self._write_chunk(b'IHDR', struct.pack(
+            ">IIBBBBB", self.size[0], self.size[1], 8, color_type, 0, 0, 0
+        ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't raise a second (row count) error over the real one.
+            self._stream.close()
+
+    def _write_chunk(self, chunk_type, data):
+        self._stream.write(struct.pack(">I", len(data)))
+        self._stream.write(chunk_type)
+        self._stream.write(data)
+        crc = zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF
+        self._stream.write(struct.pack(">I", crc))
+
+    def _add_compressed(self, data):
+        if not data:
+            return
+        self._pending.append(data)
+        self._pending_len += len(data)
+        if self._pending_len >= self.chunk_size:
+            self._flush_idat()
+
+    def _flush_idat(self):
+        if self._pending_len > 0:
+            self._write_chunk(b'IDAT', b''.join(self._pending))
+        self._pending = []
+        self._pending_len = 0
+
+    def write_rows(self, data):
+        """Add whole rows of pixels to the image.
+
+        Args:
+            data (bytes): Pixel data for one or more rows in the order
+                of mode (such as from the tobytes method of a PIL image
+                or numpy array).
+        """
+        if len(data) % self.row_len != 0:
+            raise ValueError("Got {} bytes but a row is {} bytes."
+                             "".format(len(data), self.row_len))
+        count = len(data) // self.row_len
+        if self.rows_written + count > self.size[1]:
+            raise ValueError("The image only has {} rows."
+                             "".format(self.size[1]))
+        for i in range(count):
+            start = i * self.row_len
+            self._add_compressed(self._compressor.compress(
+                b'\x00' + data[start:start+self.row_len]
+                # ^ 0 is the "None" filter type.
+            ))
+        self.rows_written += count
+
+    def close(self):
+        """Finish writing the file.
+
+        Raises:
+            ValueError: If not all rows were written.
+        """
+        try:
+            if self.rows_written != self.size[1]:
+                raise ValueError("Only {} of {} rows were written."
+                                 "".format(self.rows_written, self.size[1]))
+            self._add_compressed(self._compressor.flush())
+            self._flush_idat()
+            self._write_chunk(b'IEND', b'')
+        finally:
+            self._stream.close()
@@ -0,0 +1,246 @@
+"""
+Rasterize shapes into horizontal spans of pixels.
+
+A span is a tuple (y, x0, x1, coverage) where x1 is exclusive and
+coverage (more than 0.0, up to 1.0) is how much of each pixel in the
+span the shape covers (always 1.0 unless antialias is True).
+Coordinates are pixel indices, so a square centered at (2, 2) with a
+radius of 2 covers pixels 0 through 4 in each direction. Spans are
+clipped to the image size, so drawing them needs no bounds checks (See
+fill_spans in channeltinker).
+"""
+from __future__ import division
+
+import math
+
+
+def _coverage_at(runs, i):
+    for i0, i1, coverage in runs:
+        if i0 <= i < i1:
+            return coverage
+    return 0.0
+
+
+def _merge_runs(runs):
+    # Join touching runs that have the same coverage.
+    merged = []
+    for run in runs:
+        if merged and (merged[-1][1] == run[0]) and (merged[-1][2] == run[2]):
+            merged[-1] = (merged[-1][0], run[1], run[2])
+        else:
+            merged.append(run)
+    return merged
+
+
+def _pixel_runs(pixels):
+    # Convert sorted (x, coverage) pixels to runs.
+    return _merge_runs([(x, x + 1, coverage) for x, coverage in pixels])
+
+
+def _axis_runs(c, rad, antialias, lo, hi):
+    """Get the runs along one axis where abs(i - c) <= rad.
+
+    Args:
+        c (float): The center.
+        rad (float): The radius.
+        antialias (bool): Give the pixels at each end the fraction of
+            them inside of the interval, where pixel i is from i - 0.5
+            to i + 0.5 (otherwise only include pixels with their center
+            inside).
+        lo (int): The first index allowed.
+        hi (int): The index after the last one allowed.
+
+    Returns:
+        list(tuple): (i0, i1, coverage) runs where i1 is exclusive.
+    """
+    if rad < 0:
+        return []
+    if not antialias:
+        runs = [(int(math.ceil(c - rad)), int(math.floor(c + rad)) + 1,
+                 1.0)]
+    else:
+        left = c - rad - 0.5
+        right = c + rad + 0.5
+        first = int(math.floor(left + 0.5))
+        last = int(math.ceil(right - 0.5))
+        runs = []
+        for i in sorted(set([first, last])):
+            coverage = min(i + 0.5, right) - max(i - 0.5, left)
+            if coverage > 0:
+                runs.append((i, i + 1, min(coverage, 1.0)))
+        if last - first >= 2:
+            runs.append((first + 1, last, 1.0))
+            # ^ Only the pixels at the ends can be partly covered.
+        runs = _merge_runs(sorted(runs))
+    clipped = []
+    for i0, i1, coverage in runs:
+        i0 = max(i0, lo)
+        i1 = min(i1, hi)
+        if i1 > i0:
+            clipped.append((i0, i1, coverage))
+    return clipped
+
+
+def _subtract_runs(outer, outer_f, inner, inner_f):
+    # Get runs of outer coverage * outer_f - inner coverage * inner_f.
+    points = sorted(set([run[0] for run in outer + inner]
+                        + [run[1] for run in outer + inner]))
+    runs = []
+    for p0, p1 in zip(points[:-1], points[1:]):
+        coverage = (_coverage_at(outer, p0) * outer_f
+                    - _coverage_at(inner, p0) * inner_f)
+        if coverage > 1e-9:
+            runs.append((p0, p1, coverage))
+    return _merge_runs(runs)
+
+
+def square_spans(center, rad, size, filled=True, antialias=False):
+    """Generate spans of a square.
+
+    Args:
+        center (tuple[float]): The (x, y) center.
+        rad (float): The distance from the center to each side.
+        size (tuple[int]): The (width, height) of the image.
+        filled (bool, optional): Include the inside. Otherwise only
+            the pixels that are not inside of a square with a radius
+            1 smaller are included (a 1-pixel outline).
+        antialias (bool, optional): Partly cover pixels at the edges
+            that the square only partly covers.
+    """
+    w, h = size
+    x_runs = _axis_runs(center[0], rad, antialias, 0, w)
+    y_runs = _axis_runs(center[1], rad, antialias, 0, h)
+    inner_x_runs = []
+    inner_y_runs = []
+    if not filled:
+        inner_x_runs = _axis_runs(center[0], rad - 1, antialias, 0, w)
+        inner_y_runs = _axis_runs(center[1], rad - 1, antialias, 0, h)
+    for y0, y1, y_coverage in y_runs:
+        for y in range(y0, y1):
+            inner_y_coverage = _coverage_at(inner_y_runs, y)
+            runs = _subtract_runs(x_runs, y_coverage, inner_x_runs,
+                                  inner_y_coverage)
+            for x0, x1, coverage in runs:
+                yield (y, x0, x1, coverage)
+
+
+def _row_range(c, half, lo, hi):
+    # Get the first and last index within half of c (clipped).
+    return (max(lo, int(math.ceil(c - half))),
+            min(hi - 1, int(math.floor(c + half))))
+
+
+def midpoint_circle_points(center, rad):
+    """Get the outline of a circle using the midpoint circle algorithm.
+
+    Args:
+        center (tuple[float]): The (x, y) center (rounded to the
+            nearest pixel).
+        rad (float): The radius (rounded to the nearest pixel).
+
+    Returns:
+        set(tuple[int]): (x, y) positions (not clipped).
+    """
+    cx = int(math.floor(center[0] + 0.5))
+    cy = int(math.floor(center[1] + 0.5))
+    x = int(math.floor(rad + 0.5))
+    y = 0
+    err = 1 - x
+    points = set()
+    while x >= y:
+        for ox, oy in ((x, y), (y, x), (-y, x), (-x, y),
+                       (-x, -y), (-y, -x), (y, -x), (x, -y)):
+            points.add((cx + ox, cy + oy))
+        y += 1
+        if err < 0:
+            err += 2 * y + 1
+        else:
+            x -= 1
+            err += 2 * (y - x) + 1
+    return points
+
+
+def circle_spans(center, rad, size, filled=True, antialias=False):
+    """Generate spans of a circle.
+
+    Args:
+        center (tuple[float]): The (x, y) center.
+        rad (float): The radius.
+        size (tuple[int]): The (width, height) of the image.
+        filled (bool, optional): Include the inside. Otherwise get a
+            1-pixel outline (from midpoint_circle_points unless
+            antialias is True).
+        antialias (bool, optional): Cover each pixel by how far it is
+            inside of the edge (the distance from pixel centers is
+            used as an approximation of the area).
+    """
+    w, h = size
+    cx, cy = center
+    if rad < 0:
+        return
+    if not antialias:
+        if filled:
+            y_first, y_last = _row_range(cy, rad, 0, h)
+            for y in range(y_first, y_last + 1):
+                dy = y - cy
+                half = math.sqrt(max(0.0, rad * rad - dy * dy))
+                x0, x_last = _row_range(cx, half, 0, w)
+                if x_last >= x0:
+                    yield (y, x0, x_last + 1, 1.0)
+            return
+        rows = {}
+        for x, y in midpoint_circle_points(center, rad):
+            if (0 <= x < w) and (0 <= y < h):
+                rows.setdefault(y, []).append((x, 1.0))
+        for y in sorted(rows):
+            for x0, x1, coverage in _pixel_runs(sorted(rows[y])):
+                yield (y, x0, x1, coverage)
+        return
+
+    if filled:
+        outer = rad + 0.5
+        inner = rad - 0.5
+    else:
+        outer = rad + 1.0
+        inner = rad - 1.0
+
+    def get_coverage(x, y):
+        d = math.sqrt((x - cx) ** 2 + (y - cy) ** 2)
+        if filled:
+            return min(1.0, rad + 0.5 - d)
+        return 1.0 - abs(d - rad)
+
+    y_first, y_last = _row_range(cy, outer, 0, h)
+    for y in range(y_first, y_last + 1):
+        dy = y - cy
+        if abs(dy) >= outer:
+            continue
+        outer_half = math.sqrt(outer * outer - dy * dy)
+        x_first, x_last = _row_range(cx, outer_half, 0, w)
+        inner_half = None
+        if inner > abs(dy):
+            inner_half = math.sqrt(inner * inner - dy * dy)
+        if inner_half is None:
+            candidates = [range(x_first, x_last + 1)]
+        else:
+            # Skip the middle, where pixels are fully covered if filled
+            # (or not covered at all if not filled).
+            candidates = [
+                range(x_first, min(x_last + 1,
+                                   int(math.ceil(cx - inner_half)))),
+                range(max(x_first, int(math.floor(cx + inner_half)) + 1),
+                      x_last + 1),
+            ]
+        pixels = []
+        for xs in candidates:
+            for x in xs:
+                coverage = get_coverage(x, y)
+                if coverage > 0:
+                    pixels.append((x, coverage))
+        runs = _pixel_runs(pixels)
+        if filled and (inner_half is not None):
+            x0, x_last = _row_range(cx, inner_half, 0, w)
+            if x_last >= x0:
+                runs = _merge_runs(sorted(runs + [(x0, x_last + 1, 1.0)]))
+        for x0, x1, coverage in runs:
+            yield (y, x0, x1, coverage)
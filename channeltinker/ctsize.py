@@ -0,0 +1,183 @@
+"""
+Get the dimensions of image files by reading only their headers.
+
+This only needs the standard library, and it reads at most a few
+kilobytes of each file (JPEG files are scanned marker by marker until
+the frame header, skipping the data of each segment).
+"""
+from __future__ import print_function
+
+import json
+import os
+import struct
+
+_JPEG_SOF_MARKERS = (
+    set(range(0xC0, 0xC4)) | set(range(0xC5, 0xC8))
+    | set(range(0xC9, 0xCC)) | set(range(0xCD, 0xD0))
+)
+# ^ Start Of Frame markers (not DHT 0xC4, JPG 0xC8, or DAC 0xCC)
+
+
+def _png_size(stream, head):
+    if head[12:16] != b'IHDR':
+        return None
+    return struct.unpack(">II", head[16:24])
+
+
+def _gif_size(stream, head):
+    return struct.unpack("<HH", head[6:10])
+
+
+def _bmp_size(stream, head):
+    header_size = struct.unpack("<I", head[14:18])[0]
+    if header_size == 12:
+        # OS/2 BITMAPCOREHEADER
+        return struct.unpack("<HH", head[18:22])
+    w, h = struct.unpack("<ii", head[18:26])
+    return w, abs(h)
+    # ^ A negative height means the rows are stored top to bottom.
+
+
+def _webp_size(stream, head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        w, h = struct.unpack("<HH", head[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b'VP8L':
+        b = bytearray(head[21:25])
+        w = 1 + (((b[1] & 0x3F) << 8) | b[0])
+        h = 1 + (((b[3] & 0xF) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+        return w, h
+    if chunk == b'VP8X':
+        b = bytearray(head[24:30])
+        w = 1 + (b[0] | (b[1] << 8) | (b[2] << 16))
+        h = 1 + (b[3] | (b[4] << 8) | (b[5] << 16))
+        return w, h
+    return None
+
+
+def _jpeg_size(stream, head):
+    stream.seek(2)
+    while True:
+        byte = stream.read(1)
+        while byte and (byte != b'\xff'):
+            byte = stream.read(1)
+        while byte == b'\xff':
+            byte = stream.read(1)
+            # ^ Skip fill bytes.
+        if not byte:
+            return None
+        marker = ord(byte)
+        if marker in (0xD8, 0x01) or (0xD0 <= marker <= 0xD7):
+            continue  # These markers have no length.
+        if marker in (0xD9, 0xDA):
+            return None  # End of image or start of scan without a frame
+        length_bytes = stream.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in _JPEG_SOF_MARKERS:
+            frame = stream.read(5)
+            if len(frame) < 5:
+                return None
+            h, w = struct.unpack(">HH", frame[1:5])
+            return w, h
+        stream.seek(length - 2, 1)
+
+
+def read_image_size(path):
+    """Get the dimensions of an image from the header of the file.
+
+    Supported formats are PNG, JPEG, GIF, BMP and WebP.
+
+    Args:
+        path (str): Any file.
+
+    Returns:
+        tuple(int): (width, height), or None if the format isn't
+            supported or the header is incomplete.
+    """
+    with open(path, 'rb') as stream:
+        head = stream.read(32)
+        try:
+            if head.startswith(b'\x89PNG\r\n\x1a\n'):
+                size = _png_size(stream, head)
+            elif head.startswith(b'\xff\xd8'):
+                size = _jpeg_size(stream, head)
+            elif head[:6] in (b'GIF87a', b'GIF89a'):
+                size = _gif_size(stream, head)
+            elif head.startswith(b'BM'):
+                size = _bmp_size(stream, head)
+            elif head.startswith(b'RIFF') and (head[8:12] == b'WEBP'):
+                size = _webp_size(stream, head)
+            else:
+                return None
+        except struct.error:
+            return None  # The header is too short.
+    if size is None:
+        return None
+    return tuple(size)
+
+
+class SizeCache(object):
+    """Remember image sizes by (realpath, mtime, size of file).
+
+    Args:
+        path (str, optional): A JSON file to load (if it exists) and
+            save the cache to (See save).
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._sizes = {}
+        # ^ {realpath: [mtime, file size, width, height]}
+        self.changed = False
+        if (path is not None) and os.path.isfile(path):
+            with open(path, 'r') as stream:
+                self._sizes = json.load(stream)
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def get_size(self, path, fallback=None):
+        """Get the dimensions of an image.
+
+        Args:
+            path (str): Any image file.
+            fallback (Callable, optional): If the format isn't supported
+                by read_image_size, call fallback(path) to get (width,
+                height) instead (such as by opening it with PIL).
+
+        Returns:
+            tuple(int): (width, height), or None if unknown (then it is
+                not cached).
+        """
+        realpath = os.path.realpath(path)
+        stat = os.stat(realpath)
+        entry = self._sizes.get(realpath)
+        if ((entry is not None) and (entry[0] == stat.st_mtime)
+                and (entry[1] == stat.st_size)):
+            return (entry[2], entry[3])
+        size = read_image_size(realpath)
+        if (size is None) and (fallback is not None):
+            size = fallback(realpath)
+        if size is None:
+            return None
+        self._sizes[realpath] = [stat.st_mtime, stat.st_size,
+                                 size[0], size[1]]
+        self.changed = True
+        return tuple(size)
+
+    def save(self, path=None):
+        """Save the cache as JSON.
+
+        Args:
+            path (str, optional): Defaults to the path given to the
+                constructor.
+        """
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError("There is no path to save the cache to.")
+        with open(path, 'w') as stream:
+            json.dump(self._sizes, stream)
+        self.changed = False
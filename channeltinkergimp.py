@@ -17,6 +17,7 @@ from channeltinker import (
     # find_opaque_pos,
     ChannelTinkerInterface,
     ChannelTinkerProgressInterface,
+    TileBufferCTI,
     draw_circle_from_center,
     extend,
     draw_square_from_center,
@@ -35,6 +36,11 @@ class GimpCTPI(ChannelTinkerProgressInterface):
 
 
 class GimpCTI(ChannelTinkerInterface):
+    """Access a GIMP drawable.
+
+    Each getpixel or putpixel call goes through the PDB, so for
+    anything but a few pixels, use buffered_cti instead.
+    """
 
     @property
     def size(self):
@@ -80,8 +86,51 @@ class GimpCTI(ChannelTinkerInterface):
         pdb.gimp_drawable_set_pixel(self.drawable, pos[0], pos[1],
                                     self._p_len, color)
 
+    def getregion(self, box):
+        left, top, right, bottom = box
+        rgn = self.drawable.get_pixel_rgn(left, top, right - left,
+                                          bottom - top, False, False)
+        return bytearray(rgn[left:right, top:bottom])
+
+    def putregion(self, box, data):
+        left, top, right, bottom = box
+        rgn = self.drawable.get_pixel_rgn(left, top, right - left,
+                                          bottom - top, True, False)
+        rgn[left:right, top:bottom] = bytes(data)
+        self.drawable.flush()
+
+    def getbuffer(self):
+        return None
+        # ^ Pixel regions are always copies of GIMP's tiles.
+
+
+def buffered_cti(image, drawable=None):
+    """Get a GimpCTI with its tiles buffered in memory.
+
+    Call flush_cti when done to write the changes back.
+
+    Returns:
+        TileBufferCTI: Tiles of the drawable (read using pixel regions
+            when first used).
+    """
+    return TileBufferCTI(GimpCTI(image, drawable=drawable))
+
 
-def ct_draw_centered_circle(image, drawable, radius, color, filled):
+def flush_cti(cti):
+    """Write changed tiles from buffered_cti back and redraw them.
+
+    The changed area is updated with one gimp_drawable_update call.
+    """
+    box = cti.flush()
+    if box is not None:
+        left, top, right, bottom = box
+        pdb.gimp_drawable_update(cti.source.drawable, left, top,
+                                 right - left, bottom - top)
+    pdb.gimp_displays_flush()
+
+
+def ct_draw_centered_circle(image, drawable, radius, color, filled,
+                            antialias=False):
     image.disable_undo()
     w = pdb.gimp_image_width(image)
     h = pdb.gimp_image_height(image)
@@ -115,16 +164,15 @@ def ct_draw_centered_circle(image, drawable, radius, color, filled):
         pdb.gimp_message(msg)
     # exists, x1, y1, x2, y2 = \
     #     pdb.gimp_selection_bounds(self.image)
-    cti = GimpCTI(image, drawable=drawable)
+    cti = buffered_cti(image, drawable=drawable)
     draw_circle_from_center(cti, (x, y), radius,
-                            color=color, filled=filled)
-    pdb.gimp_drawable_update(drawable, 0, 0, drawable.width,
-                             drawable.height)
-    pdb.gimp_displays_flush()
+                            color=color, filled=filled, antialias=antialias)
+    flush_cti(cti)
     image.enable_undo()
 
 
-def ct_draw_centered_square(image, drawable, radius, color, filled):
+def ct_draw_centered_square(image, drawable, radius, color, filled,
+                            antialias=False):
     image.disable_undo()
     w = pdb.gimp_image_width(image)
     h = pdb.gimp_image_height(image)
@@ -150,12 +198,10 @@ def ct_draw_centered_square(image, drawable, radius, color, filled):
 
     print("image.channels: {}".format(image.channels))
     print("image.base_type: {}".format(image.channels))
-    cti = GimpCTI(image, drawable=drawable)
+    cti = buffered_cti(image, drawable=drawable)
     draw_square_from_center(cti, (x, y), radius, color=color,
-                            filled=filled)
-    pdb.gimp_drawable_update(drawable, 0, 0, drawable.width,
-                             drawable.height)
-    pdb.gimp_displays_flush()
+                            filled=filled, antialias=antialias)
+    flush_cti(cti)
     image.enable_undo()
 
 
@@ -166,7 +212,7 @@ def ct_remove_layer_halo(image, drawable, minimum, maximum, good_minimum,
     # print("options: {}".format((str(image), str(drawable), str(minimum),
     #                            str(maximum), str(make_opaque),
     #                            str(good_minimum))))
-    cti = GimpCTI(image, drawable=drawable)
+    cti = buffered_cti(image, drawable=drawable)
     ctpi = GimpCTPI()
     extend(cti, minimum=minimum,
            maximum=maximum, make_opaque=make_opaque,
@@ -177,11 +223,8 @@ def ct_remove_layer_halo(image, drawable, minimum, maximum, good_minimum,
     # if drawable is None:
     #     drawable = pdb.gimp_image_active_drawable(image)
 
-    pdb.gimp_drawable_update(drawable, 0, 0, drawable.width,
-                             drawable.height)
-    pdb.gimp_displays_flush()
-    # ^ update the image; still you must first do#
-    # pdb.gimp_drawable_update(...)
+    flush_cti(cti)
+    # ^ update the image (only the changed tiles)
     image.enable_undo()
 
 
@@ -227,6 +270,7 @@ register(
 #         (PF_INT,    "radius", "Radius", 15),
 #         (PF_COLOR,  "color", "Color", (0, 0, 0)),
 #         (PF_TOGGLE, "filled", "Filled", False),
+#         (PF_TOGGLE, "antialias", "Antialias", False),
 #     ],
 #     [], # results
 #     ct_draw_centered_circle,
@@ -246,6 +290,7 @@ register(
         (PF_INT,    "radius", "Radius", 15),
         (PF_COLOR,  "color", "Color", (0, 0, 0)),
         (PF_TOGGLE, "filled", "Filled", False),
+        (PF_TOGGLE, "antialias", "Antialias", False),
     ],
     [], # results
     ct_draw_centered_square,
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import hashlib
 import os
 
 from channeltinker import diff_images
@@ -11,16 +12,191 @@ from channeltinker import (
     # echo2,
     # echo3,
     echo4,
+    ENABLE_NUMPY,
+    get_diff_colors,
+    ChannelTinkerInterface,
 )
 
+from channeltinkerpil.decodecache import open_rgba
+
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 # ^ Avoids issue #14 (GIMP images with
 #   "Raw profile type exif"), and image is displayed
 #   (often image isn't really broken,
 #   such as if saved with GIMP)
 
+nochange_color = (0, 0, 0, 255)
+# ^ The color of pixels that are the same in gen_diff_image output.
+
+tiled_min_pixels = 4096 * 4096
+# ^ diff_images_by_path uses gen_diff_image_tiled for images this big.
+
+
+class PILCTI(ChannelTinkerInterface):
+    """Use a PIL image as a ChannelTinkerInterface with region access.
+
+    A PIL image can be passed to channeltinker functions directly, but
+    this adapter also provides getregion and putregion (via tobytes
+    and frombytes) for code that only uses ChannelTinkerInterface.
+
+    Args:
+        image (Image): An image with 8-bit channels (such as mode 'L',
+            'LA', 'RGB' or 'RGBA'). It is changed in place.
+    """
+    def __init__(self, image):
+        self.image = image
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def getbands(self):
+        return self.image.getbands()
+
+    def getpixel(self, pos):
+        return self.image.getpixel(pos)
+
+    def putpixel(self, pos, color):
+        self.image.putpixel(pos, color)
+
+    def getregion(self, box):
+        if tuple(box) == (0, 0) + tuple(self.image.size):
+            return bytearray(self.image.tobytes())
+        return bytearray(self.image.crop(box).tobytes())
+
+    def putregion(self, box, data):
+        left, top, right, bottom = box
+        if tuple(box) == (0, 0) + tuple(self.image.size):
+            self.image.frombytes(bytes(data))
+            return
+        region = Image.frombytes(self.image.mode, (right - left,
+                                                   bottom - top),
+                                 bytes(data))
+        self.image.paste(region, (left, top))
+
+    def getbuffer(self):
+        return None
+        # ^ PIL doesn't expose its pixel memory.
+
+
+def file_sha256(path, chunk_size=1048576):
+    """Get the SHA256 hexdigest of a file's content.
+
+    Args:
+        path (str): Any file.
+        chunk_size (int, optional): Read this many bytes at a time so
+            large files don't have to fit in memory.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pixel_sha256(image, tile_height=None):
+    """Get the SHA256 hexdigest of an image's decoded RGBA pixels.
+
+    Images with different encodings (or metadata) that look the same
+    get the same digest.
+
+    Args:
+        image (Image): Any PIL-compatible image (it is converted to
+            RGBA, so the palette of indexed images is also applied).
+        tile_height (int, optional): Convert this many rows at a time
+            instead of the whole image (to save memory).
+    """
+    digest = hashlib.sha256()
+    digest.update("{}x{}".format(image.size[0], image.size[1])
+                  .encode('utf-8'))
+    if tile_height is None:
+        digest.update(image.convert('RGBA').tobytes())
+        return digest.hexdigest()
+    w, h = image.size
+    for y in range(0, h, tile_height):
+        band = image.crop((0, y, w, min(y + tile_height, h)))
+        digest.update(band.convert('RGBA').tobytes())
+    return digest.hexdigest()
+
+
+def _sizes_result(base, head):
+    # Get the part of a gen_diff_image result that only needs the sizes.
+    return {
+        'same': True,
+        'mean_diff': 0.0,
+        'base': {
+            'size': base.size,
+            'ratio': float(base.size[0]) / float(base.size[1]),
+        },
+        'head': {
+            'size': head.size,
+            'ratio': float(head.size[0]) / float(head.size[1]),
+        },
+        'diff': {},
+    }
+
+
+def _has_counted_pixels(image):
+    # Check whether diff_images would count any pixel of image compared
+    # to itself (it skips pixels that are transparent in both).
+    w, h = image.size
+    if w * h <= 0:
+        return False
+    if len(image.getbands()) > 3:
+        return image.getchannel(image.getbands()[3]).getextrema()[1] > 0
+    return True
+
+
+def gen_same_result(base, head, diff_path=None, checked_by=None):
+    """Get the results of gen_diff_image for images known to be the same.
+
+    This skips the pixel comparison (only the sizes and, if there is an
+    alpha channel, the alpha of base are read), so it is only accurate
+    if the caller already knows the images are identical (such as by
+    file_sha256 or pixel_sha256).
+
+    Args:
+        diff_path (str, optional): See gen_diff_image (If set, a diff
+            image with only nochange_color is saved).
+        checked_by (str, optional): Set results['checked_by'] to this
+            (how the caller determined the images are the same).
+
+    Returns:
+        dict: See gen_diff_image.
+    """
+    result = _sizes_result(base, head)
+    if not _has_counted_pixels(base):
+        del result['mean_diff']
+        result['error'] = "WARNING: There were no pixels."
+        # ^ Same as diff_images
+    if checked_by is not None:
+        result['checked_by'] = checked_by
+    if diff_path is not None:
+        diff_path = os.path.abspath(diff_path)
+        w, h = base.size
+        if w * h >= tiled_min_pixels:
+            from channeltinker.ctpng import PNGStreamWriter
+            row = bytes(bytearray(nochange_color)) * w
+            with PNGStreamWriter(diff_path, base.size) as writer:
+                for _ in range(h):
+                    writer.write_rows(row)
+        else:
+            diff = Image.new('RGBA', base.size, nochange_color)
+            diff.save(diff_path)
+        result['diff']['path'] = diff_path
+        echo1("* saved \"{}\"".format(diff_path))
+    else:
+        result['base_image'] = base
+        result['head_image'] = head
+        result['diff_image'] = Image.new('RGBA', base.size, nochange_color)
+    return result
+
 
-def gen_diff_image(base, head, diff=None, diff_path=None):
+def gen_diff_image(base, head, diff=None, diff_path=None,
+                   pyramid_threshold=None, make_diff=True):
     """Compare two PIL-compatible image objects visually.
 
     Args:
@@ -28,6 +204,13 @@ def gen_diff_image(base, head, diff=None, diff_path=None):
             the difference: black is same, closer to white differs (if images
             are different sizes, red is deleted, green is added).
             Otherwise returned dict will have images (See returns).
+        pyramid_threshold (float, optional): Compare downscaled versions
+            first and stop early if they differ by more than this (See
+            diff_images). Only useful with make_diff=False and no
+            diff_path, since a diff image needs full resolution.
+        make_diff (bool, optional): If False and diff_path is None, don't
+            create a diff image at all (then there is no 'diff_image' in
+            the result).
 
     Returns:
         dict: Various differences between the images if any:
@@ -57,8 +240,15 @@ def gen_diff_image(base, head, diff=None, diff_path=None):
     echo4("* head size: {}".format(head.size))
     diff = None
     # draw = None
-    nochange_color = (0, 0, 0, 255)
     # if diff_path is not None:
+    if (diff_path is None) and (not make_diff):
+        result = diff_images(base, head, diff_size,
+                             nochange_color=nochange_color,
+                             pyramid_threshold=pyramid_threshold)
+        result['diff'] = {}
+        result['base_image'] = base
+        result['head_image'] = head
+        return result
     if diff is None:
         diff = Image.new('RGBA', diff_size, nochange_color)
         if diff_path is None:
@@ -74,7 +264,8 @@ def gen_diff_image(base, head, diff=None, diff_path=None):
     echo1("* diff size: {}".format(diff.size))
     echo4("Checking {} zone...".format(diff_size))
     result = diff_images(base, head, diff_size, diff=diff,
-                         nochange_color=nochange_color)
+                         nochange_color=nochange_color,
+                         pyramid_threshold=pyramid_threshold)
     result['diff'] = {}
     if diff_path is not None:
         diff_path = os.path.abspath(diff_path)
@@ -88,11 +279,113 @@ def gen_diff_image(base, head, diff=None, diff_path=None):
     return result
 
 
+def _rgba_rows(image, y0, y1):
+    # Get rows y0 to y1 of image as a (rows, w, 4) array (with 0 rows
+    # if image ends before y0).
+    import numpy as np
+    from channeltinker.ctnumpy import to_array
+    w, h = image.size
+    y1 = min(y1, h)
+    if y1 <= y0:
+        return np.zeros((0, w, 4), dtype=np.uint8)
+    return to_array(image.crop((0, y0, w, y1)).convert('RGBA'))
+
+
+def _diff_bands(base, head, size, tile_height, result, writer):
+    # Compare each band of rows for gen_diff_image_tiled, setting
+    # result['same'] and writing the diff rows to writer (if not None).
+    # Returns (total_diff, total_count) of all bands.
+    from channeltinker.ctnumpy import diff_arrays
+    w, h = size
+    add_color, del_color = get_diff_colors(nochange_color)
+    total_diff = 0.0
+    total_count = 0
+    for y in range(0, h, tile_height):
+        y1 = min(y + tile_height, h)
+        stats = diff_arrays(_rgba_rows(base, y, y1),
+                            _rgba_rows(head, y, y1),
+                            (w, y1 - y), nochange_color, add_color,
+                            del_color, need_colors=(writer is not None))
+        total_diff += stats['total_diff']
+        total_count += stats['total_count']
+        if stats['same'] is False:
+            result['same'] = False
+        elif result['same'] is None:
+            result['same'] = stats['same']
+        if writer is not None:
+            writer.write_rows(stats['colors'].tobytes())
+    return total_diff, total_count
+
+
+def gen_diff_image_tiled(base, head, diff_path=None, tile_height=256):
+    """Compare two images a band of rows at a time (like gen_diff_image).
+
+    Only one band of each image is converted to RGBA and compared at a
+    time, and the diff image is written to diff_path as a PNG while
+    it is generated, so there is never a full-size RGBA copy of base,
+    head or the diff in memory. The statistics of all bands are
+    combined, so 'same' and 'mean_diff' are the same as from
+    gen_diff_image.
+
+    PIL still decodes each source image once in its own mode (or maps
+    it from the file if it is uncompressed, such as most BMP files).
+    This requires numpy (See ENABLE_NUMPY in channeltinker).
+
+    Args:
+        base (Image): Any PIL image.
+        head (Image): Any PIL image.
+        diff_path (str, optional): Save the diff image (always PNG) here.
+            If None, only the statistics are calculated.
+        tile_height (int, optional): The number of rows per band.
+
+    Returns:
+        dict: See gen_diff_image (There is never a 'diff_image').
+    """
+    if not ENABLE_NUMPY:
+        raise RuntimeError("gen_diff_image_tiled requires numpy.")
+    from channeltinker.ctpng import PNGStreamWriter
+    w = max(base.size[0], head.size[0])
+    h = max(base.size[1], head.size[1])
+    result = _sizes_result(base, head)
+    del result['mean_diff']
+    result['same'] = None
+    if diff_path is not None:
+        diff_path = os.path.abspath(diff_path)
+        with PNGStreamWriter(diff_path, (w, h), mode='RGBA') as writer:
+            # ^ If a band fails, __exit__ doesn't hide the error with
+            #   a row count error.
+            total_diff, total_count = _diff_bands(
+                base, head, (w, h), tile_height, result, writer
+            )
+        result['diff']['path'] = diff_path
+        echo1("* saved \"{}\"".format(diff_path))
+    else:
+        total_diff, total_count = _diff_bands(
+            base, head, (w, h), tile_height, result, None
+        )
+    if total_count <= 0:
+        result['error'] = "WARNING: There were no pixels."
+    else:
+        result['mean_diff'] = float(total_diff) / float(total_count)
+    return result
+
+
 def diff_images_by_path(base_path, head_path, diff_path=None,
-                        raise_exceptions=False):
+                        raise_exceptions=False, same_only=False,
+                        quick=True, tile_height=None):
     """Compare two images. See gen_diff_image for further info.
 
-    This function only checks sanity then calls gen_diff_image.
+    This function checks sanity, then (if quick is True) checks whether
+    the images are identical from least to most costly:
+    - If the files have the same size and content hash, they are the
+      same without decoding any pixels.
+    - If the images have the same dimensions and decoded pixel hash
+      (See pixel_sha256), they are the same without comparing pixels.
+    Only if those checks fail is gen_diff_image called to compare
+    each pixel and calculate mean_diff. Results of identical images
+    have 'mean_diff' 0.0, and 'checked_by' says which check was used
+    ("file_sha256", "pixel_sha256", "size" (only if same_only), or
+    "diff_images").
 
     Args:
         base_path (str): Any image.
@@ -102,6 +395,19 @@ def diff_images_by_path(base_path, head_path, diff_path=None,
         raise_exceptions (bool, optional): Raise any exception instead
             of setting {'base': {"error": error}} or {'head': {"error":
             error}}
+        same_only (bool, optional): Only the 'same' verdict (and sizes)
+            are needed, so never generate a diff image, and if the
+            dimensions differ, don't compare pixels at all (in that
+            case there is no 'mean_diff').
+        quick (bool, optional): Check whether the files or the decoded
+            pixels are identical before comparing pixels (See above).
+            Set to False to always compare every pixel.
+        tile_height (int, optional): Compare this many rows at a time
+            using gen_diff_image_tiled, to save memory. By default,
+            that is only done (with 256 rows) for images with at least
+            tiled_min_pixels, and only if numpy is installed and
+            either diff_path is set or same_only is True (otherwise the
+            results must include the whole diff image).
 
     Raises:
         PIL.UnidentifiedImageError: If image can't be parsed by PIL.
@@ -178,4 +484,54 @@ def diff_images_by_path(base_path, head_path, diff_path=None,
     if result is not None:
         # Return an error.
         return result
-    return gen_diff_image(base, head, diff_path=diff_path)
+    if same_only:
+        diff_path = None
+    tiled = False
+    if ENABLE_NUMPY and ((diff_path is not None) or same_only):
+        w = max(base.size[0], head.size[0])
+        h = max(base.size[1], head.size[1])
+        if tile_height is not None:
+            tiled = True
+        elif w * h >= tiled_min_pixels:
+            tiled = True
+            tile_height = 256
+    if quick:
+        if ((os.path.getsize(base_path) == os.path.getsize(head_path))
+                and (file_sha256(base_path) == file_sha256(head_path))):
+            return gen_same_result(base, head, diff_path=diff_path,
+                                   checked_by="file_sha256")
+        if base.size == head.size:
+            if tiled:
+                same = (pixel_sha256(base, tile_height=tile_height)
+                        == pixel_sha256(head, tile_height=tile_height))
+            else:
+                # Decode once (See decodecache) so gen_diff_image and
+                #   later comparisons can reuse them:
+                base = open_rgba(base_path)
+                head = open_rgba(head_path)
+                same = pixel_sha256(base) == pixel_sha256(head)
+            if same:
+                return gen_same_result(base, head, diff_path=diff_path,
+                                       checked_by="pixel_sha256")
+    if tiled:
+        result = gen_diff_image_tiled(base, head, diff_path=diff_path,
+                                      tile_height=tile_height)
+        result['checked_by'] = "diff_images"
+        return result
+    if same_only:
+        result = _sizes_result(base, head)
+        del result['mean_diff']
+        if base.size != head.size:
+            result['same'] = False
+            result['checked_by'] = "size"
+            return result
+        stats = diff_images(base, head, base.size,
+                            nochange_color=nochange_color)
+        result['same'] = stats['same']
+        if 'mean_diff' in stats:
+            result['mean_diff'] = stats['mean_diff']
+        result['checked_by'] = "diff_images"
+        return result
+    result = gen_diff_image(base, head, diff_path=diff_path)
+    result['checked_by'] = "diff_images"
+    return result
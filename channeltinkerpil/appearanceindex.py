@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Keep an on-disk index of image signatures for findbyappearance.
+
+Each indexed file has a 64-bit difference hash (dhash) and a small RGBA
+thumbnail, keyed by path, mtime and size so that only new or changed
+files have to be decoded again. A query ranks every indexed image by the
+Hamming distance of its dhash, narrows that down using the thumbnails,
+then calls diff_images only for the best few candidates.
+"""
+from __future__ import print_function
+import heapq
+import os
+import sqlite3
+
+from PIL import Image, ImageFile
+import PIL
+
+from channeltinker import (
+    echo1,
+    echo2,
+    diff_images,
+)
+from channeltinkerpil.decodecache import open_rgba
+
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+# ^ See the same setting in findbyappearance.
+
+default_extensions = ['.png', '.jpg', '.bmp', '.jpeg']
+
+HASH_W = 8
+HASH_H = 8
+THUMB_SIZE = (8, 8)
+SIGNATURE_VERSION = 1
+# ^ Increase this if get_signature changes so old rows are replaced.
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    dhash INTEGER NOT NULL,
+    thumb BLOB NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_dimensions ON images (width, height);
+'''
+
+
+def get_signature(image, draft=False):
+    """Get the perceptual signature of an image.
+
+    Args:
+        image (Image): A PIL image.
+        draft (bool, optional): If image is a JPEG that isn't loaded
+            yet, decode it at a reduced size for speed. This changes
+            image.size, so only use it if image is discarded after.
+
+    Returns:
+        tuple(int,bytes): The 64-bit dhash (each bit is whether a pixel
+            in a 9x8 grayscale version is brighter than the pixel to
+            its right), and the RGBA bytes of an 8x8 thumbnail.
+    """
+    if draft:
+        image.draft('RGB', (HASH_W * 8, HASH_H * 8))
+    rgba = image.convert('RGBA')
+    gray = rgba.convert('L').resize((HASH_W + 1, HASH_H), Image.BILINEAR)
+    pixels = bytearray(gray.tobytes())
+    dhash = 0
+    for y in range(HASH_H):
+        row = y * (HASH_W + 1)
+        for x in range(HASH_W):
+            dhash <<= 1
+            if pixels[row + x] > pixels[row + x + 1]:
+                dhash |= 1
+    thumb = rgba.resize(THUMB_SIZE, Image.BILINEAR).tobytes()
+    return dhash, thumb
+
+
+def hamming(a, b):
+    """Count the bits that differ between two hashes."""
+    return bin(a ^ b).count('1')
+
+
+def thumb_distance(a, b):
+    """Get the mean difference (0 to 1) of two thumbnails' bytes."""
+    a = bytearray(a)
+    b = bytearray(b)
+    total = 0
+    for i in range(len(a)):
+        total += abs(a[i] - b[i])
+    return float(total) / (255.0 * len(a))
+
+
+def _to_sql_int(value):
+    # sqlite INTEGER is signed 64-bit.
+    if value >= (1 << 63):
+        return value - (1 << 64)
+    return value
+
+
+def _from_sql_int(value):
+    if value < 0:
+        return value + (1 << 64)
+    return value
+
+
+class AppearanceIndex(object):
+    """An index of image signatures stored in an sqlite database.
+
+    Args:
+        path (str): The database file (created if it doesn't exist).
+            Use ":memory:" for an index that is not saved.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_schema)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        cursor = self.connection.execute("SELECT COUNT(*) FROM images")
+        return cursor.fetchone()[0]
+
+    def update(self, dirPath, extensions=None, batch_size=500):
+        """Add new or changed images and remove missing ones.
+
+        Only files whose mtime or size changed since they were indexed
+        (or which were indexed by an older SIGNATURE_VERSION) are
+        decoded. Directories or files starting with "." are ignored.
+
+        Args:
+            dirPath (str): The directory to scan recursively.
+            extensions (list[str], optional): Lowercase file extensions
+                to index. Defaults to default_extensions.
+            batch_size (int, optional): Commit after this many changed
+                files so an interrupted scan keeps its progress.
+
+        Returns:
+            dict: The number of images 'added', 'updated', 'removed',
+                'unchanged', and 'failed' (unreadable).
+        """
+        if extensions is None:
+            extensions = default_extensions
+        dirPath = os.path.realpath(dirPath)
+        counts = {
+            'added': 0,
+            'updated': 0,
+            'removed': 0,
+            'unchanged': 0,
+            'failed': 0,
+        }
+        known = {}
+        prefix = os.path.join(dirPath, "")
+        cursor = self.connection.execute(
+            "SELECT path, mtime, size, version FROM images"
+            " WHERE substr(path, 1, ?) = ?",
+            (len(prefix), prefix),
+        )
+        for path, mtime, size, version in cursor:
+            known[path] = (mtime, size, version)
+        pending = 0
+        for parent, dirNames, fileNames in os.walk(dirPath):
+            dirNames[:] = [name for name in dirNames
+                           if not name.startswith(".")]
+            for name in fileNames:
+                if name.startswith("."):
+                    continue
+                if os.path.splitext(name)[1].lower() not in extensions:
+                    continue
+                subPath = os.path.join(parent, name)
+                try:
+                    stat = os.stat(subPath)
+                except OSError as ex:
+                    echo1("* Error reading {}: {}".format(subPath, ex))
+                    continue
+                old = known.pop(subPath, None)
+                if old == (stat.st_mtime, stat.st_size, SIGNATURE_VERSION):
+                    counts['unchanged'] += 1
+                    continue
+                try:
+                    image = Image.open(subPath)
+                    width, height = image.size
+                    dhash, thumb = get_signature(image, draft=True)
+                except (PIL.UnidentifiedImageError, OSError) as ex:
+                    echo1("* Error opening {}: {}".format(subPath, ex))
+                    counts['failed'] += 1
+                    if old is not None:
+                        known[subPath] = old  # Remove it below.
+                    continue
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO images VALUES"
+                    " (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (subPath, stat.st_mtime, stat.st_size,
+                     width, height, _to_sql_int(dhash),
+                     sqlite3.Binary(thumb), SIGNATURE_VERSION),
+                )
+                if old is None:
+                    counts['added'] += 1
+                else:
+                    counts['updated'] += 1
+                pending += 1
+                if pending >= batch_size:
+                    self.connection.commit()
+                    echo2("* indexed {} image(s)".format(
+                        counts['added'] + counts['updated']))
+                    pending = 0
+        for path in known:
+            self.connection.execute("DELETE FROM images WHERE path = ?",
+                                    (path,))
+            counts['removed'] += 1
+        self.connection.commit()
+        return counts
+
+    def query(self, image, limit=10, same_size=True, candidates=None,
+              rerank=None, dirPath=None):
+        """Find the indexed images that look the most like image.
+
+        Args:
+            image (Image): The image to find.
+            limit (int, optional): The maximum number of results.
+            same_size (bool, optional): Only consider images with the
+                same dimensions (like skipDifferentSize in
+                findbyappearance).
+            candidates (int, optional): How many of the closest dhashes
+                to compare by thumbnail. Defaults to limit*20 (at least
+                200).
+            rerank (int, optional): How many of the closest thumbnails
+                to compare fully using diff_images. Defaults to limit*2.
+                Set to 0 to skip diff_images (then results have no
+                'mean_diff').
+            dirPath (str, optional): Only find images in this directory
+                (or its subdirectories).
+
+        Returns:
+            list[dict]: The most similar first, each with 'path',
+                'hamming', 'thumb_diff' and (if compared by
+                diff_images) 'mean_diff'.
+        """
+        if candidates is None:
+            candidates = max(limit * 20, 200)
+        if rerank is None:
+            rerank = limit * 2
+        dhash, thumb = get_signature(image)
+        sql = "SELECT path, dhash FROM images"
+        conditions = []
+        params = []
+        if same_size:
+            conditions.append("width = ? AND height = ?")
+            params += list(image.size)
+        if dirPath is not None:
+            prefix = os.path.join(os.path.realpath(dirPath), "")
+            conditions.append("substr(path, 1, ?) = ?")
+            params += [len(prefix), prefix]
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        ranked = heapq.nsmallest(
+            candidates,
+            ((hamming(dhash, _from_sql_int(otherHash)), path)
+             for path, otherHash in self.connection.execute(sql, params)),
+        )
+        results = []
+        for distance, path in ranked:
+            otherThumb = self.connection.execute(
+                "SELECT thumb FROM images WHERE path = ?", (path,)
+            ).fetchone()[0]
+            results.append({
+                'path': path,
+                'hamming': distance,
+                'thumb_diff': thumb_distance(thumb, otherThumb),
+            })
+        results.sort(key=lambda result: (result['thumb_diff'],
+                                         result['hamming']))
+        if rerank < 1:
+            return results[:limit]
+        reranked = []
+        for result in results[:rerank]:
+            try:
+                head = open_rgba(result['path'])
+            except (PIL.UnidentifiedImageError, OSError) as ex:
+                echo1("* Error opening {}: {}".format(result['path'], ex))
+                continue
+            diff_size = (max(image.size[0], head.size[0]),
+                         max(image.size[1], head.size[1]))
+            diffMeta = diff_images(image, head, diff_size)
+            if diffMeta.get('error') is not None:
+                echo1("  * {}: {}".format(result['path'],
+                                          diffMeta['error']))
+                continue
+            result['mean_diff'] = diffMeta['mean_diff']
+            reranked.append(result)
+        reranked.sort(key=lambda result: result['mean_diff'])
+        return reranked[:limit]
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Share decoded RGBA images between channeltinkerpil tools.
+
+Images are keyed by (realpath, mtime, file size), so a file that
+changes on disk is decoded again. Decoded images are kept in memory
+up to a byte budget (least recently used first out). If a spill
+directory is set, images pushed out of memory are written there as raw
+RGBA and memory-mapped when needed again (also by later sessions), so
+they are never decoded twice.
+
+Images from the cache are shared, so treat them as read-only (copy
+one before drawing on it).
+"""
+from __future__ import print_function
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+from collections import OrderedDict
+
+from PIL import Image, ImageFile
+
+from channeltinker import (
+    echo2,
+)
+
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+# ^ See the same setting in channeltinkerpil.
+
+_SPILL_HEADER = struct.Struct("<4sII")
+# ^ magic, width, height (then width*height*4 bytes of RGBA)
+_SPILL_MAGIC = b'CTR1'
+
+
+class DecodeCache(object):
+    """Keep recently decoded RGBA images.
+
+    Args:
+        max_bytes (int, optional): Keep at most this many bytes of
+            decoded pixels in memory.
+        spill_dir (str, optional): Write images pushed out of memory to
+            this directory (created if necessary) and memory-map them
+            from there when they are needed again.
+    """
+    def __init__(self, max_bytes=256*1024*1024, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        # ^ {key: Image} in order from least to most recently used
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._images)
+
+    @staticmethod
+    def get_key(path):
+        """Get the cache key of a file.
+
+        Returns:
+            tuple: (realpath, mtime, file size)
+        """
+        realpath = os.path.realpath(path)
+        stat = os.stat(realpath)
+        return (realpath, stat.st_mtime, stat.st_size)
+
+    def _spill_path(self, key):
+        name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, name + ".rgba")
+
+    def _spill(self, key, image):
+        if not os.path.isdir(self.spill_dir):
+            os.makedirs(self.spill_dir)
+        path = self._spill_path(key)
+        if os.path.isfile(path):
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as stream:
+            stream.write(_SPILL_HEADER.pack(_SPILL_MAGIC, image.size[0],
+                                            image.size[1]))
+            stream.write(image.tobytes())
+        os.rename(tmp_path, path)
+        # ^ Rename so another process never maps a partial file.
+        echo2("* spilled {} to {}".format(key[0], path))
+
+    def _load_spilled(self, key):
+        if self.spill_dir is None:
+            return None
+        path = self._spill_path(key)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as stream:
+            mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, w, h = _SPILL_HEADER.unpack(mapped[:_SPILL_HEADER.size])
+        if (magic != _SPILL_MAGIC) or (len(mapped)
+                                       != _SPILL_HEADER.size + w * h * 4):
+            mapped.close()
+            return None
+        return Image.frombuffer('RGBA', (w, h),
+                                memoryview(mapped)[_SPILL_HEADER.size:],
+                                'raw', 'RGBA', 0, 1)
+        # ^ The image keeps a reference to the map, so the file is
+        #   mapped until the image is garbage collected.
+
+    def _add(self, key, image):
+        cost = image.size[0] * image.size[1] * 4
+        if cost > self.max_bytes:
+            if self.spill_dir is not None:
+                self._spill(key, image)
+            return
+        self._images[key] = image
+        self.used_bytes += cost
+        while self.used_bytes > self.max_bytes:
+            old_key, old_image = self._images.popitem(last=False)
+            self.used_bytes -= old_image.size[0] * old_image.size[1] * 4
+            if self.spill_dir is not None:
+                self._spill(old_key, old_image)
+
+    def get(self, path):
+        """Get the decoded pixels of an image file.
+
+        Args:
+            path (str): Any image file PIL can read.
+
+        Raises:
+            PIL.UnidentifiedImageError: If PIL can't read the file.
+            FileNotFoundError: If the file doesn't exist.
+
+        Returns:
+            Image: An RGBA image (read-only if it is memory-mapped, and
+                shared in any case, so don't change it).
+        """
+        key = DecodeCache.get_key(path)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+        image = self._load_spilled(key)
+        if image is not None:
+            with self._lock:
+                self.hits += 1
+            return image
+        image = Image.open(key[0]).convert('RGBA')
+        with self._lock:
+            self.misses += 1
+            if key not in self._images:
+                self._add(key, image)
+        return image
+
+    def clear(self):
+        """Forget every image in memory (spilled files are kept)."""
+        with self._lock:
+            self._images.clear()
+            self.used_bytes = 0
+
+
+default_cache = DecodeCache()
+# ^ The cache shared by channeltinkerpil tools (See open_rgba).
+
+
+def open_rgba(path, cache=None):
+    """Get a decoded RGBA image, decoding the file only if necessary.
+
+    Args:
+        path (str): Any image file PIL can read.
+        cache (DecodeCache, optional): Defaults to default_cache. To
+            change the budget or spill directory for every tool, set
+            attributes of default_cache.
+
+    Returns:
+        Image: See DecodeCache.get.
+    """
+    if cache is None:
+        cache = default_cache
+    return cache.get(path)
@@ -12,16 +12,42 @@ cd ~/minetest/games
 {cmd} ../bucket_game-200527 bucket_game | grep -v narrower | grep -v "[Ss]creenshot"
 # cspell:disable-next-line
 {cmd} ../bucket_game-200527 bucket_game --max-source-ratio .5 --exclude projects --exclude src --exclude etc --exclude 3d_armor --exclude signs_lib | grep -v narrower | grep -v "[Ss]creenshot"
+
+Write a report instead (one JSON object per line, as results arrive):
+{cmd} ../bucket_game-200527 bucket_game --report report.ndjson --jobs 0
+- --report <file>: The report file ("-" for standard output).
+- --jobs <count>: Compare in this many processes (0 for one per core).
+- --pixels: Also compare pixels of each pair (adds "same" and
+  "mean_diff"). Otherwise only image headers are read.
+
+Other options:
+- --size-cache <file>: Remember image sizes in this JSON file so
+  unchanged files don't have to be read next time.
+- --decode: Open each pair with diff_images_by_path instead of only
+  reading sizes from the file headers (not used with --report).
 '''
 # ^ where {cmd} is diffimagesratio if you did "pip install rotocanvas"
 #   (See instances of __doc__ below for how to display docstring above)
 from __future__ import print_function
+import json
 import sys
 import os
 # from PIL import ImageDraw
-# import json
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)
+
+import PIL
+from PIL import Image
 
 from channeltinkerpil import diff_images_by_path
+from channeltinker.ctsize import (
+    read_image_size,
+    SizeCache,
+)
 from channeltinker import (
     echo1,
     platformCmds,
@@ -63,7 +89,8 @@ def firstDifferentSubdirs(path1, path2):
 
 def showDiffRatioForImages(base_path, head_path, root=None, indent="",
                            max_source_ratio=None, skipDirNames=[],
-                           patchify=False, oldResults=None):
+                           patchify=False, oldResults=None,
+                           header_only=True, size_cache=None):
     '''Show images added or where ratio changed
     (but not images that were removed, because base_path isn't
     traversed, only checked for existing files and directories parallel
@@ -82,6 +109,11 @@ def showDiffRatioForImages(base_path, head_path, root=None, indent="",
             results['patch_commands'].
         oldResults (dict): Existing dict for combining results
             (if not None, used and modified for return).
+        header_only (bool): Read the sizes from the file headers
+            (See read_image_size in channeltinker.ctsize) instead of
+            using diff_images_by_path.
+        size_cache (SizeCache): Reuse sizes of files that haven't
+            changed (only used if header_only).
 
     Returns:
         dict: Info about differences, such as:
@@ -133,6 +165,8 @@ def showDiffRatioForImages(base_path, head_path, root=None, indent="",
                 skipDirNames=skipDirNames,
                 patchify=patchify,
                 oldResults=results,
+                header_only=header_only,
+                size_cache=size_cache,
             )
         else:
             changed = False
@@ -145,7 +179,17 @@ def showDiffRatioForImages(base_path, head_path, root=None, indent="",
                     raise ValueError("head and base are same file")
                 # imgResults = None
                 # if os.path.isfile(headSubPath):
-                imgResults = diff_images_by_path(baseSubPath, headSubPath)
+                if header_only:
+                    imgResults = {
+                        'base': _image_info(baseSubPath, size_cache),
+                        'head': _image_info(headSubPath, size_cache),
+                    }
+                else:
+                    imgResults = diff_images_by_path(
+                        baseSubPath, headSubPath, same_only=True,
+                    )
+                    # ^ same_only since only the sizes are used, so
+                    #   unchanged files are skipped via their hashes.
                 # else:
                 #     print(indent+"- [ ] doesn't exist: {}"
                 #           .format(headSubPath))
@@ -207,13 +251,242 @@ def showDiffRatioForImages(base_path, head_path, root=None, indent="",
     return results
 
 
+def _walk_images(root, skipDirNames):
+    # Yield paths relative to root of images with an extension in
+    # checkDotTypes (skipping names starting with "." and skipDirNames).
+    for parent, dirNames, fileNames in os.walk(root):
+        dirNames[:] = sorted(name for name in dirNames
+                             if (not name.startswith("."))
+                             and (name not in skipDirNames))
+        for name in sorted(fileNames):
+            if name.startswith("."):
+                continue
+            if os.path.splitext(name)[1].lower() not in checkDotTypes:
+                continue
+            yield os.path.relpath(os.path.join(parent, name), root)
+
+
+def _pil_size(path):
+    # PIL only reads the header until pixels are used.
+    image = Image.open(path)
+    size = image.size
+    image.close()
+    return size
+
+
+def _image_info(path, size_cache=None):
+    # Get {'size', 'ratio'} from the header only, or {'error'}.
+    try:
+        if size_cache is not None:
+            size = size_cache.get_size(path, fallback=_pil_size)
+        else:
+            size = read_image_size(path)
+            if size is None:
+                size = _pil_size(path)
+    except (PIL.UnidentifiedImageError, OSError) as ex:
+        return {'error': str(ex)}
+    if (size is None) or (size[1] < 1):
+        return {'error': "There is no image size in {}".format(path)}
+    return {
+        'size': list(size),
+        'ratio': float(size[0]) / float(size[1]),
+    }
+
+
+def _pixel_fields(base_path, head_path):
+    # Get {'same'} and (if sizes match) {'mean_diff'}.
+    diff = diff_images_by_path(base_path, head_path, same_only=True)
+    fields = {'same': diff.get('same')}
+    if 'mean_diff' in diff:
+        fields['mean_diff'] = diff['mean_diff']
+    return fields
+
+
+def compare_image_pair(base_path, head_path, pixels=False,
+                       size_cache=None):
+    """Compare the aspect ratio (and optionally pixels) of two images.
+
+    Args:
+        base_path (str): The image in the source (older) tree.
+        head_path (str): The image in the destination (newer) tree.
+        pixels (bool, optional): Also compare pixels to get 'same' and
+            'mean_diff' (See diff_images_by_path). Otherwise only the
+            headers are read.
+        size_cache (SizeCache, optional): Reuse sizes of files that
+            haven't changed.
+
+    Returns:
+        dict: A report record with 'status' ("unreadable" if head can't
+            be read, "unreadable_base" if base can't, "wider",
+            "narrower", or "same_ratio"), 'base' and 'head' (each with
+            'size' and 'ratio', or 'error'), and if pixels is True and
+            both could be read, 'same' and (unless the sizes differ)
+            'mean_diff'.
+    """
+    record = {
+        'base': _image_info(base_path, size_cache),
+        'head': _image_info(head_path, size_cache),
+    }
+    if 'error' in record['head']:
+        record['status'] = "unreadable"
+        return record
+    if 'error' in record['base']:
+        record['status'] = "unreadable_base"
+        return record
+    if record['head']['ratio'] > record['base']['ratio']:
+        record['status'] = "wider"
+    elif record['head']['ratio'] < record['base']['ratio']:
+        record['status'] = "narrower"
+    else:
+        record['status'] = "same_ratio"
+    if pixels:
+        record.update(_pixel_fields(base_path, head_path))
+    return record
+
+
+def _compare_pixels_chunk(base_root, head_root, records):
+    for record in records:
+        record.update(_pixel_fields(os.path.join(base_root, record['path']),
+                                    os.path.join(head_root, record['path'])))
+    return records
+
+
+def iter_batch_results(base_root, head_root, jobs=1, pixels=False,
+                       skipDirNames=[], max_source_ratio=None,
+                       chunk_size=64, size_cache=None):
+    """Compare every image in two directory trees.
+
+    Each tree is walked only once. Sizes are read from file headers in
+    this process (See compare_image_pair). If pixels is True, pixels
+    of pairs that could be read are compared in a pool of processes.
+    Records are yielded as soon as they are ready (so not necessarily
+    in order).
+
+    Args:
+        base_root (str): The source (older) directory.
+        head_root (str): The destination (newer) directory.
+        jobs (int, optional): The number of worker processes (1 to
+            compare in this process, None for one per CPU core).
+        pixels (bool, optional): See compare_image_pair.
+        skipDirNames (list[str], optional): Exclude these directory
+            names.
+        max_source_ratio (float, optional): Skip "wider" and "narrower"
+            records where the source ratio is more than this.
+        chunk_size (int, optional): Send this many pairs to a worker at
+            once.
+        size_cache (SizeCache, optional): Reuse sizes of files that
+            haven't changed.
+
+    Yields:
+        dict: A record for each image in head_root (See
+            compare_image_pair) plus 'path' (relative to each root),
+            where 'status' is "new" if the image isn't in base_root.
+            There is also a record with the status "removed" for each
+            image only in base_root.
+    """
+    if max_source_ratio is not None:
+        max_source_ratio = float(max_source_ratio)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    base_rels = set(_walk_images(base_root, skipDirNames))
+
+    def keep(record):
+        if max_source_ratio is None:
+            return True
+        if record['status'] not in ("wider", "narrower"):
+            return True
+        return record['base']['ratio'] <= max_source_ratio
+
+    head_rels = list(_walk_images(head_root, skipDirNames))
+    common = []
+    for rel in head_rels:
+        if rel in base_rels:
+            common.append(rel)
+        else:
+            yield {'path': rel, 'status': "new"}
+    for rel in sorted(base_rels.difference(head_rels)):
+        yield {'path': rel, 'status': "removed"}
+
+    def work():
+        # Yield (record, None) for each record that is ready (needs no
+        #   pixel comparison) as soon as its headers are read, and
+        #   (None, chunk) for each list of records that still needs a
+        #   pixel comparison.
+        chunk = []
+        for rel in common:
+            record = compare_image_pair(os.path.join(base_root, rel),
+                                        os.path.join(head_root, rel),
+                                        size_cache=size_cache)
+            record['path'] = rel
+            if not keep(record):
+                continue
+            if (not pixels) or (record['status'].startswith("unreadable")):
+                yield record, None
+                continue
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield None, chunk
+                chunk = []
+        if chunk:
+            yield None, chunk
+
+    if jobs < 2:
+        for record, chunk in work():
+            if chunk is None:
+                yield record
+                continue
+            for record in _compare_pixels_chunk(base_root, head_root,
+                                                chunk):
+                yield record
+        return
+    max_pending = jobs * 4
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = set()
+        for record, chunk in work():
+            if chunk is None:
+                yield record
+                continue
+            pending.add(executor.submit(_compare_pixels_chunk, base_root,
+                                        head_root, chunk))
+            if len(pending) < max_pending:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    yield record
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    yield record
+
+
+def write_report(records, stream):
+    """Write each record as one line of JSON (NDJSON) as it arrives.
+
+    Args:
+        records (Iterable[dict]): Such as from iter_batch_results.
+        stream (file): An open text file (flushed after each line so
+            the report can be followed while it is generated).
+
+    Returns:
+        dict: The number of records of each status.
+    """
+    counts = {}
+    for record in records:
+        stream.write(json.dumps(record, sort_keys=True) + "\n")
+        stream.flush()
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+    return counts
+
+
 def main():
     base_path = None
     head_path = None
     prev_arg = None
     options = {}
     options['excludes'] = []
-    boolNames = ["patchify"]
+    boolNames = ["patchify", "pixels", "decode"]
     option_name = None
     for arg in sys.argv:
         if prev_arg is None:
@@ -225,6 +498,12 @@ def main():
                 option_name = "max_source_ratio"
             elif arg == "--exclude":
                 option_name = "excludes"
+            elif arg == "--report":
+                option_name = "report"
+            elif arg == "--jobs":
+                option_name = "jobs"
+            elif arg == "--size-cache":
+                option_name = "size_cache"
             elif argName in boolNames:
                 options[argName] = True
             else:
@@ -261,13 +540,41 @@ def main():
         echo1("* excluding directory names: {}".format(options['excludes']))
     else:
         echo1("* excluding no directory names")
+    size_cache = SizeCache(path=options.get('size_cache'))
+    if options.get('report') is not None:
+        jobs = int(options.get('jobs', 1))
+        if jobs < 1:
+            jobs = None  # Use every core.
+        records = iter_batch_results(
+            base_path,
+            head_path,
+            jobs=jobs,
+            pixels=options.get('pixels', False),
+            skipDirNames=options.get('excludes'),
+            max_source_ratio=options.get("max_source_ratio"),
+            size_cache=size_cache,
+        )
+        if options['report'] == "-":
+            counts = write_report(records, sys.stdout)
+        else:
+            with open(options['report'], 'w') as stream:
+                counts = write_report(records, stream)
+            echo1("* wrote {}".format(options['report']))
+        echo1("* {}".format(counts))
+        if size_cache.path is not None:
+            size_cache.save()
+        return
     results = showDiffRatioForImages(
         base_path,
         head_path,
         max_source_ratio=options.get("max_source_ratio"),
         skipDirNames=options.get('excludes'),
         patchify=options.get('patchify'),
+        header_only=not options.get('decode'),
+        size_cache=size_cache,
     )
+    if size_cache.path is not None:
+        size_cache.save()
     if options.get('patchify'):
         print("")
         print("# Prepatch commands (gather files from base)")
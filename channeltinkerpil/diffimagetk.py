@@ -5,7 +5,7 @@ import sys
 from collections import OrderedDict
 import tkinter as tk
 import PIL
-from PIL import ImageTk, ImageFile, Image
+from PIL import ImageTk, ImageFile
 
 if __name__ == "__main__":
     MODULE_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -15,6 +15,7 @@ if __name__ == "__main__":
 from channeltinkerpil import (
     gen_diff_image,
 )
+from channeltinkerpil.decodecache import open_rgba
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 # ^ Avoids issue #14 (GIMP images with
@@ -95,7 +96,7 @@ class DiffImageFrame(tk.Frame):
             #   show the real error instead.
             raise FileNotFoundError(path)
         try:
-            self.images[key] = Image.open(path)
+            self.images[key] = open_rgba(path)
             # ^ must not go out of scope or will be lost.
         except PIL.UnidentifiedImageError:
             return {
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 from __future__ import print_function
+import heapq
 import sys
 import os
 
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    wait,
+)
+
 # from channeltinkerpil import diff_images
 try:
     from channeltinker import (
@@ -22,6 +29,8 @@ except ModuleNotFoundError as ex:
 from PIL import Image, ImageFile
 import PIL
 
+from channeltinkerpil.decodecache import open_rgba
+
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 # ^ Avoids issue #14 (GIMP images with
@@ -32,13 +41,275 @@ ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 results = []
 
+default_extensions = ['.png', '.jpg', '.bmp', '.jpeg']
+
+_worker_image = None
+# ^ The image being searched for, loaded once per worker process by
+#   _init_worker.
+
+
+def iterImagePaths(dirPath, extensions=None):
+    """Recursively yield paths of images in a directory.
+
+    Directories or files starting with "." are skipped. Entries come
+    from os.scandir, so file types are known without extra stat calls
+    on most platforms.
+
+    Args:
+        dirPath (str): The directory to search.
+        extensions (list[str], optional): Lowercase extensions to
+            include. Defaults to default_extensions.
+    """
+    if extensions is None:
+        extensions = default_extensions
+    stack = [dirPath]
+    while stack:
+        parent = stack.pop()
+        try:
+            entries = sorted(os.scandir(parent), key=lambda e: e.name)
+        except OSError as ex:
+            echo1("* Error listing {}: {}".format(parent, ex))
+            continue
+        subDirs = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                subDirs.append(entry.path)
+            elif os.path.splitext(entry.name)[1].lower() in extensions:
+                yield entry.path
+        # Reverse so the stack visits subdirectories in sorted order:
+        stack.extend(reversed(subDirs))
+
+
+class SimilarResults(object):
+    """Keep only the most similar images found so far.
+
+    The worst kept result is at the top of a heap, so each push is
+    O(log(limit)) and the list never grows past limit.
+
+    Args:
+        limit (int, optional): The maximum number of results to keep.
+    """
+    def __init__(self, limit=10):
+        self.limit = limit
+        self._heap = []
+        # ^ (-mean_diff, path) so heap[0] is the least similar kept.
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    @property
+    def threshold(self):
+        """Get the mean_diff a new result must beat to be kept.
+
+        Returns:
+            float: The mean_diff of the least similar result kept, or
+                None if there are fewer than limit results (so any
+                result will be kept).
+        """
+        if len(self._heap) < self.limit:
+            return None
+        return -self._heap[0][0]
+
+    def push(self, mean_diff, path):
+        """Add a result if it is among the most similar so far.
+
+        Returns:
+            bool: True if the result was kept.
+        """
+        if self.limit < 1:
+            return False
+        entry = (-mean_diff, path)
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def extend(self, compared):
+        """Push each (mean_diff, path) tuple (See push)."""
+        for mean_diff, path in compared:
+            self.push(mean_diff, path)
+
+    def to_list(self):
+        """Get the results, most similar first.
+
+        Returns:
+            list[dict]: Each with 'mean_diff' and 'path' (like results
+                in populateVisuallySimilar).
+        """
+        best = sorted((-negDiff, path) for negDiff, path in self._heap)
+        return [{'mean_diff': mean_diff, 'path': path}
+                for mean_diff, path in best]
+
+
+def compareImageFiles(image, paths, skipDifferentSize=True,
+                      max_mean_diff=None):
+    """Compare an image to each image file in a list.
+
+    Args:
+        image (Image): The image to find.
+        paths (Iterable[str]): Image files to compare to image.
+        skipDifferentSize (bool, optional): Skip images where the size
+            differs (Only True is implemented).
+        max_mean_diff (float, optional): Skip images as soon as their
+            mean_diff can't be this or lower (See diff_images).
+
+    Returns:
+        list[tuple(float,str)]: (mean_diff, path) for each image that
+            could be compared and wasn't skipped.
+    """
+    if not skipDifferentSize:
+        raise NotImplementedError("skipDifferentSize must be True"
+                                  " because resizing isn't"
+                                  " implemented in compareImageFiles.")
+    compared = []
+    for subPath in paths:
+        try:
+            with Image.open(subPath) as candidate:
+                # ^ Only the header is read until the pixels are needed,
+                #   so skipping other sizes is cheap. Candidates are
+                #   rarely reused, so they don't use the decode cache.
+                if tuple(image.size) != tuple(candidate.size):
+                    continue
+                head = candidate.convert('RGBA')
+        except (PIL.UnidentifiedImageError, OSError) as ex:
+            echo1("* Error opening {}: {}".format(subPath, ex))
+            continue
+        diffMeta = diff_images(image, head, diff_size=image.size,
+                               max_mean_diff=max_mean_diff)
+        if diffMeta.get('pruned'):
+            continue
+        err = diffMeta.get('error')
+        if err is not None:
+            echo1("  * {}: {}".format(subPath, err))
+            continue
+        compared.append((diffMeta['mean_diff'], subPath))
+    return compared
+
+
+def find_similar(image, root, limit=10, extensions=None, prune=True):
+    """Find images of the same size that look the most like image.
+
+    This is reentrant (it keeps no module-level state), unlike
+    populateVisuallySimilar.
+
+    Args:
+        image (Union(str,Image)): The image to find (or its path).
+        root (str): The directory to search recursively (See
+            iterImagePaths).
+        limit (int, optional): The maximum number of results.
+        extensions (list[str], optional): See iterImagePaths.
+        prune (bool, optional): Once limit results are found, stop
+            comparing each image as soon as it can't beat the least
+            similar one kept (See max_mean_diff in diff_images).
+
+    Returns:
+        SimilarResults: The results (See SimilarResults.to_list).
+    """
+    if not hasattr(image, 'size'):
+        image = open_rgba(image)
+    image = image.convert('RGBA')
+    results = SimilarResults(limit=limit)
+    for subPath in iterImagePaths(root, extensions=extensions):
+        max_mean_diff = None
+        if prune:
+            max_mean_diff = results.threshold
+        results.extend(compareImageFiles(image, [subPath],
+                                         max_mean_diff=max_mean_diff))
+    return results
+
+
+def _init_worker(imagePath):
+    global _worker_image
+    _worker_image = open_rgba(imagePath)
+
+
+def _compare_worker(paths, max_mean_diff):
+    return compareImageFiles(_worker_image, paths,
+                             max_mean_diff=max_mean_diff)
+
+
+def findVisuallySimilarParallel(imagePath, dirPath, limit=10, jobs=None,
+                                extensions=None, chunk_size=32,
+                                prune=True):
+    """Find images that look like an image file using several processes.
+
+    The main process walks dirPath (See iterImagePaths) and sends
+    chunks of paths to a pool of worker processes, which decode and
+    compare them (See compareImageFiles). Only images with the same
+    size are compared. No module-level state is used, so this can
+    be called from several threads at once.
+
+    Args:
+        imagePath (str): The image to find.
+        dirPath (str): The directory to search recursively.
+        limit (int, optional): The maximum number of results.
+        jobs (int, optional): The number of worker processes. Defaults
+            to os.cpu_count(). If 1, compare in this process instead.
+        extensions (list[str], optional): See iterImagePaths.
+        chunk_size (int, optional): Send this many paths to a worker at
+            once (Larger chunks have less overhead, smaller ones
+            balance the load better).
+        prune (bool, optional): See find_similar. Each chunk is pruned
+            using the results known when it was sent.
+
+    Returns:
+        list[dict]: The most similar first, each with 'mean_diff' and
+            'path' (like results in populateVisuallySimilar).
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs < 2:
+        return find_similar(imagePath, dirPath, limit=limit,
+                            extensions=extensions, prune=prune).to_list()
+    results = SimilarResults(limit=limit)
+
+    def chunks():
+        chunk = []
+        for subPath in iterImagePaths(dirPath, extensions=extensions):
+            chunk.append(subPath)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    max_pending = jobs * 4
+    # ^ Bound the queue so the walk doesn't get far ahead of the
+    #   workers (and memory stays flat on huge trees).
+    with ProcessPoolExecutor(max_workers=jobs,
+                             initializer=_init_worker,
+                             initargs=(imagePath,)) as executor:
+        pending = set()
+        for chunk in chunks():
+            max_mean_diff = None
+            if prune:
+                max_mean_diff = results.threshold
+            pending.add(executor.submit(_compare_worker, chunk,
+                                        max_mean_diff))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results.extend(future.result())
+        for future in pending:
+            results.extend(future.result())
+    return results.to_list()
+
 
 def populateVisuallySimilar(imagePath, dirPath, limit=10,
                             image=None, skipDifferentSize=True,
                             extensions=['.png', '.jpg', '.bmp' '.jpeg']):
     '''
     Recursively get a list of metadata of images that are visually
-    similar to the image file at imagePath. Directories or files
+    similar to the image file at imagePath (Deprecated: use
+    find_similar, which doesn't need a global list). Directories or files
     starting with "." will be ignored. The most similar will be
     first in the list.
 
@@ -150,27 +421,57 @@ def populateVisuallySimilar(imagePath, dirPath, limit=10,
 
 
 def main():
-    if len(sys.argv) < 3:
+    imagePath = None
+    dirPath = None
+    indexPath = None
+    jobs = 1
+    option_name = None
+    for arg in sys.argv[1:]:
+        if arg.startswith("--"):
+            if arg == "--index":
+                option_name = "index"
+            elif arg == "--jobs":
+                option_name = "jobs"
+            else:
+                raise ValueError("Unknown option: {}".format(arg))
+        elif option_name == "index":
+            indexPath = arg
+            option_name = None
+        elif option_name == "jobs":
+            jobs = int(arg)
+            if jobs < 1:
+                jobs = None  # Use every core.
+            option_name = None
+        elif imagePath is None:
+            imagePath = arg
+        elif dirPath is None:
+            dirPath = arg
+        else:
+            raise ValueError("There was an extra sequential argument: {}"
+                             "".format(arg))
+    if option_name is not None:
+        raise ValueError("You must specify a value after --{}."
+                         "".format(option_name))
+    if dirPath is None:
         raise ValueError("You must specify a file and a directory.")
-    # [0] is the command.
-    imagePath = sys.argv[1]
     if not os.path.isfile(imagePath):
         raise ValueError("The first argument must be an image path.")
-    dirPath = sys.argv[2]
     if not os.path.isdir(dirPath):
         raise ValueError("The second argument must be a directory.")
     imagePath = os.path.realpath(imagePath)
     dirPath = os.path.realpath(dirPath)
-    # results = []  # passing it to populateVisuallySimilar doesn't work
-    # for some reason. The results list ends up being bigger than limit
-    # but not having the closest matches :huh?:.
-    global results
     echo1("* using imagePath: \"{}\"".format(imagePath))
     echo1("  * in: \"{}\"".format(os.path.dirname(imagePath)))
-    populateVisuallySimilar(
-        imagePath,
-        dirPath,
-    )
+    if indexPath is not None:
+        # Only decode new or changed files, then search the index.
+        from channeltinkerpil.appearanceindex import AppearanceIndex
+        with AppearanceIndex(indexPath) as index:
+            counts = index.update(dirPath)
+            echo1("* updated \"{}\": {}".format(indexPath, counts))
+            results = index.query(open_rgba(imagePath), dirPath=dirPath)
+    else:
+        results = findVisuallySimilarParallel(imagePath, dirPath,
+                                              jobs=jobs)
     if len(results) > 0:
         echo1("* The most similar images are shown first:")
         for result in results:
@@ -61,7 +61,7 @@ else:  # Python 2
 
 try:
     import PIL
-    from PIL import Image, ImageFile
+    from PIL import ImageFile
     ImageFile.LOAD_TRUNCATED_IMAGES = True  # Fix issue #14 GIMP-saved
 except ModuleNotFoundError as ex:
     print("{}".format(ex))
@@ -107,6 +107,7 @@ from rotocanvas import (  # noqa E402
 )
 
 from channeltinker.ctbinary import is_image_file  # noqa E402
+from channeltinkerpil.decodecache import open_rgba  # noqa E402
 
 HOME_BIN = os.path.join(sysdirs['HOME'], ".local", "bin")
 
@@ -895,7 +896,7 @@ class MainFrame(ttk.Frame):
                 if not os.path.isfile(path):
                     raise FileNotFoundError(path)
                 self.pimages.append(
-                    ImageTk.PhotoImage(Image.open(path))
+                    ImageTk.PhotoImage(open_rgba(path))
                 )
                 self.imageErrorVars[index].set("")
                 # self.imageLabels[index].configure(image=self.pimages[index])
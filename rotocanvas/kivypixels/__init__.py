@@ -27,6 +27,12 @@ except ImportError:
     pass
 # except Exception as e:
 # #   print("Could not finish importing pygame:"+str(e))
+ENABLE_PIL = False
+try:
+    from PIL import Image as PILImage
+    ENABLE_PIL = True
+except ImportError:
+    pass
 # from kivy.uix.image import Image
 from kivy.core.image import Image as CoreImage
 # try:
@@ -44,6 +50,7 @@ from rotocanvas import (
 )
 from rotocanvas.common import view_traceback
 from rotocanvas.pythonpixels import PPImage, PPColor, vec4_from_vec3
+from rotocanvas.pythonpixels import PPBrushCache, PPStroke
 from rotocanvas.pythonpixels import bufferToTupleStyleString
 
 
@@ -53,7 +60,29 @@ def get_ext_lower(path):
     return fileExtension.lower()
 
 
+def _load_with_pil(image, fileName):
+    """Load an image file into a KPImage using PIL if possible.
+
+    Returns:
+        bool: True if loaded, or False if PIL isn't installed or can't
+            read the file.
+    """
+    if not ENABLE_PIL:
+        return False
+    try:
+        with PILImage.open(fileName) as pilImage:
+            image.init_from_pil(pilImage)
+    except OSError:
+        return False
+        # ^ Including PIL.UnidentifiedImageError
+    return True
+
+
 def load_image(self, fileName):
+    if os.path.exists(fileName):
+        result = KPImage((1, 1))
+        if _load_with_pil(result, fileName):
+            return result
     result = None
     data = None
     participle = "(before initializing)"
@@ -115,6 +144,8 @@ def load_image(self, fileName):
 
 
 class KPImage(PPImage):
+    brushCache = PPBrushCache()
+    # ^ Tinted brushes shared by every KPImage (See setBrushColor)
 
     def __init__(self, size, byteDepth=4):
         super(KPImage, self).__init__(size, byteDepth=4)
@@ -122,6 +153,12 @@ class KPImage(PPImage):
         self.brushOriginalImage = None  # no scale, no color
         self._brush_color = (1.0, 1.0, 1.0, 1.0)
         self.brushImage = None
+        self.brushPremultiplied = None
+        # ^ brushImage with premultiplied alpha, for brushAt & strokeTo
+        self.brushSpacing = 0.25
+        # ^ The distance between dabs as a fraction of the brush width
+        self.brushScale = 1.0
+        self.stroke = PPStroke()
         self.brushPixels = None
         self.brushSurface = None
         self.brushTexture = None
@@ -130,17 +167,29 @@ class KPImage(PPImage):
         # print("setting brush color to " + str(color))
         self._brush_color = color
         if self.brushImage is not None:
-            self.brushImage.blit_copy(self.brushOriginalImage)
-            self.brushImage.tintByColor(self._brush_color)
+            self.brushImage, self.brushPremultiplied = self.brushCache.get(
+                self.brushFileName, self.brushOriginalImage,
+                self._brush_color, scale=self.brushScale,
+            )
+            # ^ Shared, so don't change them.
         else:
             raise ValueError("brushImage is None in setBrushColor"
                              " (you must call setBrushPath first)")
 
+    def setBrushScale(self, scale):
+        """Resize the brush (relative to the brush file)."""
+        self.brushScale = scale
+        self.setBrushColor(self._brush_color)
+
     def copyRuntimeVarsByRefFrom(self, kpimage):
         self.brushFileName = kpimage.brushFileName
         self.brushOriginalImage = kpimage.brushOriginalImage
         self._brush_color = kpimage._brush_color
         self.brushImage = kpimage.brushImage
+        self.brushPremultiplied = kpimage.brushPremultiplied
+        self.brushSpacing = kpimage.brushSpacing
+        self.brushScale = kpimage.brushScale
+        self.stroke = kpimage.stroke
         self.brushPixels = kpimage.brushPixels
         self.brushSurface = kpimage.brushSurface
         self.brushTexture = kpimage.brushTexture
@@ -164,6 +213,8 @@ class KPImage(PPImage):
 
         if os.path.isfile(path):
             self.brushFileName = path
+            self.brushCache.discard(path)
+            # ^ The file is read again, so it may have changed.
             self.brushOriginalImage = load_image(self, path)
             print("loading brush '" + path + "'")
             if self.brushOriginalImage is not None:
@@ -181,8 +232,12 @@ class KPImage(PPImage):
     def load(self, fileName):
         self.lastUsedFileName = fileName
         previousByteCount = self.byteCount
+        participle = "loading image using PIL"
         try:
-            if os.path.exists(fileName):
+            if os.path.exists(fileName) and _load_with_pil(self, fileName):
+                self.lastUsedFileName = fileName
+                # ^ init cleared it.
+            elif os.path.exists(fileName):
                 try:
                     # kivy 1.8.0 way:
                     participle = "loading Kivy 1.8 image from file"
@@ -397,142 +452,41 @@ class KPImage(PPImage):
                            texture_flipped=texture_flipped)
 
     def brushAt(self, centerX, centerY):
-        # normalSize = self.brushImage.get_norm_image_size()
-        # self.brushImage.size[0] = self.brushImage.size[0]
-        #     # int(normalSize[0])
-        # self.brushImage.size[1] = self.brushImage.size[1]
-        #     # int(normalSize[1])
-
-        # self.set_at(touch.x, touch.y, self._brush_color)
-        #     # dont' uncomment, since size of this is only set at
-        #     # Save now (not on_size)
-
-        # self.assumed_fbo_stride = (int(self.fbo.size[0]) *
-        #                            self.assumed_fbo_byteDepth)
-        # self.array_set_at_GRBA(self.fbo.pixels, assumed_fbo_stride,
-        #                        assumed_fbo_byteDepth, touch.x,
-        #                        touch.y, _brush_color)
-        # self.fbo.add(self._brush_color)
-        # brushPoint = Point(points=(atX, atY))
-        # self.fbo.add(brushPoint)
-        # brushLine = Line(
-        #     points=[centerX, centerY, centerX+1, centerY], width=1)
-        # self.fbo.add(brushLine)
-
-        # destX = centerX - self.brushImage.center_x
-        # destY = centerY - self.brushImage.center_y
-
-        destX = int(centerX) - int(self.brushImage.size[0] / 2)
-        destY = int(centerY) - int(self.brushImage.size[1] / 2)
-        # destLineStartX = destX
-
-        # internal offsets:
-        iB = self.bOffset
-        iG = self.gOffset
-        iR = self.rOffset
-        iA = self.aOffset
-
-        # brushBuffer_byteDepth = 4
-        # brushBuffer_stride = int(self.brushImage.size[0])
-        #                      * brushBuffer_byteDepth
-        src = self.brushImage.data  # self.brushPixels
-        # d_bi:
-        di = destY * self.stride + destX * self.byteDepth
-        dstLSI = di  # destLineStartIndex
-        if self.enableDebug:
-            print()
-            print("self.brushImage.size: {}"
-                  .format(self.brushImage.size))
-            print("brushImage.byteDepth: {}"
-                  .format(self.brushImage.byteDepth))
-            print("brushImage.stride: {}".format(self.brushImage.stride))
-            print("self.stride: {}".format(self.stride))
-            print("self.byteDepth: {}".format(self.byteDepth))
-            print("d_bi: {}".format(di))
-
-        srcLSI = 0
-        debugPixelWriteCount = 0
-        try:
-            for sourceY in range(0, int(self.brushImage.size[1])):
-                # destX = destLineStartX
-                di = dstLSI
-                si = srcLSI  # s_bi
-                for sourceX in range(0, int(self.brushImage.size[0])):
-                    sab = src[si + iA]  # src_a_i
-                    # src_a:
-                    a = sab / 255.0
-                    # src_inv_a:
-                    ia = 1.0 - a
-                    dab = self.data[di + iA]
-                    da = dab / 255.0
-
-                    # si = (sourceY * brushBuffer_stride
-                    #       + sourceX * brushBuffer_byteDepth)
-                    if (sab != 0):
-                        # calculate resulting alpha:
-                        # a_total_i = dab
-                        # if sab > dab:
-                        #     a_total_i = sab
-                        a_total_i = int(dab) + sab
-                        if a_total_i > 255:
-                            a_total_i = 255
-
-                        # do alpha formula on colors
-
-                        # account for dest (color transparent more):
-                        # (from here down, 'a' affects color not alpha)
-                        dia = 1.0 - da
-                        # use alpha formula to overlay 1.0 onto brush's
-                        # alpha as dest alpha approaches 0.0 (dia 1.0)
-                        # to remove black fringe around brush stroke
-                        # ba = da*a  # both alpha
-                        # bia = 1.0 - ba
-                        # a = da*a + dia*1.0
-                        # a = dia*a + dia*da
-                        # a = ia*a + a*da
-                        ia = 1.0 - a
-
-                        # self.data[di+iB] = int(round(
-                        #     ia*float(self.data[di+iB]) +
-                        #     a*float(src[si+iB])))
-                        # self.data[di+iG] = int(round(
-                        #     ia*float(self.data[di+iG]) +
-                        #     a*float(src[si+iG])))
-                        # self.data[di+iR] = int(round(
-                        #     ia*float(self.data[di+iR]) +
-                        #     a*float(src[si+iR])))
-                        # self.data[di+aOffset] = a_total_i
-
-                        res = [int(ia * float(self.data[di + iB])
-                                   + a * float(src[si + iB]) + .5),
-                               int(ia * float(self.data[di + iG])
-                                   + a * float(src[si + iG]) + .5),
-                               int(ia * float(self.data[di + iR])
-                                   + a * float(src[si + iR]) + .5),
-                               a_total_i]
-                        # brushBGRABytes = bytes(res)
-                        self.data[di + iB] = res[0]
-                        self.data[di + iG] = res[1]
-                        self.data[di + iR] = res[2]
-                        self.data[di + iA] = res[3]
-
-                        debugPixelWriteCount += 1
-                    # destX += 1
-                    di += self.byteDepth
-                    si += self.brushImage.byteDepth
-                # destY += 1
-                dstLSI += self.stride
-                srcLSI += self.brushImage.stride
-        except Exception as e:
-            print("Could not finish brushAt: {}".format(e))
-            print("    d_bi: {}"
-                  "; s_bi: {}"
-                  "; len(self.data): {}"
-                  "; len(brushPixels): {}"
-                  .format(di, si, len(self.data), len(src)))
-            raise
-        if self.enableDebug:
-            print("debugPixelWriteCount:" + str(debugPixelWriteCount))
+        """Draw the brush centered at a location.
+
+        Returns:
+            PPRect: The area of self that changed (clipped to the
+                image).
+        """
+        return self.stamp(self.brushPremultiplied, [(centerX, centerY)])
+
+    def beginStroke(self, x, y):
+        """Draw the brush at the start of a stroke (See strokeTo).
+
+        Returns:
+            PPRect: See brushAt.
+        """
+        self.stroke.spacing = max(
+            1.0, self.brushSpacing * self.brushImage.size[0]
+        )
+        return self.stamp(self.brushPremultiplied,
+                          self.stroke.begin(x, y))
+
+    def strokeTo(self, x, y):
+        """Draw dabs evenly spaced from the last point to this one.
+
+        The spacing is brushSpacing times the width of the brush, and
+        all of the dabs are drawn in one batch.
+
+        Returns:
+            PPRect: The area of self that changed (with a width and
+                height of 0 if the stroke didn't move far enough).
+        """
+        return self.stamp(self.brushPremultiplied,
+                          self.stroke.move_to(x, y))
+
+    def endStroke(self):
+        self.stroke.end()
 
     def drawKivyImage(self, thisKivyImage):
         maxAlpha = 0
@@ -12,12 +12,14 @@ except ImportError:
     exit(1)
 
 from rotocanvas.kivypixels import KPImage  # , load_image
+from kivy.clock import Clock
 from kivy.uix.widget import Widget
 from kivy.graphics import Fbo, ClearColor, ClearBuffers
 # from kivy.graphics.fbo import Fbo
 from kivy.properties import ObjectProperty, NumericProperty
 from kivy.graphics import Canvas, Color, Rectangle
 from rotocanvas.pythonpixels import ibgr_from_hex  # , vec4_from_vec3
+from rotocanvas.pythonpixels import PPDirtyRects
 
 __all__ = ('PixelWidget', )
 
@@ -64,6 +66,11 @@ class PixelWidget(Widget):
         # wait that all the instructions are in the canvas to set
         # texture
         self.texture = self.fbo.texture
+        self.dirtyRects = PPDirtyRects()
+        # ^ Areas of viewImage not yet uploaded to the texture
+        self._uploadTrigger = Clock.create_trigger(self.uploadDirtyRects)
+        # ^ Calling a trigger more than once before the next frame still
+        #   only runs it once.
 
         self.viewImage = KPImage(self.fbo.size)
         # Since in kivy's pygame.image.fromstring(
@@ -262,21 +269,48 @@ class PixelWidget(Widget):
             # else:
                 # self.setBrushColor(self.paletteWidget.pickedColor)
             # self.brushAt(touch.x-self.pos[0], touch.y-self.pos[1])
-            self.viewImage.brushAt(touch.x - self.pos[0],
-                                   touch.y - self.pos[1])
-            self.uploadBufferToTexture()
+            self.markDirty(self.viewImage.beginStroke(
+                touch.x - self.pos[0],
+                touch.y - self.pos[1],
+            ))
 
     def on_touch_move(self, touch):
         super(PixelWidget, self).on_touch_move(touch)
         # self.brushAt(touch.x-self.pos[0], touch.y-self.pos[1])
-        self.viewImage.brushAt(touch.x - self.pos[0],
-                               touch.y - self.pos[1])
-        self.uploadBufferToTexture()
+        self.markDirty(self.viewImage.strokeTo(touch.x - self.pos[0],
+                                               touch.y - self.pos[1]))
+
+    def on_touch_up(self, touch):
+        super(PixelWidget, self).on_touch_up(touch)
+        self.viewImage.endStroke()
+
+    def markDirty(self, rect):
+        """Upload an area of viewImage to the texture on the next frame.
+
+        Args:
+            rect (PPRect): The changed area (See KPImage.strokeTo).
+        """
+        self.dirtyRects.add(rect)
+        if len(self.dirtyRects):
+            self._uploadTrigger()
+
+    def uploadDirtyRects(self, dt=None):
+        """Upload only the areas passed to markDirty since last time."""
+        rects = self.dirtyRects.pop_all()
+        for rect in rects:
+            self.texture.blit_buffer(self.viewImage.get_bytes(rect),
+                                     size=(rect.width, rect.height),
+                                     pos=(rect.left, rect.top),
+                                     colorfmt='rgba', bufferfmt='ubyte')
+        if rects:
+            self.canvas.ask_update()
 
     def uploadBufferToTexture(self):
         # formerly used ImageData (decided to not use core.ImageData --
         # didn't seem to work in Kivy 1.8.0): https://groups.google.com/
         # forum/#!topic/kivy-users/3jYJtVk5vPQ
+        self.dirtyRects.pop_all()
+        # ^ The whole image is uploaded, so forget smaller areas.
         self.texture.blit_buffer(bytes(self.viewImage.data),
                                  colorfmt='rgba', bufferfmt='ubyte')
         # NOTE: blit_buffer has no return
@@ -2,6 +2,15 @@ from __future__ import print_function
 import math
 import time
 
+from collections import OrderedDict
+
+ENABLE_NUMPY = False
+try:
+    import numpy as np
+    ENABLE_NUMPY = True
+except ImportError:
+    pass
+
 _PYGAME_BLEND_ADD  = 0x1  # noqa: E221
 _PYGAME_BLEND_SUB  = 0x2  # noqa: E221
 _PYGAME_BLEND_MULT = 0x3  # noqa: E221
@@ -276,11 +285,217 @@ class PPRect:
                            - (screenRect.top + screenRect.height))
         if pastBottomCount > 0:
             itemRect.height -= pastBottomCount
-        if itemRect.width < 0:
-            itemRect.width = 0
+        if itemRect.height < 0:
+            itemRect.height = 0
 
         return itemRect
 
+    def union(self, other):
+        """Get the smallest rect that contains both (like pygame's)."""
+        left = min(self.left, other.left)
+        top = min(self.top, other.top)
+        right = max(self.left + self.width, other.left + other.width)
+        bottom = max(self.top + self.height, other.top + other.height)
+        return PPRect(left, top, right - left, bottom - top)
+
+
+class PPDirtyRects:
+    """Collect the changed areas of an image until they are drawn.
+
+    Two rects are merged whenever the rect around both is no bigger
+    than the two of them together (such as when one brush dab mostly
+    overlaps the last one), so each area is usually processed once
+    (such as uploaded to a texture once per frame no matter how many
+    dabs changed it).
+
+    Args:
+        max_count (int, optional): When there are more rects than this,
+            merge them all into one.
+    """
+    def __init__(self, max_count=8):
+        self.max_count = max_count
+        self.rects = []
+
+    def __len__(self):
+        return len(self.rects)
+
+    def add(self, rect):
+        """Add a changed area (empty rects are ignored).
+
+        Args:
+            rect (PPRect): The area (already clipped to the image).
+        """
+        if (rect is None) or (rect.width < 1) or (rect.height < 1):
+            return
+        rect = rect.copy()
+        merged = True
+        while merged:
+            merged = False
+            for i, old in enumerate(self.rects):
+                union = rect.union(old)
+                if (union.width * union.height
+                        <= rect.width * rect.height
+                        + old.width * old.height):
+                    # ^ Processing them separately would save nothing.
+                    del self.rects[i]
+                    rect = union
+                    merged = True
+                    break
+        self.rects.append(rect)
+        if len(self.rects) > self.max_count:
+            total = self.rects[0]
+            for old in self.rects[1:]:
+                total = total.union(old)
+            self.rects = [total]
+
+    def pop_all(self):
+        """Get the rects and start over.
+
+        Returns:
+            list(PPRect): Rects that don't overlap much (possibly
+                empty).
+        """
+        rects = self.rects
+        self.rects = []
+        return rects
+
+
+class PPStroke:
+    """Space brush dabs evenly along the path of a stroke.
+
+    Use begin for the first point (such as on touch down) and move_to
+    for each point after that. Both return the centers where dabs
+    should be drawn (See PPImage.stamp), so fast movement leaves no
+    gaps and slow movement doesn't draw many dabs in nearly the same
+    place.
+
+    Args:
+        spacing (float, optional): The distance between dabs in pixels.
+    """
+    def __init__(self, spacing=1.0):
+        self.spacing = spacing
+        self.last = None
+        self._travel = 0.0
+        # ^ How far the path went since the last dab
+
+    def begin(self, x, y):
+        """Start a stroke.
+
+        Returns:
+            list(tuple[float]): [(x, y)]
+        """
+        self.last = (x, y)
+        self._travel = 0.0
+        return [(x, y)]
+
+    def move_to(self, x, y):
+        """Continue the stroke (or begin it if it isn't started).
+
+        Returns:
+            list(tuple[float]): The dab centers along the segment from
+                the last point to (x, y), possibly none.
+        """
+        if self.last is None:
+            return self.begin(x, y)
+        spacing = max(float(self.spacing), 0.1)
+        x0, y0 = self.last
+        dx = x - x0
+        dy = y - y0
+        length = math.sqrt(dx * dx + dy * dy)
+        dabs = []
+        distance = spacing - self._travel
+        # ^ where the next dab goes (always > 0, so length is not 0)
+        while distance <= length:
+            factor = distance / length
+            dabs.append((x0 + dx * factor, y0 + dy * factor))
+            distance += spacing
+        self._travel = length - (distance - spacing)
+        self.last = (x, y)
+        return dabs
+
+    def end(self):
+        """Finish the stroke (the next move_to will begin a new one)."""
+        self.last = None
+
+
+class PPBrushCache:
+    """Keep recently used tinted brushes (least recently used first out).
+
+    Each entry holds the tinted brush and a premultiplied copy (See
+    PPImage.get_tinted and get_premultiplied), so switching back to a
+    color (such as when cycling through a palette) doesn't process the
+    brush again.
+
+    Args:
+        max_bytes (int, optional): Keep at most this many bytes of
+            brushes (counting both images of each entry).
+    """
+    def __init__(self, max_bytes=16*1024*1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._brushes = OrderedDict()
+        # ^ {(path, color, scale): (tinted, premultiplied)} in order from
+        #   least to most recently used
+
+    def __len__(self):
+        return len(self._brushes)
+
+    @staticmethod
+    def get_key(path, color, scale=1.0):
+        """Get the key of a brush variant.
+
+        Args:
+            color (tuple[float]): See PPImage.get_tinted (the alpha of a
+                3-long color is 1.0).
+        """
+        if len(color) < 4:
+            color = vec4_from_vec3(color, 1.0)
+        return (path, tuple(float(value) for value in color), float(scale))
+
+    def get(self, path, original, color, scale=1.0):
+        """Get a tinted brush, processing it only if necessary.
+
+        Args:
+            path (str): The file the brush was loaded from.
+            original (PPImage): The brush as loaded (not scaled or
+                tinted).
+            color (tuple[float]): See PPImage.get_tinted.
+            scale (float, optional): See PPImage.get_scaled.
+
+        Returns:
+            tuple(PPImage): The (tinted, premultiplied) brush (shared,
+                so don't change either).
+        """
+        key = PPBrushCache.get_key(path, color, scale=scale)
+        entry = self._brushes.get(key)
+        if entry is not None:
+            self._brushes.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        brush = original
+        if key[2] != 1.0:
+            brush = original.get_scaled(key[2])
+        tinted = brush.get_tinted(key[1])
+        entry = (tinted, tinted.get_premultiplied())
+        cost = tinted.byteCount * 2
+        if cost > self.max_bytes:
+            return entry
+        self._brushes[key] = entry
+        self.used_bytes += cost
+        while self.used_bytes > self.max_bytes:
+            _, old = self._brushes.popitem(last=False)
+            self.used_bytes -= old[0].byteCount * 2
+        return entry
+
+    def discard(self, path):
+        """Forget every variant of a brush (such as after reloading it).
+        """
+        for key in [key for key in self._brushes if key[0] == path]:
+            self.used_bytes -= self._brushes.pop(key)[0].byteCount * 2
+
 
 hex_ints = {'0': 0, '1': 1, '2': 2, '3': 3,
             '4': 4, '5': 5, '6': 6, '7': 7,
@@ -443,25 +658,227 @@ def bufferToTupleStyleString(data, start, count):
     return returnString
 
 
+def _byte_array(data):
+    """Get a flat uint8 view of a buffer such as a bytearray.
+
+    Returns:
+        numpy.ndarray: The view (not a copy), or None if NumPy isn't
+            installed or data doesn't support the buffer protocol.
+    """
+    if not ENABLE_NUMPY:
+        return None
+    try:
+        return np.frombuffer(data, dtype=np.uint8)
+    except (TypeError, ValueError):
+        return None
+
+
+def _clip_blit_rect(dst_size, src_size, dstX, dstY, srcX, srcY, w, h):
+    """Clip a blit to the destination and source images.
+
+    Returns:
+        tuple(int): (dstX, dstY, srcX, srcY, w, h) where w and h are 0
+            if nothing overlaps.
+    """
+    shift = max(0, -dstX, -srcX)
+    dstX += shift
+    srcX += shift
+    w = min(w - shift, dst_size[0] - dstX, src_size[0] - srcX)
+    shift = max(0, -dstY, -srcY)
+    dstY += shift
+    srcY += shift
+    h = min(h - shift, dst_size[1] - dstY, src_size[1] - srcY)
+    if (w <= 0) or (h <= 0):
+        return dstX, dstY, srcX, srcY, 0, 0
+    return dstX, dstY, srcX, srcY, w, h
+
+
+_BLEND_OPS = {
+    _PYGAME_BLEND_RGB_ADD: (_PYGAME_BLEND_ADD, False),
+    _PYGAME_BLEND_RGB_SUB: (_PYGAME_BLEND_SUB, False),
+    _PYGAME_BLEND_RGB_MULT: (_PYGAME_BLEND_MULT, False),
+    _PYGAME_BLEND_RGB_MIN: (_PYGAME_BLEND_MIN, False),
+    _PYGAME_BLEND_RGB_MAX: (_PYGAME_BLEND_MAX, False),
+    _PYGAME_BLEND_RGBA_ADD: (_PYGAME_BLEND_ADD, True),
+    _PYGAME_BLEND_RGBA_SUB: (_PYGAME_BLEND_SUB, True),
+    _PYGAME_BLEND_RGBA_MULT: (_PYGAME_BLEND_MULT, True),
+    _PYGAME_BLEND_RGBA_MIN: (_PYGAME_BLEND_MIN, True),
+    _PYGAME_BLEND_RGBA_MAX: (_PYGAME_BLEND_MAX, True),
+}
+# ^ {special_flags: (operation, whether it affects alpha)}
+
+
+class _PyMath(object):
+    """Provide the numpy functions the blend math uses, for numbers.
+
+    This lets the same formulas process one channel value at a time
+    (in the pure Python loops) or whole arrays (with numpy as xp), so
+    both give identical results.
+    """
+    minimum = staticmethod(min)
+    maximum = staticmethod(max)
+    rint = staticmethod(round)
+
+
+def _blend_op(op, d, s, xp):
+    """Combine channel values using a pygame-style blend operation.
+
+    Args:
+        op (int): _PYGAME_BLEND_ADD, _SUB, _MULT, _MIN or _MAX.
+        d (Union[int,numpy.ndarray]): The destination value(s).
+        s (Union[int,numpy.ndarray]): The source value(s).
+        xp (object): numpy for arrays (of a signed type wider than
+            uint8), otherwise _PyMath.
+    """
+    if op == _PYGAME_BLEND_ADD:
+        return xp.minimum(d + s, 255)
+    if op == _PYGAME_BLEND_SUB:
+        return xp.maximum(d - s, 0)
+    if op == _PYGAME_BLEND_MULT:
+        return (d * s + 255) >> 8
+    if op == _PYGAME_BLEND_MIN:
+        return xp.minimum(d, s)
+    return xp.maximum(d, s)
+
+
+def _composite(d, s, aI, integer_math, xp):
+    """Draw a straight (not premultiplied) alpha source over d.
+
+    Args:
+        aI (Union[int,numpy.ndarray]): The source alpha (0 to 255).
+        integer_math (bool): Premultiply the source by alpha using
+            integers, which rounds the exact result to the nearest
+            value (255 is odd, so there is never a tie). Otherwise use
+            floats and round halves to even, as _blit always did.
+        xp (object): See _blend_op.
+    """
+    if integer_math:
+        return (s * aI + d * (255 - aI) + 127) // 255
+    a = aI / 255.0
+    return xp.rint((1.0 - a) * d + a * s)
+
+
+def _premultiplied_over(d, s, aI, xp):
+    """Draw a premultiplied alpha source over d (using integers)."""
+    return xp.minimum(s + (d * (255 - aI) + 127) // 255, 255)
+    # ^ minimum only matters if the source isn't really premultiplied
+    #   (has a channel brighter than its alpha).
+
+
+def channel_pairs(dst_offsets, src_offsets):
+    """Decide which source channel each destination channel gets.
+
+    A source with no color channels (a byteDepth of 1, where the only
+    channel is at aOffset) is gray, so each color gets that channel.
+    A destination channel the source doesn't have (such as alpha when
+    converting from BGR) gets the fill value of swizzle_pixels.
+
+    Args:
+        dst_offsets (tuple): The (b, g, r, a) offsets of the destination
+            (None for each channel it doesn't have), such as from
+            PPImage.get_offsets.
+        src_offsets (tuple): The (b, g, r, a) offsets of the source.
+
+    Returns:
+        list(tuple): (dst_channel, src_channel) pairs for
+            swizzle_pixels, where src_channel is None for fill.
+    """
+    src_b, src_g, src_r, src_a = src_offsets
+    if (src_b is None) and (src_g is None) and (src_r is None):
+        src_b = src_g = src_r = src_a
+    pairs = []
+    for dst_channel, src_channel in zip(dst_offsets,
+                                        (src_b, src_g, src_r, src_a)):
+        if dst_channel is not None:
+            pairs.append((dst_channel, src_channel))
+    return pairs
+
+
+def swizzle_pixels(dst, dst_start, dst_depth, src, src_start, src_depth,
+                   count, pairs, fill=255):
+    """Copy consecutive pixels, putting each channel where it goes.
+
+    Each channel is copied for every pixel at once with one strided
+    slice assignment (a loop in C), so this is fast without NumPy.
+
+    Args:
+        dst (bytearray): The destination buffer.
+        dst_start (int): The byte index of the first pixel in dst.
+        dst_depth (int): Bytes per pixel in dst.
+        src (Union[bytes,bytearray]): The source buffer (it may be dst).
+        src_start (int): The byte index of the first pixel in src.
+        src_depth (int): Bytes per pixel in src.
+        count (int): How many pixels to copy.
+        pairs (list[tuple[int]]): (dst_channel, src_channel) offsets
+            such as from channel_pairs. If src_channel is None, set
+            the destination channel to fill.
+        fill (int, optional): The value for channels without a source.
+    """
+    if count < 1:
+        return
+    if src is dst:
+        src = bytes(src)
+        # ^ Don't read channels that were already overwritten.
+    if ((dst_depth == src_depth) and (len(pairs) == dst_depth)
+            and all(d == s for d, s in pairs)):
+        dst[dst_start:dst_start+count*dst_depth] = \
+            src[src_start:src_start+count*src_depth]
+        return
+    for dst_channel, src_channel in pairs:
+        d0 = dst_start + dst_channel
+        d1 = d0 + (count - 1) * dst_depth + 1
+        if src_channel is None:
+            dst[d0:d1:dst_depth] = bytearray([fill]) * count
+            continue
+        s0 = src_start + src_channel
+        dst[d0:d1:dst_depth] = src[s0:s0+(count-1)*src_depth+1:src_depth]
+
+
+def convert_rows(dst, dst_stride, dst_depth, dst_offsets,
+                 src, src_stride, src_depth, src_offsets, size,
+                 dst_start=0, src_start=0, fill=255):
+    """Convert an area between byte orders and depths (1, 3 or 4).
+
+    Args:
+        dst (bytearray): The destination buffer.
+        dst_stride (int): Bytes per row of dst.
+        dst_depth (int): Bytes per pixel of dst.
+        dst_offsets (tuple): See channel_pairs.
+        src (Union[bytes,bytearray]): The source buffer.
+        src_stride (int): Bytes per row of src.
+        src_depth (int): Bytes per pixel of src.
+        src_offsets (tuple): See channel_pairs.
+        size (tuple[int]): The (width, height) of the area to copy.
+        dst_start (int, optional): The byte index of the top left of
+            the area in dst.
+        src_start (int, optional): The byte index of the top left of
+            the area in src.
+        fill (int, optional): See swizzle_pixels.
+    """
+    w, h = size
+    pairs = channel_pairs(dst_offsets, src_offsets)
+    if src is dst:
+        src = bytes(src)
+    if (dst_stride == w * dst_depth) and (src_stride == w * src_depth):
+        # The rows are contiguous, so convert them all at once.
+        swizzle_pixels(dst, dst_start, dst_depth, src, src_start,
+                       src_depth, w * h, pairs, fill=fill)
+        return
+    for y in range(h):
+        swizzle_pixels(dst, dst_start + y * dst_stride, dst_depth,
+                       src, src_start + y * src_stride, src_depth, w,
+                       pairs, fill=fill)
+
+
 def range_copy_with_bo(dstImage, arrayDestStartByteIndex,
                        arrayDestEndExByteIndex,
                        srcImage, arraySourceStartByteIndex,
                        arraySourceEndExByteIndex):
     sourceByteDepth = srcImage.byteDepth
     destByteDepth = dstImage.byteDepth
-    dst = dstImage.data
-    src = srcImage.data
-    bOffset = srcImage.bOffset
-    gOffset = srcImage.gOffset
-    rOffset = srcImage.rOffset
-    aOffset = srcImage.aOffset
     maxByteDepth = dstImage.byteDepth
     if (srcImage.byteDepth < maxByteDepth):
         maxByteDepth = srcImage.byteDepth
-    # if (sourceByteDepth == destByteDepth):
-        # if (sourceByteDepth == 4):
-    sourceIndex = arraySourceStartByteIndex
-    destIndex = arrayDestStartByteIndex
     destRegionByteCount = (arrayDestEndExByteIndex
                            - arrayDestStartByteIndex)
     sourceRegionByteCount = (arraySourceEndExByteIndex
@@ -473,44 +890,22 @@ def range_copy_with_bo(dstImage, arrayDestStartByteIndex,
     minPixelCount = destRegionPixelCount
     if sourceRegionPixelCount < minPixelCount:
         minPixelCount = sourceRegionPixelCount
-    # if (destRegionPixelCount<=sourceRegionPixelCount):
-    if maxByteDepth >= 4:
-        for relativeIndex in range(0, minPixelCount):
-            dst[destIndex + dstImage.bOffset] = \
-                src[sourceIndex + bOffset]
-            dst[destIndex + dstImage.gOffset] = \
-                src[sourceIndex + gOffset]
-            dst[destIndex + dstImage.rOffset] = \
-                src[sourceIndex + rOffset]
-            dst[destIndex + dstImage.aOffset] = \
-                src[sourceIndex + aOffset]
-            destIndex += destByteDepth
-            sourceIndex += sourceByteDepth
-    elif maxByteDepth == 3:
-        for _ in range(0, minPixelCount):
-            dst[destIndex + dstImage.bOffset] = \
-                src[sourceIndex + bOffset]
-            dst[destIndex + dstImage.gOffset] = \
-                src[sourceIndex + gOffset]
-            dst[destIndex + dstImage.rOffset] = \
-                src[sourceIndex + rOffset]
-            destIndex += destByteDepth
-            sourceIndex += sourceByteDepth
+    if maxByteDepth >= 3:
+        pairs = [(dstImage.bOffset, srcImage.bOffset),
+                 (dstImage.gOffset, srcImage.gOffset),
+                 (dstImage.rOffset, srcImage.rOffset)]
+        if maxByteDepth >= 4:
+            pairs.append((dstImage.aOffset, srcImage.aOffset))
     elif maxByteDepth == 1:
-        destLastByte = destByteDepth - 1
-        sourceLastByte = sourceByteDepth - 1
-        destIndex += destLastByte
-        sourceIndex += sourceLastByte
-        # offset by byteDepth-1 so that gray will be written to RGBA
-        # image's alpha or vice versa
-        for _ in range(0, minPixelCount):
-            # dst[destIndex + dstImage.bOffset] = \
-            #     src[sourceIndex + bOffset]
-            dst[destIndex] = src[sourceIndex]
-            destIndex += destByteDepth
-            sourceIndex += sourceByteDepth
+        pairs = [(destByteDepth - 1, sourceByteDepth - 1)]
+        # ^ offset by byteDepth-1 so that gray will be written to RGBA
+        #   image's alpha or vice versa
     else:
         print("Not Yet Implemented in range_copy_with_bo")
+        return
+    swizzle_pixels(dstImage.data, arrayDestStartByteIndex, destByteDepth,
+                   srcImage.data, arraySourceStartByteIndex,
+                   sourceByteDepth, minPixelCount, pairs)
 
 
 def set_at_from_ivec_with_bo(
@@ -657,8 +1052,25 @@ def blit_copy(dst_data, dstStride,
 class PPImage:
     """A base class to unify processing of image subclasses.
     """
-    BLEND_MAX = _PYGAME_BLEND_MAX
     BLEND_ADD = _PYGAME_BLEND_ADD
+    BLEND_SUB = _PYGAME_BLEND_SUB
+    BLEND_MULT = _PYGAME_BLEND_MULT
+    BLEND_MIN = _PYGAME_BLEND_MIN
+    BLEND_MAX = _PYGAME_BLEND_MAX
+    BLEND_RGB_ADD = _PYGAME_BLEND_RGB_ADD
+    BLEND_RGB_SUB = _PYGAME_BLEND_RGB_SUB
+    BLEND_RGB_MULT = _PYGAME_BLEND_RGB_MULT
+    BLEND_RGB_MIN = _PYGAME_BLEND_RGB_MIN
+    BLEND_RGB_MAX = _PYGAME_BLEND_RGB_MAX
+    BLEND_RGBA_ADD = _PYGAME_BLEND_RGBA_ADD
+    BLEND_RGBA_SUB = _PYGAME_BLEND_RGBA_SUB
+    BLEND_RGBA_MULT = _PYGAME_BLEND_RGBA_MULT
+    BLEND_RGBA_MIN = _PYGAME_BLEND_RGBA_MIN
+    BLEND_RGBA_MAX = _PYGAME_BLEND_RGBA_MAX
+    BLEND_PREMULTIPLIED = _PYGAME_BLEND_PREMULTIPLIED
+    numpy_enable = ENABLE_NUMPY
+    # ^ Set numpy_enable to False (on the class or on an instance) to
+    #   process pixels using only Python loops (See get_array).
 
     def __init__(self, size, byteDepth=4):
         self.init(size, byteDepth, bufferAsRef=None)
@@ -708,6 +1120,52 @@ class PPImage:
                   " in PPImage init"
                   .format(byteDepth))
 
+    def init_from_pil(self, image):
+        """Replace the size and pixels with those of a PIL image.
+
+        The bytes are stored as R, G, B(, A), the same as the other
+        loaders and the 'rgba' texture upload. PIL's raw encoder packs
+        the pixels in small chunks that are copied straight into a
+        preallocated buffer, so there is no full-size intermediate copy
+        (as there would be with bytearray(image.tobytes())) and nothing
+        is processed one byte at a time. Custom offsets are reset by
+        init, as they are for any load.
+
+        Args:
+            image (PIL.Image.Image): Any image (it is converted to RGBA,
+                RGB or L to match self.byteDepth if necessary).
+        """
+        modes = {4: 'RGBA', 3: 'RGB', 1: 'L'}
+        if self.byteDepth not in modes:
+            raise ValueError("init_from_pil doesn't support byteDepth {}"
+                             .format(self.byteDepth))
+        mode = modes[self.byteDepth]
+        if image.mode != mode:
+            image = image.convert(mode)
+        image.load()
+        w, h = image.size
+        data = bytearray(w * h * self.byteDepth)
+        try:
+            from PIL import Image
+            encoder = Image._getencoder(mode, 'raw', mode)
+            encoder.setimage(image.im, (0, 0, w, h))
+        except (AttributeError, TypeError):
+            # ^ In case the encoder API of this PIL version differs
+            data[:] = image.tobytes('raw', mode)
+        else:
+            start = 0
+            bufsize = max(65536, w * self.byteDepth)
+            while True:
+                _, errcode, chunk = encoder.encode(bufsize)
+                data[start:start+len(chunk)] = chunk
+                start += len(chunk)
+                if errcode:
+                    break
+            if errcode < 0:
+                raise RuntimeError("PIL's raw encoder failed ({})"
+                                   .format(errcode))
+        self.init(image.size, self.byteDepth, bufferAsRef=data)
+
     def getNew(self, size, byteDepth=4):
         print("WARNING: subclass should implement getNew")
         return PPImage(size, byteDepth=byteDepth)
@@ -734,28 +1192,56 @@ class PPImage:
         )
         # return False
 
+    def get_array(self):
+        """Get the pixels as an array (if numpy_enable is True).
+
+        The array is a view of self.data (not a copy), so writing to
+        either one changes both. Channels are in the order of data, so
+        use the channel offsets (such as self.aOffset) as the last
+        index.
+
+        Returns:
+            numpy.ndarray: A uint8 array with the shape (height, width,
+                byteDepth), or None if numpy_enable is False, NumPy
+                isn't installed, or data isn't a buffer (then the
+                pure Python code is used by methods that call this).
+        """
+        if not self.numpy_enable:
+            return None
+        flat = _byte_array(self.data)
+        if flat is None:
+            return None
+        return np.ndarray((self.size[1], self.size[0], self.byteDepth),
+                          dtype=np.uint8, buffer=flat,
+                          strides=(self.stride, self.byteDepth, 1))
+
     def copy_flipped_v(self):
         result = self.getNew(self.size, self.byteDepth)
+        src_array = self.get_array()
+        dst_array = result.get_array()
+        if (src_array is not None) and (dst_array is not None):
+            dst_array[:] = src_array[::-1]
+            return result
+        row_size = self.size[0] * self.byteDepth
         srcY = self.size[1] - 1
-        dstI = 0
-        # source_slack = self.stride - self.size[0] * self.byteDepth
-        dest_slack = result.stride - result.size[0] * result.byteDepth
-        for _dest_y in range(0, self.size[1]):
+        for dstY in range(0, self.size[1]):
             srcI = srcY * self.stride
-            for _x in range(0, self.size[0]):
-                for _channel in range(0, self.byteDepth):
-                    result.data[dstI] = self.data[srcI]
-                    srcI += 1
-                    dstI += 1
-                # srcI += self.byteDepth
-                # dstI += translatedImage.byteDepth
+            dstI = dstY * result.stride
+            result.data[dstI:dstI+row_size] = self.data[srcI:srcI+row_size]
             srcY -= 1
-            dstI += dest_slack
         return result
 
     def get_size(self):
         return self.size
 
+    def get_offsets(self):
+        """Get the channel offsets (See channel_pairs).
+
+        Returns:
+            tuple: (bOffset, gOffset, rOffset, aOffset)
+        """
+        return (self.bOffset, self.gOffset, self.rOffset, self.aOffset)
+
     def print_dump(self):
         print(str(self.get_dict(data_enable=False)))
 
@@ -825,6 +1311,13 @@ class PPImage:
                         self.stride,
                         self.byteCount)
             )
+        arr = self.get_array()
+        if arr is not None:
+            pixels = arr[y, x:x+count]
+            pixels[:, self.bOffset] = b
+            pixels[:, self.gOffset] = g
+            pixels[:, self.rOffset] = r
+            return
         for i in range(count):
             self.data[b_i] = b
             self.data[g_i] = g
@@ -875,6 +1368,13 @@ class PPImage:
                         self.stride,
                         self.byteCount)
             )
+        arr = self.get_array()
+        if arr is not None:
+            pixels = arr[y:y+count, x]
+            pixels[:, self.bOffset] = b
+            pixels[:, self.gOffset] = g
+            pixels[:, self.rOffset] = r
+            return
         for i in range(count):
             self.data[b_i] = b
             self.data[g_i] = g
@@ -954,6 +1454,10 @@ class PPImage:
     # def DrawFromWithAlpha(self, sourceVariableImage, vec2):
 
     def getMaxChannelValueNotIncludingAlpha(self):
+        arr = self.get_array()
+        if (arr is not None) and arr.size:
+            return int(arr.max())
+            # ^ Like the loop below, this includes every channel.
         d_bi = 0  # destByteIndex
         d_lbi = d_bi  # destLineByteIndex
         returnMax = 0
@@ -978,6 +1482,9 @@ class PPImage:
         d_bi = 0
         d_lbi = d_bi
         returnMax = None
+        arr = self.get_array()
+        if (self.aOffset is not None) and (arr is not None) and arr.size:
+            return int(arr[:, :, self.aOffset].max())
         if (self.aOffset is not None):
             returnMax = 0
             for _y in range(0, self.size[1]):
@@ -1007,6 +1514,15 @@ class PPImage:
             self.fill_icolor(color[0], color[1], color[2])
 
     def fill_icolor(self, setRByte, setGByte, setBByte, setAByte):
+        arr = self.get_array()
+        if arr is not None:
+            for offset, value in ((self.bOffset, setBByte),
+                                  (self.gOffset, setGByte),
+                                  (self.rOffset, setRByte),
+                                  (self.aOffset, setAByte)):
+                if offset is not None:
+                    arr[:, :, offset] = value
+            return
         d_bi = 0
         d_lbi = d_bi
         setBytes = bytes([setBByte, setGByte, setRByte, setAByte])
@@ -1027,36 +1543,16 @@ class PPImage:
         '''Copy the source image to self.
 
         All of the parameters describe the source. The offsets are
-        channel offsets relative to the beginning of a pixel.
+        channel offsets relative to the beginning of a pixel. Channels
+        are converted using convert_rows (so a gray source fills every
+        color, and a source without alpha makes self opaque), and the
+        part of self outside of the source is filled with zeroes.
         '''
-        # this is much like LineCopy version, except instead of using
-        # python array slicing it uses static_range_copy_with_bo
         srcStride = int(srcStride)
         src_width = int(src_size[0])
         src_height = int(src_size[1])
         src_byteDepth = int(src_byteDepth)
-        # print("blit_copy_with_bo: self.byteDepth: " +
-        #       str(self.byteDepth))
-        # print("blit_copy_with_bo: src_byteDepth: " +
-        #       str(src_byteDepth))
         IsToFillRestWithZeroes = True
-        d_bi = 0
-        s_bi = 0  # sourceByteIndex
-
-        # force colorspace conversion:
-        if self.byteDepth >= 3:
-            if ((src_aOffset is not None)
-                    and (src_bOffset is None)
-                    and (src_gOffset is None)
-                    and (src_rOffset is None)):
-                src_bOffset = src_aOffset
-                src_gOffset = src_aOffset
-                src_rOffset = src_aOffset
-        else:
-            if src_bOffset < 0:
-                print("ERROR in blit_copy_with_bo: src_bOffset is {}"
-                      .format(src_bOffset))
-        # has_any = False
         msg = None
         try:
             _ = src_data[0]
@@ -1068,14 +1564,6 @@ class PPImage:
         if msg:
             raise ValueError(msg)
 
-        try:
-            src_data[0].get(" ")
-            msg = ("FATAL ERROR in"
-                   " blit_copy_with_bo:"
-                   " src_data contains dicts (should have values)")
-            raise TypeError(msg)
-        except AttributeError:
-            pass  # It's ok. it shouldn't have dicts.
         try:
             src_data[0].get(" ")
             msg = ("FATAL ERROR in blit_copy_with_bo:"
@@ -1089,155 +1577,32 @@ class PPImage:
                    " data in src_data"
                    " (each entry should be {})"
                    .format(type(src_data[0]), type(self.data[0])))
-            # " but value at" +
-            # str(s_bi + src_bOffset) +
-            # " is " +
-            # str(src_data[s_i]))
             raise TypeError(msg)
-        # Allow other value types such as float in case of float
-        # color.
-
-        if ((self.byteDepth >= 3)
-                and (src_byteDepth >= 3 or src_byteDepth == 1)):
-            dl_zeroes = None
-            if src_height < self.size[1]:
-                dl_zeroes = bytearray(self.stride)
-            if src_width == self.size[0]:
-                d_lpi = 0  # dest line pixel index
-                s_lpi = 0  # sourceLinePixelIndex
-                for dstY in range(0, self.size[1]):
-                    d_bi = d_lpi
-                    s_bi = s_lpi
-                    d_nlpi = d_lpi + self.stride
-                    # NextDestLinePixelIndex
-                    # s_nlpi = (s_lpi +
-                    #                             srcStride)
-                    if dstY < src_height:
-                        # NOTE: width difference is already handled in
-                        # outer "if" statement, for speed.
-                        # self.data[d_lpi:
-                        #           d_nlpi] = \
-                        #     src_data[s_lpi:
-                        #                  s_nlpi]
-                        # range_copy_with_bo(self.data,
-                        #     d_lpi,
-                        #     d_nlpi,
-                        #     src_data, s_lpi,
-                        #     s_nlpi, src_bOffset,
-                        #     src_gOffset, src_rOffset,
-                        #     src_aOffset)
-                        if self.byteDepth == 3:
-                            for dstX in range(0, self.size[0]):
-                                self.data[d_bi + self.bOffset] = \
-                                    src_data[s_bi + src_bOffset]
-                                self.data[d_bi + self.gOffset] = \
-                                    src_data[s_bi + src_gOffset]
-                                self.data[d_bi + self.rOffset] = \
-                                    src_data[s_bi + src_rOffset]
-                                d_bi += self.byteDepth
-                                s_bi += src_byteDepth
-                        elif self.byteDepth >= 4:
-                            for dstX in range(0, self.size[0]):
-                                self.data[d_bi + self.bOffset] = \
-                                    src_data[s_bi + src_bOffset]
-                                self.data[d_bi + self.gOffset] = \
-                                    src_data[s_bi + src_gOffset]
-                                self.data[d_bi + self.rOffset] = \
-                                    src_data[s_bi + src_rOffset]
-                                self.data[d_bi + self.aOffset] = \
-                                    src_data[s_bi + src_aOffset]
-                                d_bi += self.byteDepth
-                                s_bi += src_byteDepth
-                        elif self.byteDepth == 1:
-                            for dstX in range(0, self.size[0]):
-                                self.data[d_bi + self.aOffset] = \
-                                    src_data[s_bi + src_aOffset]
-                                d_bi += self.byteDepth
-                                s_bi += src_byteDepth
-                            # if (dstX<src_width):
-                            # for d_chan in range(0,self.byteDepth):
-                            # else:
-                            #     break
-                    elif IsToFillRestWithZeroes:
-                        self.data[d_lpi:d_nlpi] = dl_zeroes[:]
-                        # static_range_copy_with_bo(self.data,
-                        #     d_lpi,
-                        #     d_nlpi, dl_zeroes,
-                        #     0, self.stride, src_bOffset,
-                        #     src_gOffset, src_rOffset,
-                        #     src_aOffset)
-                    else:
-                        break
-                    d_lpi += self.stride
-                    s_lpi += srcStride
-            elif (src_width > self.size[0]):
-                d_lpi = 0
-                s_lpi = 0
-                for dstY in range(0, self.size[1]):
-                    d_nlpi = d_lpi + self.stride
-                    # s_nlpi = (s_lpi +
-                    #                             srcStride)
-                    # NextSourceLinePixelIndexLIMITED:
-                    s_nlpi_ltd = s_lpi + self.stride
-                    # intentionally self.stride,
-                    # to limit how much to get
-                    if dstY < src_height:
-                        # NOTE: width difference is already handled in
-                        # outer "if" statement, for speed.
-                        # self.data[d_lpi:d_nlpi] = \
-                        #     src_data[s_lpi:s_nlpi_ltd]
-                        range_copy_with_bo(self.data, d_lpi, d_nlpi,
-                                           src_data, s_lpi,
-                                           s_nlpi_ltd, src_bOffset,
-                                           src_gOffset, src_rOffset,
-                                           src_aOffset)
-                    elif IsToFillRestWithZeroes:
-                        self.data[d_lpi:d_nlpi] = dl_zeroes[:]
-                    else:
-                        break
-                    d_lpi += self.stride
-                    s_lpi += srcStride
-            else:  # elif (src_width < self.size[0]):
-                d_lpi = 0  # dest line pixel index
-                s_lpi = 0
-                pdl_zeroes = bytearray(self.stride - srcStride)
-                for dstY in range(0, self.size[1]):
-                    d_nlpi = d_lpi + self.stride
-                    # NextDestLinePixelIndexLIMITED:
-                    d_nlpi_ltd = d_lpi + srcStride
-                    # intentionally src stride to limit self stride
-                    # since source is smaller
-                    s_nlpi = s_lpi + srcStride
-                    # s_nlpi_ltd = \
-                    #     s_lpi + self.stride
-                    # intentionally self.stride, to limit what to get
-                    if dstY < src_height:
-                        # NOTE: width difference is already handled in
-                        # outer "if" statement, for speed.
-                        # self.data[d_lpi:
-                        #           d_nlpi_ltd] = \
-                        #     src_data[s_lpi:
-                        #                  s_nlpi]
-                        range_copy_with_bo(
-                            self.data,
-                            d_lpi,
-                            d_nlpi_ltd,
-                            src_data, s_lpi,
-                            s_nlpi, src_bOffset,
-                            src_gOffset, src_rOffset, src_aOffset)
-                        if IsToFillRestWithZeroes:
-                            self.data[d_nlpi_ltd:d_nlpi] = pdl_zeroes[:]
-                    elif IsToFillRestWithZeroes:
-                        self.data[d_lpi:d_nlpi] = dl_zeroes[:]
-                    else:
-                        break
-                    d_lpi += self.stride
-                    s_lpi += srcStride
-        else:
+
+        if ((self.byteDepth not in (1, 3, 4))
+                or (src_byteDepth not in (1, 3, 4))):
             print("Byte depth combination not implemented in"
                   " blit_copy_with_bo: src_byteDepth={}"
                   " to self.byteDepth={}"
                   .format(src_byteDepth, self.byteDepth))
+            return
+        w = min(src_width, self.size[0])
+        h = min(src_height, self.size[1])
+        convert_rows(self.data, self.stride, self.byteDepth,
+                     self.get_offsets(),
+                     src_data, srcStride, src_byteDepth,
+                     (src_bOffset, src_gOffset, src_rOffset, src_aOffset),
+                     (w, h))
+        if IsToFillRestWithZeroes:
+            row_used = w * self.byteDepth
+            pdl_zeroes = bytearray(self.stride - row_used)
+            if pdl_zeroes:
+                for y in range(h):
+                    start = y * self.stride + row_used
+                    self.data[start:start+len(pdl_zeroes)] = pdl_zeroes
+            self.data[h*self.stride:] = bytearray(
+                len(self.data) - h * self.stride
+            )
 
     def blit_copy(self, srcImage):
         blit_copy(self.data, self.stride,
@@ -1248,6 +1613,31 @@ class PPImage:
     def get_rect(self):
         return PPRect(0, 0, self.size[0], self.size[1])
 
+    def get_bytes(self, rect=None):
+        """Get the pixels of an area as contiguous rows.
+
+        Args:
+            rect (PPRect, optional): The area (must be inside of the
+                image). Defaults to the whole image.
+
+        Returns:
+            bytes: rect.height rows of rect.width pixels each, in the
+                same channel order as data.
+        """
+        if rect is None:
+            return bytes(self.data)
+        arr = self.get_array()
+        if arr is not None:
+            return arr[rect.top:rect.top+rect.height,
+                       rect.left:rect.left+rect.width].tobytes()
+        row_size = rect.width * self.byteDepth
+        start = rect.top * self.stride + rect.left * self.byteDepth
+        rows = []
+        for y in range(rect.height):
+            row_start = start + y * self.stride
+            rows.append(self.data[row_start:row_start+row_size])
+        return b''.join(rows)
+
     def get_width(self):
         return self.size[0]
 
@@ -1263,10 +1653,12 @@ class PPImage:
             self.blit(srcImage, centeredDest)
 
     # area: Rectangle (PythonPixels or Pygame) of source
-    #       (must fit inside dest, so normally use blit instead
-    #       to adjust this automatically)
     def _blit(self, srcImage, dstRect, area=None, special_flags=0,
-              alpha_flags=BLEND_MAX):
+              alpha_flags=BLEND_MAX, integer_math=False):
+        """Draw part of another image onto this one (See blit).
+
+        The area is clipped to both images.
+        """
         # The following notes marked PYGAME are from
         # <http://www.pygame.org/docs/ref/surface.html#pygame.Surface.blit>
         # Apr 30, 2015
@@ -1282,6 +1674,8 @@ class PPImage:
         # PYGAME: Pixel alphas will be ignored when blitting to an 8 bit
         #   Surface.
 
+        if srcImage is None:
+            raise ValueError('srcImage is None.')
         if area is None:
             area = srcImage.get_rect()
         srcRect = area
@@ -1295,9 +1689,6 @@ class PPImage:
             # has no len, already a rect, else should raise Exception below
             pass
 
-        if srcImage is None:
-            raise ValueError('srcImage is None.')
-
         if dstRect.width != srcRect.width:
             print("ERROR: _blit does not support scaling,"
                   " but width of dest is {}"
@@ -1309,119 +1700,360 @@ class PPImage:
                   " and height of source is {}"
                   .format(dstRect.height, srcRect.height))
 
-        srcX = srcRect.left
-        srcStartX = srcX
-        srcY = srcRect.top
-        # srcRight = srcX + srcRect.width
-        # srcBottom = srcY + srcRect.height
-        dstX = dstRect.left
-        dstStartX = dstX
-        dstY = dstRect.top
-        dstRight = dstX + dstRect.width
-        dstBottom = dstY + dstRect.height
         srcBD = srcImage.byteDepth
         dstBD = self.byteDepth
-        dst = self.data
-        src = srcImage.data
-        dstStride = self.stride
-        srcStride = srcImage.stride
-        # TODO: use incremental indices (dstI,etc) for performance
-        # dstLSI = dstY*dstStride + dstX*dstBD  # destLineStartIndex
-        # srcLSI = 0
-        dstBO = self.bOffset
-        dstGO = self.gOffset
-        dstRO = self.rOffset
-        dstAO = self.aOffset
-        srcBO = srcImage.bOffset
-        srcGO = srcImage.gOffset
-        srcRO = srcImage.rOffset
-        srcAO = srcImage.aOffset
+        src_has_alpha = (srcImage.aOffset is not None) and (srcBD >= 4)
+        dst_has_alpha = (self.aOffset is not None) and (dstBD >= 4)
+        if special_flags == 0:
+            if (alpha_flags != 0) and ((dstBD < 4) or (srcBD < 4)):
+                raise ValueError("alpha_flags only work when source and"
+                                 " dest have alpha")
+            if alpha_flags not in (0, PPImage.BLEND_ADD,
+                                   PPImage.BLEND_MAX):
+                raise ValueError("alpha_flags {} is not implemented"
+                                 .format(alpha_flags))
+        elif special_flags == _PYGAME_BLEND_PREMULTIPLIED:
+            if not src_has_alpha:
+                raise ValueError("BLEND_PREMULTIPLIED only works when"
+                                 " the source has alpha")
+        elif special_flags not in _BLEND_OPS:
+            raise ValueError("special_flags {} is not implemented"
+                             .format(special_flags))
+
+        dstX, dstY, srcX, srcY, w, h = _clip_blit_rect(
+            self.size, srcImage.size, dstRect.left, dstRect.top,
+            srcRect.left, srcRect.top,
+            min(dstRect.width, srcRect.width),
+            min(dstRect.height, srcRect.height))
+        result = PPRect(dstX, dstY, w, h)
+        if (w < 1) or (h < 1):
+            return result
 
         if self.enableDebug:
             print()
             print("srcImage.size:" + str(srcImage.size))
-            # print("brushImage.byteDepth:" + str(srcImage.byteDepth))
-            # print("brushImage.stride:" + str(srcImage.stride))
             print("self.stride:" + str(self.stride))
             print("self.byteDepth:" + str(self.byteDepth))
-            # print("dstI:" + str(dstI))
-
-        aTotalI = 255
-        if (special_flags != 0):
-            raise ValueError("special_flags is not implemented")
-        if (alpha_flags != 0) and ((dstBD < 4) or (srcBD < 4)):
-            raise ValueError("alpha_flags only work when source and"
-                             " dest have alpha")
-        while dstY < dstBottom:
-            # dstI = dstLSI
-            # srcI = srcLSI
-            dstX = dstStartX
-            srcX = srcStartX
-
-            if srcBD >= 4:
-                while dstX < dstRight:
-                    srcI = srcY * srcStride + srcX * srcBD
-                    aI = src[srcI + srcAO]
-                    a = float(aI) / 255.0
-                    dstI = dstY * dstStride + dstX * dstBD
-                    ia = 1.0 - a
-                    if aI != 0:
-                        dst[dstI + dstBO] = int(round(
-                            ia * dst[dstI + dstBO] + a * src[srcI + srcBO]
-                        ))
-                        dst[dstI + dstGO] = int(round(
-                            ia * dst[dstI + dstGO] + a * src[srcI + srcGO]
-                        ))
-                        dst[dstI + dstRO] = int(round(
-                            ia * dst[dstI + dstRO] + a * src[srcI + srcRO]
-                        ))
-                        if alpha_flags == PPImage.BLEND_ADD:
-                            aTotalI = int(dst[dstI + dstAO]) + aI
-                            if aTotalI > 255:
-                                aTotalI = 255
-                            dst[dstI + dstAO] = aI
-                        elif alpha_flags == PPImage.BLEND_MAX:
-                            dAI = dst[dstI + dstAO]
-                            if aI > dAI:
-                                dst[dstI + dstAO] = aI
-                    dstX += 1
-                    srcX += 1
+
+        color_pairs = []
+        for dst_channel, src_channel in ((self.bOffset, srcImage.bOffset),
+                                         (self.gOffset, srcImage.gOffset),
+                                         (self.rOffset, srcImage.rOffset)):
+            if dst_channel is None:
+                continue
+            if src_channel is None:
+                src_channel = srcImage.aOffset  # grayscale source
+            color_pairs.append((dst_channel, src_channel))
+
+        # Choose the formulas (each works on numbers or arrays, so
+        # both loops below give the same result):
+        if special_flags == 0:
+            if src_has_alpha:
+                def blend_color(d, s, a, xp):
+                    return _composite(d, s, a, integer_math, xp)
+            else:
+                def blend_color(d, s, a, xp):
+                    return s
+            if alpha_flags == PPImage.BLEND_ADD:
+                def blend_alpha(d, a, xp):
+                    return _blend_op(_PYGAME_BLEND_ADD, d, a, xp)
+            elif alpha_flags == PPImage.BLEND_MAX:
+                def blend_alpha(d, a, xp):
+                    return _blend_op(_PYGAME_BLEND_MAX, d, a, xp)
+            elif src_has_alpha:
+                blend_alpha = None
+            else:
+                def blend_alpha(d, a, xp):
+                    return a  # 255 (The source is opaque).
+        elif special_flags == _PYGAME_BLEND_PREMULTIPLIED:
+            def blend_color(d, s, a, xp):
+                return _premultiplied_over(d, s, a, xp)
+
+            def blend_alpha(d, a, xp):
+                return _premultiplied_over(d, a, a, xp)
+        else:
+            op, affects_alpha = _BLEND_OPS[special_flags]
+
+            def blend_color(d, s, a, xp):
+                return _blend_op(op, d, s, xp)
+
+            if affects_alpha:
+                def blend_alpha(d, a, xp):
+                    return _blend_op(op, d, a, xp)
             else:
-                while dstX < dstRight:
-                    dstI = dstY * dstStride + dstX * dstBD
-                    srcI = srcY * srcStride + srcX * srcBD
-                    dst[dstI + dstBO] = src[srcI + dstBO]
-                    dst[dstI + dstGO] = src[srcI + dstGO]
-                    dst[dstI + dstRO] = src[srcI + dstRO]
-                    if dstBD >= 4:
-                        dst[dstI + dstAO] = 255
-                    dstX += 1
-                    srcX += 1
-            # dstLSI += dstStride
-            # srcLSI += srcStride
-            dstY += 1
-            srcY += 1
-
-    def blit(self, srcImage, dstRect):
-        srcRect = srcImage.get_rect()
-        self_rect = self.get_rect()
-        if dstRect.left < self_rect.left:
-            diff = self_rect.left - dstRect.left
-            srcRect.left += diff
-            srcRect.width -= diff
-        if dstRect.top < self_rect.top:
-            diff = self_rect.top - dstRect.top
-            srcRect.top += diff
-            srcRect.height -= diff
-        final_rect = PPRect(dstRect.left, dstRect.top, dstRect.width,
-                            dstRect.height)
-        final_rect.clamp_ip(self_rect)
-        # srcRect = final_rect.copy()
-        # srcRect.move_ip(final_rect.left-destRct.left,
-        #                 final_Rect.top-dstRect.top)
-        # srcRect.clamp(srcRectOriginal)
-        if (final_rect.width > 0) and (final_rect.height > 0):
-            self._blit(srcImage, final_rect, srcRect)
+                blend_alpha = None
+        if not dst_has_alpha:
+            blend_alpha = None
+
+        dst_array = self.get_array()
+        src_array = None
+        if dst_array is not None:
+            src_array = srcImage.get_array()
+        if src_array is not None:
+            dst = dst_array[dstY:dstY+h, dstX:dstX+w]
+            src = src_array[srcY:srcY+h, srcX:srcX+w]
+            a = 255
+            if src_has_alpha:
+                a = src[:, :, srcImage.aOffset].astype(np.int32)
+            for dst_channel, src_channel in color_pairs:
+                dst[:, :, dst_channel] = blend_color(
+                    dst[:, :, dst_channel].astype(np.int32),
+                    src[:, :, src_channel].astype(np.int32), a, np)
+            if blend_alpha is not None:
+                dst[:, :, self.aOffset] = blend_alpha(
+                    dst[:, :, self.aOffset].astype(np.int32), a, np)
+            return result
+
+        dst = self.data
+        src = srcImage.data
+        dstStride = self.stride
+        srcStride = srcImage.stride
+        srcAO = srcImage.aOffset
+        dstAO = self.aOffset
+        a = 255
+        for row in range(h):
+            dstI = (dstY + row) * dstStride + dstX * dstBD
+            srcI = (srcY + row) * srcStride + srcX * srcBD
+            for _ in range(w):
+                if src_has_alpha:
+                    a = src[srcI + srcAO]
+                for dst_channel, src_channel in color_pairs:
+                    dst[dstI + dst_channel] = int(blend_color(
+                        dst[dstI + dst_channel], src[srcI + src_channel],
+                        a, _PyMath))
+                if blend_alpha is not None:
+                    dst[dstI + dstAO] = int(blend_alpha(dst[dstI + dstAO],
+                                                        a, _PyMath))
+                dstI += dstBD
+                srcI += srcBD
+        return result
+
+    def blit(self, srcImage, dstRect, area=None, special_flags=0,
+             alpha_flags=BLEND_MAX, integer_math=False):
+        """Draw another image onto this one (like pygame's blit).
+
+        Args:
+            srcImage (PPImage): The image to draw.
+            dstRect (Union[PPRect,tuple[int]]): Where to draw the top
+                left corner of area (it may be off of the image).
+            area (PPRect, optional): The part of srcImage to draw.
+                Defaults to all of it.
+            special_flags (int, optional): 0 to draw srcImage over
+                self using the alpha of srcImage (then alpha_flags
+                chooses the new alpha). Otherwise a blend mode:
+                BLEND_(RGB_|RGBA_)ADD, SUB, MULT, MIN or MAX, which
+                combine each color channel, and alpha too for
+                BLEND_RGBA_* (The alpha of the source is treated as
+                255 if it has none), or BLEND_PREMULTIPLIED to draw a
+                source with premultiplied alpha over self.
+            alpha_flags (int, optional): When special_flags is 0, set
+                the alpha of self to the total (BLEND_ADD, up to 255),
+                the maximum (BLEND_MAX), or leave it alone (0, which is
+                necessary if either image has no alpha).
+            integer_math (bool, optional): When special_flags is 0,
+                premultiply using integers (See _composite) instead of
+                floats.
+
+        Raises:
+            ValueError: If special_flags or alpha_flags isn't
+                implemented or doesn't work with the byteDepth of the
+                images.
+
+        Returns:
+            PPRect: The affected area of self (with a width and height
+                of 0 if the images don't overlap).
+        """
+        return self._blit(srcImage, dstRect, area=area,
+                          special_flags=special_flags,
+                          alpha_flags=alpha_flags,
+                          integer_math=integer_math)
+
+    def get_scaled(self, factor):
+        """Get a copy resized by nearest neighbor sampling.
+
+        Args:
+            factor (float): The scale (the new width and height are
+                rounded but at least 1).
+
+        Returns:
+            PPImage: A new image with the same channel order.
+        """
+        w, h = self.size
+        new_w = max(1, int(round(w * factor)))
+        new_h = max(1, int(round(h * factor)))
+        result = PPImage((new_w, new_h), byteDepth=self.byteDepth)
+        for name in ('bOffset', 'gOffset', 'rOffset', 'aOffset'):
+            setattr(result, name, getattr(self, name))
+        xs = [(2 * x + 1) * w // (2 * new_w) for x in range(new_w)]
+        ys = [(2 * y + 1) * h // (2 * new_h) for y in range(new_h)]
+        # ^ the source pixels under the center of each new pixel
+        arr = self.get_array()
+        result_array = result.get_array()
+        if (arr is not None) and (result_array is not None):
+            result_array[:] = arr[ys][:, xs]
+            return result
+        bd = self.byteDepth
+        dstI = 0
+        for y in ys:
+            for x in xs:
+                srcI = y * self.stride + x * bd
+                result.data[dstI:dstI+bd] = self.data[srcI:srcI+bd]
+                dstI += bd
+        return result
+
+    def get_tinted(self, color):
+        """Get a copy with each channel multiplied by a color.
+
+        Args:
+            color (tuple[float]): (b, g, r) or (b, g, r, a) from 0.0 to
+                1.0 (in the same order as KPImage.tintByColor).
+
+        Returns:
+            PPImage: A new image with the same size and channel order.
+        """
+        result = PPImage(self.size, byteDepth=self.byteDepth)
+        for name in ('bOffset', 'gOffset', 'rOffset', 'aOffset'):
+            setattr(result, name, getattr(self, name))
+        if len(color) < 4:
+            color = vec4_from_vec3(color, 1.0)
+        factors = {}
+        for offset, factor in zip((self.bOffset, self.gOffset,
+                                   self.rOffset, self.aOffset), color):
+            if offset is not None:
+                factors[offset] = factor
+        arr = self.get_array()
+        result_array = result.get_array()
+        if (arr is not None) and (result_array is not None):
+            for offset, factor in factors.items():
+                result_array[:, :, offset] = np.rint(arr[:, :, offset]
+                                                     * factor)
+            return result
+        for i in range(0, self.byteCount, self.byteDepth):
+            for offset, factor in factors.items():
+                result.data[i + offset] = int(round(self.data[i + offset]
+                                                    * factor))
+        return result
+
+    def get_premultiplied(self):
+        """Get a copy with each color multiplied by the alpha.
+
+        Returns:
+            PPImage: A new image with the same size and channel order
+                (for stamp or blit with BLEND_PREMULTIPLIED).
+        """
+        if (self.aOffset is None) or (self.byteDepth < 4):
+            raise ValueError("Only an image with alpha can be"
+                             " premultiplied.")
+        result = self.get_tinted((1.0, 1.0, 1.0, 1.0))
+        colors = (self.bOffset, self.gOffset, self.rOffset)
+        arr = result.get_array()
+        if arr is not None:
+            alpha = arr[:, :, self.aOffset].astype(np.int32)
+            for offset in colors:
+                arr[:, :, offset] = (arr[:, :, offset] * alpha + 127) // 255
+            return result
+        for i in range(0, self.byteCount, self.byteDepth):
+            alpha = result.data[i + self.aOffset]
+            for offset in colors:
+                result.data[i + offset] = (
+                    (result.data[i + offset] * alpha + 127) // 255
+                )
+        return result
+
+    def stamp(self, brush, centers, alpha_flags=BLEND_ADD):
+        """Draw a premultiplied brush centered at each point, in order.
+
+        Every dab is drawn over the previous ones, but the area around
+        all of them is read and written only once (See PPStroke to get
+        evenly spaced centers).
+
+        Args:
+            brush (PPImage): An image from get_premultiplied.
+            centers (list[tuple[float]]): (x, y) centers of dabs. The
+                top left of each dab is at int(x) - int(width / 2),
+                int(y) - int(height / 2) like KPImage.brushAt always
+                drew.
+            alpha_flags (int, optional): Set the alpha of self to the
+                total (BLEND_ADD, up to 255) or the maximum (BLEND_MAX)
+                of it and the alpha of each dab.
+
+        Raises:
+            ValueError: If alpha_flags isn't implemented or either
+                image has no alpha.
+
+        Returns:
+            PPRect: The affected area of self (with a width and height
+                of 0 if no dab overlaps self).
+        """
+        if alpha_flags == PPImage.BLEND_ADD:
+            alpha_op = _PYGAME_BLEND_ADD
+        elif alpha_flags == PPImage.BLEND_MAX:
+            alpha_op = _PYGAME_BLEND_MAX
+        else:
+            raise ValueError("alpha_flags {} is not implemented"
+                             .format(alpha_flags))
+        if ((self.aOffset is None) or (self.byteDepth < 4)
+                or (brush.aOffset is None) or (brush.byteDepth < 4)):
+            raise ValueError("stamp only works when the image and brush"
+                             " have alpha")
+        bw, bh = brush.size
+        dabs = []
+        result = None
+        for x, y in centers:
+            dab = _clip_blit_rect(self.size, brush.size,
+                                  int(x) - int(bw / 2),
+                                  int(y) - int(bh / 2), 0, 0, bw, bh)
+            if dab[4] < 1:
+                continue
+            dabs.append(dab)
+            rect = PPRect(dab[0], dab[1], dab[4], dab[5])
+            result = rect if result is None else result.union(rect)
+        if result is None:
+            return PPRect(0, 0, 0, 0)
+        pairs = ((self.bOffset, brush.bOffset),
+                 (self.gOffset, brush.gOffset),
+                 (self.rOffset, brush.rOffset),
+                 (self.aOffset, brush.aOffset))
+        arr = self.get_array()
+        brush_array = None
+        if arr is not None:
+            brush_array = brush.get_array()
+        if brush_array is not None:
+            region = arr[result.top:result.top+result.height,
+                         result.left:result.left+result.width]
+            work = region.astype(np.int32)
+            src = np.zeros((bh, bw, self.byteDepth), dtype=np.int32)
+            for dst_channel, src_channel in pairs:
+                src[:, :, dst_channel] = brush_array[:, :, src_channel]
+            # ^ Put the channels in the same order as self.
+            for dstX, dstY, srcX, srcY, w, h in dabs:
+                x = dstX - result.left
+                y = dstY - result.top
+                dst = work[y:y+h, x:x+w]
+                dab = src[srcY:srcY+h, srcX:srcX+w]
+                a = dab[:, :, self.aOffset]
+                alpha = _blend_op(alpha_op, dst[:, :, self.aOffset], a, np)
+                dst[:] = _premultiplied_over(dst, dab, a[:, :, None], np)
+                dst[:, :, self.aOffset] = alpha
+            region[:] = work
+            return result
+        dst = self.data
+        src = brush.data
+        for dstX, dstY, srcX, srcY, w, h in dabs:
+            for row in range(h):
+                dstI = (dstY + row) * self.stride + dstX * self.byteDepth
+                srcI = (srcY + row) * brush.stride + srcX * brush.byteDepth
+                for _ in range(w):
+                    a = src[srcI + brush.aOffset]
+                    for dst_channel, src_channel in pairs[:3]:
+                        dst[dstI + dst_channel] = _premultiplied_over(
+                            dst[dstI + dst_channel], src[srcI + src_channel],
+                            a, _PyMath)
+                    dst[dstI + self.aOffset] = _blend_op(
+                        alpha_op, dst[dstI + self.aOffset], a, _PyMath)
+                    dstI += self.byteDepth
+                    srcI += brush.byteDepth
+        return result
 
     def get_dump(self):
         result = ""
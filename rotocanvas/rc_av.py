@@ -1,19 +1,123 @@
 import av
 import hashlib
+import math
 import os
+import struct
+import sys
 import time
 import shutil
 
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from fractions import Fraction
 from logging import getLogger
 
+from rotocanvas import (
+    sysdirs,
+)
 
 logger = getLogger(__name__)
 
+INDEX_DIR = os.path.join(sysdirs['CACHES'], "rotocanvas", "keyframes")
+_INDEX_HEADER = struct.Struct("<4sQdI")
+# ^ magic, file size, file mtime, keyframe count (then 3 arrays of
+#   count little-endian int64: offsets, dts, pts)
+_INDEX_MAGIC = b'RCK1'
+_INDEX_KEYS = ('iframe_offsets', 'iframe_dts', 'iframe_pts')
+_INDEX_NONE = -2**63
+# ^ Stored in place of None (a missing pos, dts or pts)
 
-def cache_keyframes(video_path):
+
+def index_path(path_sha256):
+    """Get the path of the keyframe index sidecar of a video.
+
+    Args:
+        path_sha256 (str): The sha256 of the video's realpath (See
+            'path_sha256' in analyze_video).
+    """
+    return os.path.join(INDEX_DIR, path_sha256 + ".rcidx")
+
+
+def save_index(path_sha256, file_size, file_mtime, meta):
+    """Save the keyframe index of a video as a compact sidecar.
+
+    Args:
+        path_sha256 (str): See index_path.
+        file_size (int): The size of the video, so a changed video
+            isn't matched by load_index.
+        file_mtime (float): The modified time of the video (st_mtime).
+        meta (dict): Metadata containing the iframe_offsets,
+            iframe_dts and iframe_pts lists (See analyze_video).
+    """
+    if not os.path.isdir(INDEX_DIR):
+        os.makedirs(INDEX_DIR)
+    count = len(meta['iframe_pts'])
+    path = index_path(path_sha256)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as stream:
+        stream.write(_INDEX_HEADER.pack(_INDEX_MAGIC, file_size,
+                                        file_mtime, count))
+        for key in _INDEX_KEYS:
+            values = array('q', (_INDEX_NONE if value is None else value
+                                 for value in meta[key]))
+            if sys.byteorder != 'little':
+                values.byteswap()
+            stream.write(values.tobytes())
+    os.replace(tmp_path, path)
+    # ^ Replace so another process never reads a partial file.
+
+
+def load_index(path_sha256, file_size, file_mtime):
+    """Load a keyframe index saved by save_index.
+
+    Args:
+        path_sha256 (str): See index_path.
+        file_size (int): The current size of the video.
+        file_mtime (float): The current modified time of the video.
+
+    Returns:
+        dict: The iframe_offsets, iframe_dts and iframe_pts lists, or
+            None if there is no sidecar or the video changed since it
+            was saved.
+    """
+    path = index_path(path_sha256)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as stream:
+        data = stream.read()
+    if len(data) < _INDEX_HEADER.size:
+        return None
+    magic, size, mtime, count = _INDEX_HEADER.unpack_from(data)
+    if ((magic != _INDEX_MAGIC) or (size != file_size)
+            or (mtime != file_mtime)):
+        return None
+    if len(data) != _INDEX_HEADER.size + count * 8 * len(_INDEX_KEYS):
+        return None
+    index = {}
+    start = _INDEX_HEADER.size
+    for key in _INDEX_KEYS:
+        values = array('q')
+        values.frombytes(data[start:start+count*8])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        index[key] = [None if value == _INDEX_NONE else value
+                      for value in values]
+        start += count * 8
+    return index
+
+
+def cache_keyframes(video_path, meta=None):
     cache_path = video_path + "_rotocanvas"
     if not os.path.isdir(cache_path):
         os.makedirs(cache_path)
+    if meta is not None:
+        # If the index (See analyze_video) shows every keyframe is
+        # already saved, skip decoding them again.
+        keyframes = [pts for pts in meta['iframe_pts'] if pts is not None]
+        if keyframes and all(os.path.isfile(os.path.join(
+                cache_path, "{:04d}.jpg".format(pts))) for pts in keyframes):
+            return
     # See https://pyav.org/docs/stable/cookbook/basics.html#saving-keyframes
     with av.open(video_path) as container:
         # Signal that we only want to look at keyframes.
@@ -36,13 +140,28 @@ def cache_keyframes(video_path):
             )
 
 
-def analyze_video(video_path, callback):
+def analyze_video(video_path, callback, use_cache=True):
+    """Collect stream information and the keyframe index of a video.
+
+    Args:
+        video_path (str): Any video file PyAV can open.
+        callback (callable): Called with a dict such as {'ratio': 0.5}
+            to show progress of the demux pass.
+        use_cache (bool, optional): Load the keyframe index from the
+            sidecar in sysdirs['CACHES'] if the file didn't change
+            (See load_index) and save it there after a demux pass.
+
+    Returns:
+        dict: Metadata, including the open av container as
+            'container' (close it or pass the dict to FrameSource).
+    """
     prefix = "[rc_av.analyze_video] "
     # Initialize the meta dictionary to store video metadata
     meta = {
         'iframe_offsets': [],
         'iframe_dts': [],
         'iframe_pts': [],
+        'index_cached': False,
         'path_sha256': '',
         'video_length_frames': None,
         'video_length_timecode': None,
@@ -57,8 +176,10 @@ def analyze_video(video_path, callback):
     real_path = os.path.realpath(video_path)
     meta['path_sha256'] = hashlib.sha256(real_path.encode('utf-8')).hexdigest()
 
-    # Get the size of the file
-    file_size = os.path.getsize(real_path)
+    # Get the size and modified time of the file (to validate the index)
+    stat = os.stat(real_path)
+    file_size = stat.st_size
+    file_mtime = stat.st_mtime
 
     # Open the video file
     container = av.open(video_path)
@@ -101,62 +222,74 @@ def analyze_video(video_path, callback):
         meta['video_length_frames'] = video_stream.frames
         meta['video_length_timecode'] = str(video_stream.duration * video_stream.time_base) if video_stream.duration else None
 
-        # Set variables for callback tracking
-        update_time = None
-        processed_bytes = 0
-        offset = 0
-        prev_dts = None
-        # Iterate through packets in the video stream
-        for packet in container.demux(video_stream):
-            # av.packet.Packet
-            processed_bytes += packet.size
-            ratio = processed_bytes / file_size
-
-            # Update progress periodically
-            if update_time is None or time.time() - update_time > 1:
-                callback({'ratio': ratio})
-                update_time = time.time()
-
-            # NOTE: I-Frame is independent,
-            #   P-Frame is predictive (depends on previous)
-            #   B-Frame is bidirectional
-            #   (may depend on previous & next)
-
-            # For members of packet, see doc/development/av.md
-
-            # Check if the packet is a keyframe
-            is_frame_start = (prev_dts is None) or (prev_dts != packet.dts)
-            if packet.is_keyframe and is_frame_start:
-                # duration of frame in seconds is:
-                # packet.duration * packet.time_base
-                # Example: 512 * Fraction(1/15360) == .03... (30fps)
-                # meta['iframe_offsets'].append((packet.pos, offset))
-                # ^ store offset since pos may be None
-                # never matches, so ignore offset.
-                # if packet.pos is not None:
-                #     if offset != packet.pos:
-                #         logger.warning(
-                #             prefix+"offset {} will be changed to packet.pos {}"
-                #             "".format(offset, packet.pos))
-                #         offset = packet.pos
-                meta['iframe_offsets'].append(packet.pos)
-
-                if packet.dts is not None:
-                    # decoding timestamp in time_base units
-                    meta['iframe_dts'].append(packet.dts)
-                else:
-                    meta['iframe_dts'].append(None)
-
-                if packet.pts is not None:
-                    # presentation timestamp in time_base units
-                    # "time at which the packet should be shown to the user"
-                    # -<https://pyav.org/docs/stable/api/packet.html>
-                    meta['iframe_pts'].append(packet.pts)
-                else:
-                    meta['iframe_pts'].append(None)
-
-            offset += packet.size
-            prev_dts = packet.dts
+        index = None
+        if use_cache:
+            index = load_index(meta['path_sha256'], file_size, file_mtime)
+        if index is not None:
+            meta.update(index)
+            meta['index_cached'] = True
+        else:
+            # Set variables for callback tracking
+            update_time = None
+            processed_bytes = 0
+            offset = 0
+            prev_dts = None
+            # Iterate through packets in the video stream
+            for packet in container.demux(video_stream):
+                # av.packet.Packet
+                processed_bytes += packet.size
+                ratio = processed_bytes / file_size
+
+                # Update progress periodically
+                if update_time is None or time.time() - update_time > 1:
+                    callback({'ratio': ratio})
+                    update_time = time.time()
+
+                # NOTE: I-Frame is independent,
+                #   P-Frame is predictive (depends on previous)
+                #   B-Frame is bidirectional
+                #   (may depend on previous & next)
+
+                # For members of packet, see doc/development/av.md
+
+                # Check if the packet is a keyframe
+                is_frame_start = (prev_dts is None) or (prev_dts != packet.dts)
+                if packet.is_keyframe and is_frame_start:
+                    # duration of frame in seconds is:
+                    # packet.duration * packet.time_base
+                    # Example: 512 * Fraction(1/15360) == .03... (30fps)
+                    # meta['iframe_offsets'].append((packet.pos, offset))
+                    # ^ store offset since pos may be None
+                    # never matches, so ignore offset.
+                    # if packet.pos is not None:
+                    #     if offset != packet.pos:
+                    #         logger.warning(
+                    #             prefix+"offset {} will be changed to"
+                    #             " packet.pos {}"
+                    #             "".format(offset, packet.pos))
+                    #         offset = packet.pos
+                    meta['iframe_offsets'].append(packet.pos)
+
+                    if packet.dts is not None:
+                        # decoding timestamp in time_base units
+                        meta['iframe_dts'].append(packet.dts)
+                    else:
+                        meta['iframe_dts'].append(None)
+
+                    if packet.pts is not None:
+                        # presentation timestamp in time_base units
+                        # "time at which the packet should be shown to the
+                        # user"
+                        # -<https://pyav.org/docs/stable/api/packet.html>
+                        meta['iframe_pts'].append(packet.pts)
+                    else:
+                        meta['iframe_pts'].append(None)
+
+                offset += packet.size
+                prev_dts = packet.dts
+            if use_cache:
+                save_index(meta['path_sha256'], file_size, file_mtime,
+                           meta)
 
 
     # Ensure callback at the end
@@ -165,6 +298,307 @@ def analyze_video(video_path, callback):
     return meta
 
 
+def _ignore_progress(status):
+    pass
+
+
+def _round_half_up(value):
+    # Round a Fraction to the nearest int (round() of a Fraction rounds
+    # halves to even).
+    return int(math.floor(value + Fraction(1, 2)))
+
+
+class FrameSource(object):
+    """Decode chosen frames of a video in one forward pass.
+
+    Instead of decoding from the start of the file for each frame, seek
+    to the keyframe at or before each requested frame (using the index
+    from analyze_video) and decode forward from there. If the next
+    requested frame is in the same GOP (no keyframe between it and the
+    last decoded frame), keep decoding without seeking.
+
+    Args:
+        video_path (str): Any video file PyAV can open.
+        meta (dict, optional): The result of analyze_video for the same
+            file. If None, analyze_video is run (and its container is
+            reused).
+        rate (Fraction, optional): The frames per second used to number
+            frames (such as Fraction("30000/1001")). Defaults to the
+            average_rate of the video stream.
+        callback (callable, optional): The progress callback for
+            analyze_video (only used if meta is None).
+    """
+    def __init__(self, video_path, meta=None, rate=None, callback=None):
+        if meta is None:
+            if callback is None:
+                callback = _ignore_progress
+            meta = analyze_video(video_path, callback)
+        self.container = meta.pop('container', None)
+        if self.container is None:
+            self.container = av.open(video_path)
+        self.stream = self.container.streams.video[0]
+        self.time_base = self.stream.time_base
+        if rate is None:
+            rate = self.stream.average_rate or self.stream.guessed_rate
+        self.rate = Fraction(rate)
+        self.start_pts = self.stream.start_time or 0
+        self.keyframes = sorted(pts for pts in meta['iframe_pts']
+                                if pts is not None)
+        self.seeks = 0
+        self.decoded = 0
+        self._decoded_frames = None
+        # ^ The decode iterator (None until the first seek)
+        self._prev = None
+        # ^ The last frame at or before the last requested pts
+        self._next = None
+        # ^ A frame decoded past the last requested pts (not used yet)
+        self.on_frame = None
+        # ^ If set, it is called as on_frame(frame_number, frame) for
+        #   every decoded frame (such as to cache frames decoded on the
+        #   way to a requested one).
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._decoded_frames = None
+        self.container.close()
+
+    def frame_to_pts(self, frame_number):
+        """Get the pts (in stream time_base units) of a frame number."""
+        return self.start_pts + _round_half_up(
+            Fraction(frame_number) / self.rate / self.time_base
+        )
+
+    def pts_to_frame(self, pts):
+        """Get the number of the frame nearest to pts.
+
+        This is the inverse of frame_to_pts (which rounds to the
+        nearest time_base unit), so it rounds instead of truncating.
+
+        Args:
+            pts (int): A timestamp in time_base units.
+        """
+        return _round_half_up((pts - self.start_pts) * self.time_base
+                              * self.rate)
+
+    def keyframe_pts(self, pts):
+        """Get the pts of the last keyframe at or before pts.
+
+        Returns:
+            int: The keyframe pts, or None if the index is empty or pts
+                is before the first keyframe.
+        """
+        i = bisect_right(self.keyframes, pts) - 1
+        if i < 0:
+            return None
+        return self.keyframes[i]
+
+    def _position(self):
+        if self._next is not None:
+            return self._next.pts
+        if self._prev is not None:
+            return self._prev.pts
+        return None
+
+    def _must_seek(self, pts):
+        position = self._position()
+        if (self._decoded_frames is None) or (position is None):
+            return True
+        if self._prev is not None:
+            if pts < self._prev.pts:
+                return True
+                # ^ Decoding never goes backward.
+            # Otherwise, if pts is before self._next, self._prev is the
+            #   frame shown at pts (such as if the same frame is
+            #   requested again), so decoding continues from here.
+        elif pts < position:
+            return True
+        key_pts = self.keyframe_pts(pts)
+        return (key_pts is not None) and (key_pts > position)
+        # ^ Jumping to a later keyframe is cheaper than decoding the
+        #   rest of this GOP.
+
+    def _seek(self, pts):
+        key_pts = self.keyframe_pts(pts)
+        if key_pts is None:
+            key_pts = pts
+        self.container.seek(key_pts, stream=self.stream, backward=True,
+                            any_frame=False)
+        self._decoded_frames = self.container.decode(self.stream)
+        self._prev = None
+        self._next = None
+        self.seeks += 1
+
+    def get_frame(self, frame_number):
+        """Decode the frame shown at a frame number.
+
+        Calls for increasing frame numbers continue from where the last
+        one stopped, so calling this in order is a single pass.
+
+        Returns:
+            av.VideoFrame: The frame, or None if frame_number is past
+                the end of the video.
+        """
+        pts = self.frame_to_pts(frame_number)
+        if self._must_seek(pts):
+            self._seek(pts)
+        while True:
+            if self._next is None:
+                self._next = next(self._decoded_frames, None)
+                if self._next is None:
+                    break
+                    # ^ The end of the video
+                self.decoded += 1
+                if self._next.pts is None:
+                    self._next = None
+                    continue
+                if self.on_frame is not None:
+                    self.on_frame(self.pts_to_frame(self._next.pts),
+                                  self._next)
+            if self._next.pts > pts:
+                break
+            self._prev = self._next
+            self._next = None
+        if self._prev is None:
+            return self._next
+            # ^ pts is before the first frame, so use the first frame.
+        if self._next is None:
+            last_number = self.pts_to_frame(self._prev.pts)
+            if frame_number > last_number:
+                return None
+        return self._prev
+
+    def frames(self, frame_numbers):
+        """Decode several frames in one pass.
+
+        Args:
+            frame_numbers (Iterable[int]): Frame numbers in any order
+                (they are sorted, and duplicates are decoded once).
+
+        Yields:
+            tuple(int, av.VideoFrame): The frame number and frame, in
+                order of frame number. Frames past the end of the video
+                are skipped (with a warning).
+        """
+        for frame_number in sorted(set(frame_numbers)):
+            frame = self.get_frame(frame_number)
+            if frame is None:
+                logger.warning("Frame {} is past the end of the video."
+                               .format(frame_number))
+                continue
+            yield frame_number, frame
+
+
+class FrameServer(object):
+    """Serve decoded frames by frame number for scrubbing and playback.
+
+    Frames are decoded by a FrameSource (from the keyframe before each
+    frame), and every frame decoded on the way is kept as an RGB image
+    in a least recently used cache, so stepping through a GOP in either
+    direction decodes it only once.
+
+    Args:
+        video_path (str): Any video file PyAV can open.
+        meta (dict, optional): See FrameSource.
+        rate (Fraction, optional): See FrameSource.
+        max_bytes (int, optional): Keep at most this many bytes of
+            decoded images.
+        read_ahead (int, optional): How many frames prefetch decodes
+            past the current one in the playback direction.
+    """
+    def __init__(self, video_path, meta=None, rate=None,
+                 max_bytes=512*1024*1024, read_ahead=8):
+        self.source = FrameSource(video_path, meta=meta, rate=rate)
+        self.source.on_frame = self._on_frame
+        self.max_bytes = max_bytes
+        self.read_ahead = read_ahead
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        # ^ {frame_number: Image} from least to most recently used
+
+    def __len__(self):
+        return len(self._images)
+
+    def close(self):
+        self._images.clear()
+        self.used_bytes = 0
+        self.source.close()
+
+    @staticmethod
+    def _cost(image):
+        return image.size[0] * image.size[1] * len(image.getbands())
+
+    def _on_frame(self, frame_number, frame):
+        # frame_number is from pts_to_frame, which rounds to the nearest
+        # frame, so pts values that are a little early (such as 33 for
+        # frame 1 at 30000/1001 fps with a 1/1000 time_base) are cached
+        # under the right number.
+        if frame_number in self._images:
+            return
+        image = frame.to_image()
+        cost = FrameServer._cost(image)
+        if cost > self.max_bytes:
+            return
+        self._images[frame_number] = image
+        self.used_bytes += cost
+        while self.used_bytes > self.max_bytes:
+            _, old_image = self._images.popitem(last=False)
+            self.used_bytes -= FrameServer._cost(old_image)
+
+    def get(self, frame_number):
+        """Get a frame as an image.
+
+        Returns:
+            Image: The RGB image of the frame (shared with the cache, so
+                don't change it), or None if frame_number is out of
+                range.
+        """
+        if frame_number < 0:
+            return None
+        image = self._images.get(frame_number)
+        if image is not None:
+            self._images.move_to_end(frame_number)
+            self.hits += 1
+            return image
+        self.misses += 1
+        frame = self.source.get_frame(frame_number)
+        if frame is None:
+            return None
+        image = self._images.get(frame_number)
+        if image is None:
+            image = frame.to_image()
+            # ^ Too big for the cache, or the frame before the first
+            #   frame (so it is cached under another number).
+        return image
+
+    def prefetch(self, frame_number, direction=1):
+        """Decode upcoming frames so playback or stepping hits the cache.
+
+        Args:
+            frame_number (int): The frame being shown.
+            direction (int, optional): 1 to read ahead for playing or
+                stepping forward, -1 for stepping backward.
+        """
+        if direction < 0:
+            numbers = range(max(0, frame_number - self.read_ahead),
+                            frame_number)
+            # ^ Still in increasing order, so it is one forward pass.
+        else:
+            numbers = range(frame_number + 1,
+                            frame_number + 1 + self.read_ahead)
+        for number in numbers:
+            if number in self._images:
+                self._images.move_to_end(number)
+            elif self.source.get_frame(number) is None:
+                break
+
+
 if __name__ == "__main__":
     def print_progress(status):
         # print("Progress: {:.2%}".format(status['ratio']))
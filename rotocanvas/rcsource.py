@@ -5,6 +5,8 @@ import sys
 import subprocess
 import shutil
 import time
+
+from fractions import Fraction
 myName = "rcsource.py"
 try:
     from rcsettings import settings
@@ -23,6 +25,13 @@ from rotocanvas import (
     sysdirs,
 )
 
+ENABLE_AV = False
+try:
+    from rotocanvas import rc_av
+    ENABLE_AV = True
+except ImportError:
+    pass
+
 try:
     import cv2
     opencv_enabled = True
@@ -147,6 +156,44 @@ class RCSource:
         return get_frame_name(self._prefix, thisFrame,
                               minDigits, self._ext)
 
+    def extractFrames(self, frameNumbers, outDir, outFmt="jpg",
+                      qscale_v=2, minDigits=None):
+        """Extract frames of a video in one pass (requires PyAV).
+
+        Each frame is decoded by seeking to the keyframe before it and
+        decoding forward (See rc_av.FrameSource), so the cost depends
+        on the number of frames, not on how far into the video they
+        are.
+
+        Args:
+            frameNumbers (Iterable[int]): Frames to extract (numbered
+                using self.fpsStr).
+            outDir (str): Where to save each frame as
+                {paddedNum}.{outFmt}.
+            qscale_v (Optional[int]): See superResolutionAI (converted
+                to a roughly equivalent PIL JPEG quality).
+
+        Returns:
+            dict[int, str]: The path of each extracted frame.
+        """
+        if not os.path.isdir(outDir):
+            os.makedirs(outDir)
+        saveArgs = {}
+        if outFmt.lower() in ("jpg", "jpeg"):
+            saveArgs['quality'] = max(1, min(95, 100 - qscale_v * 3))
+        paths = {}
+        with rc_av.FrameSource(self.vidPath,
+                               rate=Fraction(self.fpsStr)) as source:
+            for thisFrame, frame in source.frames(frameNumbers):
+                paddedNum = str(int(thisFrame)).zfill(minDigits or 0)
+                outPath = os.path.join(outDir, paddedNum + "." + outFmt)
+                frame.to_image().save(outPath, **saveArgs)
+                print('* wrote "{}"'.format(outPath))
+                paths[thisFrame] = outPath
+            print("[extractFrames] decoded {} frame(s) with {} seek(s)"
+                  "".format(source.decoded, source.seeks))
+        return paths
+
     def superResolutionAI(self, onlyTimes=None, forceRatio=None,
                           outFmt="jpg", qscale_v=2, minDigits=None,
                           preserveDim=1, organizeMode=0,
@@ -234,6 +281,20 @@ class RCSource:
                     atList = self.getAllFrameNumbers()
         # framesPath = os.path.join(self._dir)
         print("[sr] isImageSequence: {}".format(self.isImageSequence()))
+        extracted = {}
+        if ENABLE_AV and not self.isImageSequence():
+            # Decode every original in one pass instead of running
+            # ffmpeg once per frame.
+            frameNumbers = [
+                FFMPEGTime(timeStr, self.fpsStrDecimal).getFrameNumber()
+                for timeStr in atList
+            ]
+            extracted = self.extractFrames(
+                frameNumbers,
+                os.path.join("{}_{}".format(self._vidPathNoExt, outFmt),
+                             "originals"),
+                outFmt=outFmt, qscale_v=qscale_v, minDigits=minDigits,
+            )
         for atS in atList:
             timeStr = None
             if self.isImageSequence():
@@ -265,7 +326,9 @@ class RCSource:
             if not os.path.isdir(outDir):
                 os.makedirs(outDir)
 
-            if not self.isImageSequence():
+            if thisFrame in extracted:
+                originalPath = extracted[thisFrame]
+            elif not self.isImageSequence():
                 # print("paddedNum: {}".format(paddedNum))
                 # print("outName: {}".format(outName))
                 # print("outDir: {}".format(outDir))
@@ -280,8 +343,10 @@ class RCSource:
                 # extract by frame number:
                 #   ffmpeg -i in.mp4 -vf select='eq(n\,100)+eq(n\,184)+eq(n\,213)'  # noqa: E501
                 #     -vsync 0 frames%d.jpg
-                cmdParts = [self.thisFFMpeg, "-y", "-i", self.vidPath, "-ss",
-                            timeStr, "-vframes", "1"]
+                cmdParts = [self.thisFFMpeg, "-y", "-ss", timeStr, "-i",
+                            self.vidPath, "-vframes", "1"]
+                # ^ -ss before -i seeks the input (to the keyframe
+                #   before timeStr) instead of decoding from the start.
                 oFLower = outFmt.lower()
                 if (oFLower == "jpg") or (oFLower == "jpeg"):
                     cmdParts.append("-qscale:v")
@@ -74,6 +74,9 @@ class ProjectFrame(ttk.Frame):
         root = self.parent
         self.photo = None
         self.image_instruction = None
+        self.frameServer = None
+        self.frameNumber = 0
+        self.playing = False
         self.seqPath = tk.StringVar()
         self.frameRate = tk.StringVar()
         self.result = tk.StringVar()
@@ -169,13 +172,33 @@ class ProjectFrame(ttk.Frame):
         self.parent.style.theme_use(name)
 
     def next(self):
-        pass
+        if self.frameServer is None:
+            return
+        self.showFrame(self.frameNumber + 1, direction=1)
 
     def prev(self):
-        pass
+        if self.frameServer is None:
+            return
+        if self.frameNumber > 0:
+            self.showFrame(self.frameNumber - 1, direction=-1)
 
     def play(self):
-        pass
+        if self.frameServer is None:
+            return
+        self.playing = not self.playing
+        self.play_button.config(text="Pause" if self.playing else "Play")
+        if self.playing:
+            self._playStep()
+
+    def _playStep(self):
+        if not self.playing:
+            return
+        if not self.showFrame(self.frameNumber + 1, direction=1):
+            self.play()
+            # ^ Stop at the end.
+            return
+        delay = int(round(1000 / self.frameServer.source.rate))
+        self.after(max(1, delay), self._playStep)
 
     def srFrame(self):
         video = self.project._videos[self.seqPath.get()]
@@ -276,36 +299,44 @@ class ProjectFrame(ttk.Frame):
     def openVideo(self, path, results_template=None):
         results = make_real(results_template)
         if ENABLE_AV:
-            cache = rc_av.cache_keyframes(path)
             meta = rc_av.analyze_video(path, self.onLoadProgress)
-            # collect and remove runtime data:
-            self.container = meta['container']
-            del meta['container']
-            raise NotImplementedError(meta)
-            # See analyze_video in docs/development
-            # Generate a picture (or use canvas directly?) to show video.
+            # ^ Loads the keyframe index from the sidecar in
+            #   sysdirs['CACHES'] (instead of a demux pass) if it exists.
+            rc_av.cache_keyframes(path, meta=meta)
+            if self.frameServer is not None:
+                self.frameServer.close()
+            self.frameServer = rc_av.FrameServer(path, meta=meta)
+            # ^ Takes the runtime data (the container) from meta.
+            self.container = self.frameServer.source.container
+            self.video_stream = self.frameServer.source.stream
+            self.showFrame(0)
         else:
             raise RuntimeError("Only PyAV is implemented (not pyav) but av is not detected/enabled.")
         return results
 
-    def showFrame(self, frame_number):
-        """Displays a specific frame of the video."""
-        # Seek to the desired frame
-        self.container.seek(frame_number, stream=self.video_stream)
-
-        # Decode the frame
-        for packet in self.container.demux(self.video_stream):
-            for frame in packet.decode():
-                # Display the decoded frame
-                self.current_frame = frame
-                img = frame.to_image()
-                # self.photo = ImageTk.PhotoImage(img)
-                # ^ Keep a reference to prevent garbage collection
-                self.showPhotoImage(self.photo)
-                # self.label.config(image=self.photo)
-                # self.label.image = self.photo
-                break
-            break
+    def showFrame(self, frame_number, direction=1):
+        """Displays a specific frame of the video.
+
+        Args:
+            frame_number (int): The frame to show (numbered using the
+                frame rate of the video stream).
+            direction (int, optional): The direction of playback or
+                stepping (1 or -1), so the following frames in that
+                direction can be decoded ahead of time.
+
+        Returns:
+            bool: False if frame_number is out of range.
+        """
+        img = self.frameServer.get(frame_number)
+        if img is None:
+            return False
+        self.frameNumber = frame_number
+        self.photo = ImageTk.PhotoImage(img)
+        # ^ Keep a reference to prevent garbage collection
+        self.showPhotoImage(self.photo)
+        self.after_idle(self.frameServer.prefetch, frame_number,
+                        direction)
+        return True
 
     def clearCanvas(self):
         self.canvas.delete("all")
@@ -313,12 +344,10 @@ class ProjectFrame(ttk.Frame):
     def showPhotoImage(self, photoimage):
         self.photo = photoimage
         self.clearCanvas()
+        if self.photo is None:
+            return
         self.image_instruction = \
             self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
-        raise NotImplementedError(
-            "self.image_instruction={}({})"
-            .format(type(self.image_instruction).__name__,
-                    self.image_instruction))
 
     def open(self, path, results_template=None):
         results = make_real(results_template)
@@ -17,8 +17,11 @@ if __name__ == "__main__":
 else:
     print("__name__={}".format(__name__))
 
-# from channeltinker import diff_images
-
+from channeltinker import (  # noqa: E402
+    diff_images,
+    ENABLE_NUMPY,
+    extend,
+)
 from channeltinkerpil import diff_images_by_path  # noqa: E402
 from channeltinkerpil.diffimage import diff_image_files_and_gen  # noqa: E402
 
@@ -104,6 +107,494 @@ class TestChanneltinkerpil(TestCase):
 
         print("All tests passed.")
 
+    @unittest.skipIf(not ENABLE_NUMPY, "numpy is not installed")
+    def test_diff_engines_match(self):
+        from PIL import Image
+        myDir = os.path.dirname(os.path.abspath(__file__))
+        dataPath = os.path.join(myDir, "data")
+        base = Image.open(os.path.join(dataPath, "test_diff_base.png"))
+        head = Image.open(os.path.join(dataPath, "test_diff_head.png"))
+        for this_head in (head, head.crop((0, 0, head.size[0] // 2,
+                                           head.size[1]))):
+            diff_size = (max(base.size[0], this_head.size[0]),
+                         max(base.size[1], this_head.size[1]))
+            for clear_in_stats in (False, True):
+                results = {}
+                diffs = {}
+                for engine in ("python", "numpy"):
+                    diffs[engine] = Image.new('RGBA', diff_size,
+                                              (0, 0, 0, 255))
+                    results[engine] = diff_images(
+                        base, this_head, diff_size, diff=diffs[engine],
+                        clear_in_stats=clear_in_stats, engine=engine,
+                    )
+                self.assertEqual(results['python']['same'],
+                                 results['numpy']['same'])
+                self.assertAlmostEqual(results['python']['mean_diff'],
+                                       results['numpy']['mean_diff'])
+                self.assertEqual(diffs['python'].tobytes(),
+                                 diffs['numpy'].tobytes())
+
+    @unittest.skipIf(not ENABLE_NUMPY, "numpy is not installed")
+    def test_extend_engines_match(self):
+        from PIL import Image
+        # Every opaque pixel is the same color, so which one is nearest
+        # doesn't change the result.
+        source = Image.new('RGBA', (40, 30), (90, 60, 30, 100))
+        for y in range(source.size[1]):
+            for x in range(source.size[0]):
+                source.putpixel((x, y), (x * 6, y * 8, 0, 1 + (x * y) % 200))
+        source.paste((200, 10, 30, 255), (12, 8, 25, 16))
+        for make_opaque in (False, True):
+            for enable_threshold in (False, True):
+                images = {}
+                for engine in ("python", "numpy"):
+                    images[engine] = source.copy()
+                    extend(images[engine], maximum=200,
+                           make_opaque=make_opaque,
+                           enable_threshold=enable_threshold,
+                           engine=engine)
+                self.assertEqual(images['python'].tobytes(),
+                                 images['numpy'].tobytes())
+
+    def test_region_access(self):
+        from PIL import Image
+        from channeltinker import BufferCTI, draw_square_from_center
+        from channeltinkerpil import PILCTI
+
+        class CountingCTI(PILCTI):
+            calls = 0
+
+            def getpixel(self, pos):
+                CountingCTI.calls += 1
+                return PILCTI.getpixel(self, pos)
+
+        source = Image.new('RGBA', (24, 16), (90, 60, 30, 100))
+        source.paste((200, 10, 30, 255), (4, 4, 9, 9))
+        expected = source.copy()
+        extend(expected, engine="python")
+        draw_square_from_center(expected, (12, 8), 2, color=(1, 2, 3, 255),
+                                filled=True)
+        for engine in ("python", "numpy"):
+            if (engine == "numpy") and not ENABLE_NUMPY:
+                continue
+            image = source.copy()
+            cti = CountingCTI(image)
+            extend(cti, engine=engine)
+            draw_square_from_center(cti, (12, 8), 2, color=(1, 2, 3, 255),
+                                    filled=True)
+            self.assertEqual(image.tobytes(), expected.tobytes())
+            self.assertEqual(CountingCTI.calls, 0)
+            # ^ Pixels should be read using getregion.
+        buffered = BufferCTI.from_cti(source)
+        self.assertEqual(buffered.getregion((2, 3, 7, 9)),
+                         source.crop((2, 3, 7, 9)).tobytes())
+
+    def test_tile_buffer(self):
+        from PIL import Image
+        from channeltinker import TileBufferCTI, draw_square_from_center
+        from channeltinkerpil import PILCTI
+
+        class CountingCTI(PILCTI):
+            written = []
+
+            def putregion(self, box, data):
+                CountingCTI.written.append(box)
+                PILCTI.putregion(self, box, data)
+
+        source = Image.new('RGBA', (50, 40), (200, 10, 30, 255))
+        source.paste((90, 60, 30, 100), (4, 4, 12, 12))
+        expected = source.copy()
+        extend(expected, engine="python")
+        draw_square_from_center(expected, (30, 30), 2, color=(1, 2, 3, 255))
+        image = source.copy()
+        cti = TileBufferCTI(CountingCTI(image), tile_size=16)
+        extend(cti, engine="python")
+        draw_square_from_center(cti, (30, 30), 2, color=(1, 2, 3, 255))
+        self.assertEqual(cti.getregion((0, 0, 50, 40)), expected.tobytes())
+        self.assertEqual(image.tobytes(), source.tobytes())
+        # ^ Nothing is written until flush.
+        self.assertEqual(cti.flush(), (0, 0, 48, 40))
+        # ^ The square touches the tiles right of and below x=32, y=32
+        #   but not the column of tiles after x=48.
+        self.assertEqual(image.tobytes(), expected.tobytes())
+        self.assertEqual(len(CountingCTI.written), 3)
+        # ^ One for each row of tiles.
+        del CountingCTI.written[:]
+        cti.putpixel((20, 20), (1, 2, 3, 255))
+        self.assertEqual(cti.flush(), (16, 16, 32, 32))
+        self.assertEqual(CountingCTI.written, [(16, 16, 32, 32)])
+
+    def test_throttled_progress(self):
+        from PIL import Image
+        from channeltinker import (
+            ChannelTinkerProgressInterface,
+            OperationCanceled,
+            ThrottledProgress,
+        )
+        from channeltinkerpil import PILCTI
+
+        class ListProgress(ChannelTinkerProgressInterface):
+            def __init__(self, cancel_after=None):
+                self.factors = []
+                self.cancel_after = cancel_after
+
+            def progress_update(self, factor):
+                self.factors.append(factor)
+
+            def is_canceled(self):
+                return ((self.cancel_after is not None)
+                        and (len(self.factors) >= self.cancel_after))
+
+        shown = ListProgress()
+        progress = ThrottledProgress(shown, min_interval=0, min_step=0.25)
+        for i in range(101):
+            progress.progress_update(i / 100.0)
+        self.assertEqual(shown.factors, [0.0, 0.25, 0.5, 0.75, 1.0])
+
+        source = Image.new('RGBA', (20, 20), (200, 10, 30, 255))
+        source.paste((90, 60, 30, 100), (4, 4, 16, 16))
+        cti = PILCTI(source.copy())
+        progress = ThrottledProgress(ListProgress(cancel_after=1),
+                                     min_interval=0)
+        with self.assertRaises(OperationCanceled):
+            extend(cti, engine="python", ctpi=progress)
+        self.assertEqual(cti.image.tobytes(), source.tobytes())
+        # ^ A canceled extend doesn't write to images with regions.
+
+    def test_draw_spans(self):
+        import math
+        from PIL import Image
+        from channeltinker import (
+            draw_circle_from_center,
+            draw_square_from_center,
+        )
+        size = (23, 17)
+        for center in ((11, 8), (2.5, 15), (30, -3)):
+            for rad in (0, 3, 9):
+                square = Image.new('L', size, 0)
+                circle = Image.new('L', size, 0)
+                draw_square_from_center(square, center, rad, color=255,
+                                        filled=True)
+                draw_circle_from_center(circle, center, rad, color=255,
+                                        filled=True)
+                for y in range(size[1]):
+                    for x in range(size[0]):
+                        dx = x - center[0]
+                        dy = y - center[1]
+                        self.assertEqual(
+                            square.getpixel((x, y)),
+                            255 if max(abs(dx), abs(dy)) <= rad else 0
+                        )
+                        self.assertEqual(
+                            circle.getpixel((x, y)),
+                            255 if math.hypot(dx, dy) <= rad else 0
+                        )
+        smooth = Image.new('L', size, 0)
+        draw_circle_from_center(smooth, (11.3, 8), 6, color=255,
+                                filled=True, antialias=True)
+        values = set(smooth.tobytes())
+        self.assertIn(255, values)
+        self.assertTrue(len(values - set([0, 255])) > 0)
+        # ^ Edges should be partly covered.
+
+    def test_diff_images_by_path_quick(self):
+        import shutil
+        import tempfile
+        from PIL import Image
+        myDir = os.path.dirname(os.path.abspath(__file__))
+        dataPath = os.path.join(myDir, "data")
+        basePath = os.path.join(dataPath, "test_diff_base.png")
+        headPath = os.path.join(dataPath, "test_diff_head.png")
+        tmpDir = tempfile.mkdtemp()
+        try:
+            copyPath = os.path.join(tmpDir, "copy.png")
+            shutil.copyfile(basePath, copyPath)
+            diff = diff_images_by_path(basePath, copyPath)
+            self.assertIs(diff['same'], True)
+            self.assertEqual(diff['mean_diff'], 0.0)
+            self.assertEqual(diff['checked_by'], "file_sha256")
+
+            # Same pixels in a different encoding:
+            recodedPath = os.path.join(tmpDir, "recoded.png")
+            Image.open(basePath).save(recodedPath, compress_level=0)
+            diff = diff_images_by_path(basePath, recodedPath)
+            self.assertIs(diff['same'], True)
+            self.assertEqual(diff['checked_by'], "pixel_sha256")
+            full = diff_images_by_path(basePath, recodedPath, quick=False)
+            self.assertEqual(sorted(diff.keys()), sorted(full.keys()))
+            self.assertEqual(diff['diff_image'].size, full['diff_image'].size)
+
+            # Identical and fully transparent:
+            clearPath = os.path.join(tmpDir, "clear.png")
+            clearCopyPath = os.path.join(tmpDir, "clear-copy.png")
+            Image.new('RGBA', (3, 2), (0, 0, 0, 0)).save(clearPath)
+            shutil.copyfile(clearPath, clearCopyPath)
+            for quick in (True, False):
+                diff = diff_images_by_path(clearPath, clearCopyPath,
+                                           quick=quick)
+                self.assertEqual(diff.get('error'),
+                                 "WARNING: There were no pixels.")
+                self.assertNotIn('mean_diff', diff)
+
+            quick = diff_images_by_path(basePath, headPath, same_only=True)
+            full = diff_images_by_path(basePath, headPath, quick=False)
+            self.assertIs(quick['same'], False)
+            self.assertEqual(quick['same'], full['same'])
+            self.assertEqual(quick['base']['ratio'], full['base']['ratio'])
+            self.assertEqual(quick['head']['ratio'], full['head']['ratio'])
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def test_appearance_index(self):
+        import shutil
+        import tempfile
+        from PIL import Image
+        from channeltinkerpil.appearanceindex import AppearanceIndex
+        myDir = os.path.dirname(os.path.abspath(__file__))
+        dataPath = os.path.join(myDir, "data")
+        tmpDir = tempfile.mkdtemp()
+        try:
+            for name in ("test_diff_base.png", "test_diff_head.png"):
+                shutil.copy(os.path.join(dataPath, name), tmpDir)
+            with AppearanceIndex(":memory:") as index:
+                counts = index.update(tmpDir)
+                self.assertEqual(counts['added'], 2)
+                counts = index.update(tmpDir)
+                self.assertEqual(counts['unchanged'], 2)
+                os.remove(os.path.join(tmpDir, "test_diff_head.png"))
+                counts = index.update(tmpDir)
+                self.assertEqual(counts['removed'], 1)
+                self.assertEqual(len(index), 1)
+                base = Image.open(os.path.join(dataPath,
+                                               "test_diff_base.png"))
+                results = index.query(base, limit=1)
+                self.assertEqual(os.path.basename(results[0]['path']),
+                                 "test_diff_base.png")
+                self.assertEqual(results[0]['mean_diff'], 0.0)
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def test_find_parallel(self):
+        from channeltinkerpil.findbyappearance import (
+            findVisuallySimilarParallel,
+        )
+        myDir = os.path.dirname(os.path.abspath(__file__))
+        dataPath = os.path.join(myDir, "data")
+        basePath = os.path.join(dataPath, "test_diff_base.png")
+        serial = findVisuallySimilarParallel(basePath, dataPath, limit=2,
+                                             jobs=1)
+        parallel = findVisuallySimilarParallel(basePath, dataPath,
+                                               limit=2, jobs=2,
+                                               chunk_size=1)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(serial), 2)
+        self.assertEqual(serial[0], {'mean_diff': 0.0, 'path': basePath})
+
+    def test_diff_prune(self):
+        from PIL import Image
+        sizes = {"python": (300, 300)}
+        if ENABLE_NUMPY:
+            sizes["numpy"] = (1024, 1024)
+            # ^ big enough for more than one band (See diff_arrays)
+        for engine, size in sizes.items():
+            base = Image.new('RGBA', size, (0, 0, 0, 255))
+            head = Image.new('RGBA', size, (255, 255, 255, 255))
+            results = diff_images(base, head, base.size, engine=engine,
+                                  max_mean_diff=0.5)
+            self.assertTrue(results.get('pruned'))
+            self.assertNotIn('mean_diff', results)
+            self.assertGreater(results['mean_diff_min'], 0.5)
+            results = diff_images(base, head, base.size, engine=engine,
+                                  max_mean_diff=1.0)
+            self.assertFalse(results.get('pruned'))
+            self.assertEqual(results['mean_diff'], 0.75)
+
+    def test_diff_pyramid(self):
+        from PIL import Image
+        base = Image.new('RGBA', (256, 256), (0, 0, 0, 255))
+        head = base.copy()
+        head.paste((255, 255, 255, 255), (0, 0, 128, 256))
+        results = diff_images(base, head, base.size, pyramid_threshold=0.1)
+        self.assertIs(results['same'], False)
+        self.assertGreater(results['pyramid_level'], 0)
+        self.assertAlmostEqual(results['mean_diff'], 0.375)
+        self.assertEqual(results['head']['size'], head.size)
+
+        head = base.copy()
+        head.putpixel((3, 3), (255, 255, 255, 255))
+        full = diff_images(base, head, base.size)
+        results = diff_images(base, head, base.size, pyramid_threshold=0.1)
+        self.assertEqual(results['pyramid_level'], 0)
+        self.assertEqual(results['mean_diff'], full['mean_diff'])
+
+    @unittest.skipIf(not ENABLE_NUMPY, "numpy is not installed")
+    def test_diff_tiled(self):
+        import shutil
+        import tempfile
+        from PIL import Image
+        from channeltinkerpil import gen_diff_image, gen_diff_image_tiled
+        myDir = os.path.dirname(os.path.abspath(__file__))
+        dataPath = os.path.join(myDir, "data")
+        base = Image.open(os.path.join(dataPath, "test_diff_base.png"))
+        head = Image.open(os.path.join(dataPath, "test_diff_head.png"))
+        head = head.crop((0, 0, head.size[0] - 3, head.size[1] + 2))
+        tmpDir = tempfile.mkdtemp()
+        try:
+            fullPath = os.path.join(tmpDir, "full.png")
+            tiledPath = os.path.join(tmpDir, "tiled.png")
+            full = gen_diff_image(base, head, diff_path=fullPath)
+            tiled = gen_diff_image_tiled(base, head, diff_path=tiledPath,
+                                         tile_height=3)
+            self.assertEqual(full['same'], tiled['same'])
+            self.assertAlmostEqual(full['mean_diff'], tiled['mean_diff'])
+            fullDiff = Image.open(fullPath)
+            tiledDiff = Image.open(tiledPath)
+            self.assertEqual(fullDiff.size, tiledDiff.size)
+            self.assertEqual(fullDiff.convert('RGBA').tobytes(),
+                             tiledDiff.convert('RGBA').tobytes())
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def test_batch_report(self):
+        import json
+        import shutil
+        import tempfile
+        from PIL import Image
+        from channeltinkerpil.diffimagesratio import (
+            iter_batch_results,
+            write_report,
+        )
+        tmpDir = tempfile.mkdtemp()
+        try:
+            baseRoot = os.path.join(tmpDir, "base")
+            headRoot = os.path.join(tmpDir, "head")
+            os.makedirs(baseRoot)
+            os.makedirs(headRoot)
+            Image.new('RGB', (10, 10)).save(os.path.join(baseRoot, "a.png"))
+            Image.new('RGB', (20, 10)).save(os.path.join(headRoot, "a.png"))
+            Image.new('RGB', (10, 10)).save(os.path.join(headRoot, "b.png"))
+            reportPath = os.path.join(tmpDir, "report.ndjson")
+            with open(reportPath, 'w') as stream:
+                counts = write_report(
+                    iter_batch_results(baseRoot, headRoot, pixels=True),
+                    stream,
+                )
+            self.assertEqual(counts, {'wider': 1, 'new': 1})
+            with open(reportPath, 'r') as stream:
+                records = [json.loads(line) for line in stream]
+            byPath = {record['path']: record for record in records}
+            self.assertEqual(byPath['a.png']['status'], "wider")
+            self.assertIs(byPath['a.png']['same'], False)
+            self.assertEqual(byPath['b.png']['status'], "new")
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def test_batch_streaming(self):
+        import shutil
+        import tempfile
+        from PIL import Image
+        from channeltinkerpil import diffimagesratio
+        tmpDir = tempfile.mkdtemp()
+        compare_image_pair = diffimagesratio.compare_image_pair
+        calls = []
+
+        def counted(*args, **kwargs):
+            calls.append(args)
+            return compare_image_pair(*args, **kwargs)
+
+        diffimagesratio.compare_image_pair = counted
+        try:
+            baseRoot = os.path.join(tmpDir, "base")
+            headRoot = os.path.join(tmpDir, "head")
+            os.makedirs(baseRoot)
+            os.makedirs(headRoot)
+            for i in range(5):
+                name = "{}.png".format(i)
+                Image.new('RGB', (10, 10)).save(os.path.join(baseRoot, name))
+                Image.new('RGB', (20, 10)).save(os.path.join(headRoot, name))
+            for jobs in (1, 2):
+                del calls[:]
+                records = diffimagesratio.iter_batch_results(
+                    baseRoot, headRoot, jobs=jobs)
+                self.assertEqual(next(records)['status'], "wider")
+                self.assertEqual(len(calls), 1)
+                # ^ The first record arrives before the walk finishes.
+                self.assertEqual(len(list(records)), 4)
+        finally:
+            diffimagesratio.compare_image_pair = compare_image_pair
+            shutil.rmtree(tmpDir)
+
+    def test_read_image_size(self):
+        import shutil
+        import tempfile
+        from PIL import Image
+        from channeltinker.ctsize import read_image_size, SizeCache
+        tmpDir = tempfile.mkdtemp()
+        try:
+            image = Image.new('RGB', (37, 21), (10, 20, 30))
+            for ext in ("png", "jpg", "gif", "bmp"):
+                path = os.path.join(tmpDir, "size." + ext)
+                image.save(path)
+                self.assertEqual(read_image_size(path), (37, 21))
+            cachePath = os.path.join(tmpDir, "sizes.json")
+            cache = SizeCache(path=cachePath)
+            self.assertEqual(cache.get_size(path), (37, 21))
+            cache.save()
+            self.assertEqual(len(SizeCache(path=cachePath)), 1)
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def test_decode_cache(self):
+        import shutil
+        import tempfile
+        from PIL import Image
+        from channeltinkerpil.decodecache import DecodeCache
+        tmpDir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for i in range(3):
+                path = os.path.join(tmpDir, "{}.png".format(i))
+                Image.new('RGBA', (10, 10), (i, 0, 0, 255)).save(path)
+                paths.append(path)
+            spillDir = os.path.join(tmpDir, "spill")
+            cache = DecodeCache(max_bytes=10*10*4*2, spill_dir=spillDir)
+            for path in paths:
+                cache.get(path)
+            self.assertEqual(cache.misses, 3)
+            self.assertEqual(len(cache), 2)
+            self.assertEqual(cache.get(paths[2]).getpixel((0, 0)),
+                             (2, 0, 0, 255))
+            self.assertEqual(cache.hits, 1)
+            # The first image was spilled, so it isn't decoded again:
+            self.assertEqual(cache.get(paths[0]).getpixel((0, 0)),
+                             (0, 0, 0, 255))
+            self.assertEqual(cache.misses, 3)
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def test_find_similar(self):
+        from channeltinkerpil.findbyappearance import (
+            find_similar,
+            SimilarResults,
+        )
+        results = SimilarResults(limit=2)
+        for mean_diff, path in ((0.5, "a"), (0.1, "b"), (0.9, "c"),
+                                (0.2, "d")):
+            results.push(mean_diff, path)
+        self.assertEqual([result['path'] for result in results],
+                         ["b", "d"])
+        self.assertEqual(results.threshold, 0.2)
+
+        myDir = os.path.dirname(os.path.abspath(__file__))
+        dataPath = os.path.join(myDir, "data")
+        basePath = os.path.join(dataPath, "test_diff_base.png")
+        for limit in (1, 3):
+            pruned = find_similar(basePath, dataPath, limit=limit)
+            full = find_similar(basePath, dataPath, limit=limit,
+                                prune=False)
+            self.assertEqual(pruned.to_list(), full.to_list())
+
     def test_pil_compatible_png(self):
         """Test PIL-incompatible PNG files.
         (See issue #14)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+import random
+import unittest
+
+ENABLE_PIL = False
+try:
+    from PIL import Image
+    ENABLE_PIL = True
+except ImportError:
+    pass
+
+from rotocanvas.pythonpixels import (  # noqa: E402
+    ENABLE_NUMPY,
+    PPBrushCache,
+    PPDirtyRects,
+    PPImage,
+    PPRect,
+    PPStroke,
+    convert_rows,
+    range_copy_with_bo,
+)
+
+
+def random_image(size, byteDepth, numpy_enable, seed):
+    rand = random.Random(seed)
+    image = PPImage(size, byteDepth=byteDepth)
+    image.numpy_enable = numpy_enable
+    image.data[:] = bytearray(rand.randrange(256)
+                              for _ in range(image.byteCount))
+    return image
+
+
+class PythonPixelsTest(unittest.TestCase):
+    @unittest.skipIf(not ENABLE_NUMPY, "NumPy is not installed")
+    def test_numpy_matches_python(self):
+        results = []
+        for numpy_enable in (False, True):
+            dst = random_image((13, 9), 4, numpy_enable, 1)
+            src = random_image((6, 5), 4, numpy_enable, 2)
+            src.data[3::8] = bytearray(len(src.data[3::8]))
+            # ^ Make every other pixel transparent.
+            rgb = random_image((6, 5), 3, numpy_enable, 3)
+            self.assertEqual(dst.get_array() is not None, numpy_enable)
+            dst._blit(src, (2, 3))
+            dst._blit(src, PPRect(7, 1, 4, 4), area=PPRect(1, 1, 4, 4),
+                      alpha_flags=PPImage.BLEND_ADD)
+            dst._blit(rgb, (0, 0), alpha_flags=0)
+            dst.draw_line_ivec3_h((-2, 4), (10, 20, 30), 8)
+            dst.draw_line_ivec3_v((12, 6), (40, 50, 60), 8)
+            range_copy_with_bo(dst, 4 * 13, 4 * 18, src, 0, 4 * 5)
+            flipped = dst.copy_flipped_v()
+            maximums = (dst.getMaxAlphaValue(),
+                        dst.getMaxChannelValueNotIncludingAlpha())
+            results.append((bytes(dst.data), bytes(flipped.data),
+                            maximums))
+            dst.fill_icolor(1, 2, 3, 4)
+            self.assertEqual(dst.get_at((5, 5)), bytearray([1, 2, 3, 4]))
+        self.assertEqual(results[0], results[1])
+
+    def test_blit_blend_modes(self):
+        dst = PPImage((4, 3))
+        dst.numpy_enable = False
+        dst.fill_icolor(100, 100, 100, 200)
+        src = PPImage((2, 2))
+        src.fill_icolor(200, 50, 0, 100)
+        rect = dst.blit(src, (3, -1), alpha_flags=PPImage.BLEND_ADD)
+        self.assertEqual((rect.left, rect.top, rect.width, rect.height),
+                         (3, 0, 1, 1))
+        self.assertEqual(dst.get_at((3, 0)), bytearray([139, 80, 61, 255]))
+        self.assertEqual(dst.get_at((2, 0)), bytearray([100, 100, 100, 200]))
+        modes = [0, PPImage.BLEND_SUB, PPImage.BLEND_RGBA_MULT,
+                 PPImage.BLEND_RGBA_MAX, PPImage.BLEND_PREMULTIPLIED]
+        results = {}
+        for numpy_enable in (False, True):
+            if numpy_enable and not ENABLE_NUMPY:
+                continue
+            for special_flags in modes:
+                dst = random_image((7, 6), 4, numpy_enable, 4)
+                src = random_image((5, 5), 4, numpy_enable, 5)
+                dst.blit(src, (3, 2), special_flags=special_flags,
+                         integer_math=True)
+                key = (numpy_enable, special_flags)
+                results[key] = bytes(dst.data)
+        dst = PPImage((1, 1))
+        dst.fill_icolor(10, 200, 255, 128)
+        src.fill_icolor(20, 100, 255, 255)
+        dst.blit(src, (0, 0), special_flags=PPImage.BLEND_RGB_ADD)
+        self.assertEqual(dst.get_at((0, 0)), bytearray([30, 255, 255, 128]))
+        dst.blit(src, (0, 0), special_flags=PPImage.BLEND_RGBA_MULT)
+        self.assertEqual(dst.get_at((0, 0)), bytearray([3, 100, 255, 128]))
+        if ENABLE_NUMPY:
+            for special_flags in modes:
+                self.assertEqual(results[(False, special_flags)],
+                                 results[(True, special_flags)])
+
+    def test_dirty_rects(self):
+        dirty = PPDirtyRects(max_count=3)
+        dirty.add(PPRect(0, 0, 10, 10))
+        dirty.add(PPRect(2, 1, 10, 10))  # overlaps, so it is merged
+        dirty.add(PPRect(50, 50, 4, 4))
+        dirty.add(PPRect(0, 0, 0, 5))  # empty, so it is ignored
+        rects = [(r.left, r.top, r.width, r.height)
+                 for r in dirty.pop_all()]
+        self.assertEqual(sorted(rects), [(0, 0, 12, 11), (50, 50, 4, 4)])
+        self.assertEqual(len(dirty), 0)
+        for i in range(4):
+            dirty.add(PPRect(i * 20, 0, 2, 2))
+        rects = [(r.left, r.top, r.width, r.height)
+                 for r in dirty.pop_all()]
+        self.assertEqual(rects, [(0, 0, 62, 2)])
+        for numpy_enable in (False, True):
+            image = random_image((5, 4), 4, numpy_enable, 6)
+            area = image.get_bytes(PPRect(1, 2, 3, 2))
+            self.assertEqual(area, bytes(image.data[44:56]
+                                         + image.data[64:76]))
+
+    def test_stroke_stamp(self):
+        stroke = PPStroke(spacing=2.0)
+        self.assertEqual(stroke.begin(0, 0), [(0, 0)])
+        self.assertEqual(stroke.move_to(3, 0), [(2.0, 0.0)])
+        self.assertEqual(stroke.move_to(3, 0.5), [])
+        self.assertEqual(stroke.move_to(3, 4), [(3.0, 1.0), (3.0, 3.0)])
+        results = []
+        for numpy_enable in (False, True):
+            image = random_image((9, 8), 4, numpy_enable, 7)
+            brush = random_image((3, 3), 4, numpy_enable, 8)
+            brush = brush.get_tinted((1.0, 0.5, 0.25)).get_premultiplied()
+            for i in range(0, brush.byteCount, 4):
+                self.assertTrue(max(brush.data[i:i+3]) <= brush.data[i+3])
+            rect = image.stamp(brush, [(0, 0), (1.5, 1), (7.9, 6)])
+            self.assertEqual((rect.left, rect.top, rect.width, rect.height),
+                             (0, 0, 9, 8))
+            results.append(bytes(image.data))
+        self.assertEqual(results[0], results[1])
+        image = PPImage((2, 1))
+        image.fill_icolor(0, 0, 200, 100)
+        brush = PPImage((1, 1))
+        brush.fill_icolor(255, 255, 255, 51)
+        brush = brush.get_premultiplied()
+        rect = image.stamp(brush, [(1, 0), (1, 0), (5, 5)])
+        self.assertEqual((rect.left, rect.top, rect.width, rect.height),
+                         (1, 0, 1, 1))
+        self.assertEqual(image.get_at((0, 0)), bytearray([0, 0, 200, 100]))
+        self.assertEqual(image.get_at((1, 0)), bytearray([92, 92, 220, 202]))
+
+    def test_brush_cache(self):
+        original = random_image((4, 4), 4, ENABLE_NUMPY, 9)
+        cache = PPBrushCache(max_bytes=4 * 4 * 4 * 2 * 2)
+        red = cache.get("brush.png", original, (0.0, 0.0, 1.0))
+        self.assertIs(cache.get("brush.png", original, (0, 0, 1, 1)), red)
+        small = cache.get("brush.png", original, (0, 0, 1), scale=0.5)
+        self.assertEqual(small[0].size, (2, 2))
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 2, 2))
+        # ^ Both fit since the small one is a quarter of the size.
+        cache.get("brush.png", original, (1, 1, 1))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNot(cache.get("brush.png", original, (0, 0, 1)), red)
+        # ^ The least recently used one (red) was discarded.
+        cache.discard("brush.png")
+        self.assertEqual((len(cache), cache.used_bytes), (0, 0))
+        for numpy_enable in (False, True):
+            image = random_image((5, 3), 4, numpy_enable, 10)
+            scaled = image.get_scaled(2.0)
+            self.assertEqual(scaled.size, (10, 6))
+            self.assertEqual(scaled.get_at((9, 5)), image.get_at((4, 2)))
+            self.assertEqual(scaled.get_at((2, 1)), image.get_at((1, 0)))
+
+    @unittest.skipIf(not ENABLE_PIL, "PIL is not installed")
+    def test_init_from_pil(self):
+        source = Image.new('RGBA', (3, 2), (10, 20, 30, 40))
+        source.putpixel((2, 0), (1, 2, 3, 4))
+        image = PPImage((1, 1))
+        image.init_from_pil(source)
+        self.assertEqual(image.size, (3, 2))
+        self.assertEqual(image.data[8:12], bytearray([1, 2, 3, 4]))
+        self.assertEqual(image.data[:4], bytearray([10, 20, 30, 40]))
+        # ^ R, G, B, A like the other loaders and the 'rgba' upload
+        image = PPImage((1, 1), byteDepth=3)
+        image.init_from_pil(source)
+        self.assertEqual(image.data[6:9], bytearray([1, 2, 3]))
+
+    def test_convert_channels(self):
+        rgb = bytearray([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12])
+        bgra = bytearray(12)
+        convert_rows(bgra, 8, 4, (0, 1, 2, 3), rgb, 9, 3, (2, 1, 0, None),
+                     (2, 1), src_start=3)
+        self.assertEqual(bgra[:8], bytearray([6, 5, 4, 255, 9, 8, 7, 255]))
+        image = PPImage((3, 2))
+        gray = bytearray([10, 20, 30, 40])
+        image.blit_copy_with_bo(gray, 2, 1, (2, 2), None, None, None, 0)
+        self.assertEqual(image.data, bytearray([10] * 4 + [20] * 4 + [0] * 4
+                                               + [30] * 4 + [40] * 4
+                                               + [0] * 4))
+        small = PPImage((2, 1))
+        small.blit_copy_with_bo(image.data, image.stride, 4, image.size,
+                                2, 1, 0, 3)
+        self.assertEqual(small.data, image.data[:8])
+        flipped = image.copy_flipped_v()
+        self.assertEqual(flipped.data, image.data[12:] + image.data[:12])
+
+
+if __name__ == "__main__":
+    print("Error: You must run this from the repo directory via:")
+    print("python3 -m nose")
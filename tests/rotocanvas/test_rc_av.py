@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+
+from fractions import Fraction
+
+ENABLE_AV = False
+try:
+    import av
+    import numpy as np
+    from rotocanvas import rc_av
+    ENABLE_AV = True
+except ImportError:
+    pass
+
+COMMON_TIMING = [
+    # (time_base, rate)
+    (Fraction(1, 1000), Fraction(30000, 1001)),  # typical MKV
+    (Fraction(1, 1000), Fraction(60000, 1001)),
+    (Fraction(1, 1000), Fraction(25)),
+    (Fraction(1, 90000), Fraction(30000, 1001)),  # MPEG-TS
+    (Fraction(1, 15360), Fraction(30)),  # MP4 from ffmpeg
+    (Fraction(1, 30000), Fraction(30000, 1001)),
+    (Fraction(1001, 24000), Fraction(24000, 1001)),
+]
+
+
+def make_clip(path, count, rate=Fraction(30000, 1001)):
+    """Encode a tiny clip where frame i is gray level i * 20."""
+    with av.open(path, 'w') as container:
+        codec = 'libx264'
+        if codec not in av.codecs_available:
+            codec = 'mpeg4'
+        stream = container.add_stream(codec, rate=rate)
+        stream.width = 16
+        stream.height = 16
+        stream.pix_fmt = 'yuv420p'
+        stream.codec_context.gop_size = 4
+        for i in range(count):
+            pixels = np.full((16, 16, 3), i * 20, dtype=np.uint8)
+            frame = av.VideoFrame.from_ndarray(pixels, format='rgb24')
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+def gray_number(frame):
+    # Get i from a frame of make_clip.
+    return int(round(frame.to_ndarray(format='rgb24').mean() / 20.0))
+
+
+@unittest.skipIf(not ENABLE_AV, "PyAV is not installed")
+class RCAVTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.oldIndexDir = rc_av.INDEX_DIR
+        rc_av.INDEX_DIR = os.path.join(self.tmpDir, "keyframes")
+
+    def tearDown(self):
+        rc_av.INDEX_DIR = self.oldIndexDir
+        shutil.rmtree(self.tmpDir)
+
+    def test_frame_pts_round_trip(self):
+        clipPath = os.path.join(self.tmpDir, "clip.mkv")
+        make_clip(clipPath, 2)
+        with rc_av.FrameSource(clipPath) as source:
+            for time_base, rate in COMMON_TIMING:
+                source.time_base = time_base
+                source.rate = rate
+                for start_pts in (0, 1234):
+                    source.start_pts = start_pts
+                    for number in range(2000):
+                        pts = source.frame_to_pts(number)
+                        self.assertEqual(source.pts_to_frame(pts), number,
+                                         (time_base, rate, start_pts))
+
+    def test_frame_source(self):
+        count = 12
+        clipPath = os.path.join(self.tmpDir, "clip.mkv")
+        make_clip(clipPath, count)
+        with rc_av.FrameSource(clipPath) as source:
+            self.assertEqual(source.time_base, Fraction(1, 1000))
+            numbers = [count - 1, 3, 1, 3, 7]
+            got = [(number, gray_number(frame))
+                   for number, frame in source.frames(numbers + [count])]
+            # ^ Frames past the end are skipped.
+            self.assertEqual(got, [(1, 1), (3, 3), (7, 7),
+                                   (count - 1, count - 1)])
+            self.assertTrue(source.decoded <= count + 4)
+            # ^ One pass (at most a GOP more if it seeks ahead)
+            self.assertEqual(gray_number(source.get_frame(2)), 2)
+            # ^ Going backward seeks.
+            self.assertEqual(gray_number(source.get_frame(6)), 6)
+            seeks = source.seeks
+            self.assertEqual(gray_number(source.get_frame(6)), 6)
+            self.assertEqual(source.seeks, seeks)
+            # ^ The same frame again doesn't seek (the one after it
+            #   was already decoded).
+            self.assertEqual(gray_number(source.get_frame(count - 1)),
+                             count - 1)
+            self.assertIsNone(source.get_frame(count))
+
+    def test_index_sidecar(self):
+        meta = {
+            'iframe_offsets': [48, None, 2**40],
+            'iframe_dts': [-1024, 0, 7],
+            'iframe_pts': [0, 1024, None],
+        }
+        rc_av.save_index("a" * 64, 1000, 12.5, meta)
+        self.assertEqual(rc_av.load_index("a" * 64, 1000, 12.5), meta)
+        # ^ None is stored as a sentinel and comes back as None.
+        self.assertIsNone(rc_av.load_index("a" * 64, 1001, 12.5))
+        self.assertIsNone(rc_av.load_index("a" * 64, 1000, 13.0))
+        # ^ A changed size or mtime means the video changed.
+        self.assertIsNone(rc_av.load_index("b" * 64, 1000, 12.5))
+        with open(rc_av.index_path("a" * 64), 'r+b') as stream:
+            stream.truncate(os.path.getsize(stream.name) - 8)
+        self.assertIsNone(rc_av.load_index("a" * 64, 1000, 12.5))
+
+        clipPath = os.path.join(self.tmpDir, "clip.mkv")
+        make_clip(clipPath, 9)
+        progress = []
+        first = rc_av.analyze_video(clipPath, progress.append)
+        first.pop('container').close()
+        self.assertIs(first['index_cached'], False)
+        self.assertEqual(progress[-1], {'ratio': 1.0})
+        second = rc_av.analyze_video(clipPath, progress.append)
+        second.pop('container').close()
+        self.assertIs(second['index_cached'], True)
+        for key in ('iframe_offsets', 'iframe_dts', 'iframe_pts'):
+            self.assertEqual(second[key], first[key])
+        self.assertEqual(first['iframe_pts'][0], 0)
+        stat = os.stat(clipPath)
+        os.utime(clipPath, (stat.st_atime, stat.st_mtime + 10))
+        third = rc_av.analyze_video(clipPath, progress.append)
+        third.pop('container').close()
+        self.assertIs(third['index_cached'], False)
+
+    def test_frame_server(self):
+        count = 12
+        clipPath = os.path.join(self.tmpDir, "clip.mkv")
+        make_clip(clipPath, count)
+        # ^ 30000/1001 fps with a 1/1000 time_base, so half of the pts
+        #   values would truncate to the previous frame number.
+        frameBytes = 16 * 16 * 3
+        server = rc_av.FrameServer(clipPath, max_bytes=frameBytes * 3,
+                                   read_ahead=2)
+        try:
+            order = (list(range(count)) + list(range(count - 1, -1, -1))
+                     + [5, 6, 5, 4, 9, 8, 7])
+            for number in order:
+                image = server.get(number)
+                self.assertEqual(
+                    int(round(np.asarray(image).mean() / 20.0)), number
+                )
+                server.prefetch(number, 1 if number % 2 else -1)
+                for key, cached in server._images.items():
+                    self.assertEqual(
+                        int(round(np.asarray(cached).mean() / 20.0)), key
+                    )
+                    # ^ Every frame is cached under its own number.
+                self.assertEqual(server.used_bytes,
+                                 len(server) * frameBytes)
+                self.assertTrue(server.used_bytes <= server.max_bytes)
+            self.assertTrue(server.hits > 0)
+            self.assertIsNone(server.get(count))
+            self.assertIsNone(server.get(-1))
+        finally:
+            server.close()
+        self.assertEqual((len(server), server.used_bytes), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()